@@ -1,4 +1,5 @@
 import os
+import sys
 from pprint import pprint as pp
 
 import httpx
@@ -19,5 +20,22 @@ def send_test_webhook():
     # pp(response.json())
 
 
+def send_test_webhooks(count: int):
+    """Send `count` test webhooks with a single request to the batch endpoint"""
+    url = "http://localhost:4672/webhook/internal/batch/"
+    response = httpx.post(
+        url,
+        json=[{"event": f"test webhook {i}"} for i in range(count)],
+        headers={"Authorization": INTERNAL_WEBHOOK_TOKEN},
+    )
+
+    print(response)
+    print(response.content)
+    # pp(response.json())
+
+
 if __name__ == "__main__":
-    send_test_webhook()
+    if len(sys.argv) > 1:
+        send_test_webhooks(int(sys.argv[1]))
+    else:
+        send_test_webhook()
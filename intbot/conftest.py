@@ -1,9 +1,14 @@
 import contextlib
 import json
+from collections.abc import Sequence
+from datetime import datetime
 from unittest import mock
 
 import pytest
+from core.endpoints.webhooks import recent_webhooks
+from core.models import PretalxData, PretixData
 from django.conf import settings
+from django.core.cache import cache
 from django.db import connections
 
 
@@ -22,6 +27,93 @@ def github_data():
     }
 
 
+@pytest.fixture(autouse=True)
+def clear_recent_webhooks():
+    """
+    Dedup keys cached in memory would outlive webhooks rolled back at the
+    end of every test.
+    """
+    recent_webhooks.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    Tests use the in-memory cache, which would otherwise be shared between
+    them.
+    """
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def snapshots_dir(settings, tmp_path):
+    """Keep Parquet snapshots written in tests away from the real ones"""
+    settings.SNAPSHOTS_DIR = tmp_path / "snapshots"
+    return settings.SNAPSHOTS_DIR
+
+
+@pytest.fixture
+def create_submissions(db):
+    """Saves a download of submissions, one for each of the given states"""
+
+    def create(states: Sequence[str] = ("submitted",)) -> PretalxData:
+        return PretalxData.objects.create(
+            resource=PretalxData.PretalxResources.submissions,
+            content=[
+                {
+                    "code": f"S{i}",
+                    "state": state,
+                    "title": "Title",
+                    "track": None,
+                    "created": "2025-01-14T01:24:36",
+                    "abstract": "Abstract",
+                    "duration": 30,
+                    "submission_type": "Talk",
+                }
+                for i, state in enumerate(states)
+            ],
+        )
+
+    return create
+
+
+@pytest.fixture
+def create_products(db):
+    """Saves a download of products of the event"""
+
+    def create(content: list[dict] | None, event: str = "ep2025") -> PretixData:
+        return PretixData.objects.create(
+            event=event,
+            resource=PretixData.PretixResources.products,
+            content=content,
+        )
+
+    return create
+
+
+@pytest.fixture
+def create_orders(db):
+    """Saves a download of orders of the event, made at `created_at`"""
+
+    def create(
+        content: list[dict] | None,
+        created_at: datetime | None = None,
+        event: str = "ep2025",
+    ) -> PretixData:
+        pretix_data = PretixData.objects.create(
+            event=event,
+            resource=PretixData.PretixResources.orders,
+            content=content,
+        )
+        if created_at is not None:
+            # created_at is set automatically, so it has to be updated afterwards
+            PretixData.objects.filter(pk=pretix_data.pk).update(created_at=created_at)
+            pretix_data.refresh_from_db()
+        return pretix_data
+
+    return create
+
+
 # NOTE(artcz)
 # The fixture below (fix_async_db) is copied from this issue
 # https://github.com/pytest-dev/pytest-asyncio/issues/226
@@ -1,6 +1,18 @@
 import json
 
-from core.models import DiscordMessage, PretalxData, PretixData, Webhook
+from core.bot.delivery import notify_new_messages
+from core.models import (
+    DiscordMessage,
+    PretalxData,
+    PretixData,
+    PretixOrder,
+    PretixOrderHistory,
+    PretixOrderPosition,
+    PretixProduct,
+    PretixSyncState,
+    PretixVoucher,
+    Webhook,
+)
 from django.contrib import admin
 from django.utils.html import format_html
 
@@ -19,6 +31,7 @@ class WebhookAdmin(admin.ModelAdmin):
         "source",
         "event",
         "signature",
+        "dedup_key",
         "pretty_meta",
         "pretty_content",
         "created_at",
@@ -37,6 +50,33 @@ class WebhookAdmin(admin.ModelAdmin):
     pretty_content.short_description = "Content"
 
 
+class DeliveryStatusFilter(admin.SimpleListFilter):
+    title = "delivery status"
+    parameter_name = "status"
+
+    def lookups(self, request, model_admin):
+        return [
+            ("pending", "Pending"),
+            ("retrying", "Retrying"),
+            ("dead", "Dead"),
+            ("sent", "Sent"),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() == "pending":
+            return queryset.filter(sent_at__isnull=True, dead_at__isnull=True)
+        if self.value() == "retrying":
+            return queryset.filter(
+                sent_at__isnull=True, dead_at__isnull=True, attempts__gt=0
+            )
+        if self.value() == "dead":
+            return queryset.filter(dead_at__isnull=False)
+        if self.value() == "sent":
+            return queryset.filter(sent_at__isnull=False)
+
+        return queryset
+
+
 class DiscordMessageAdmin(admin.ModelAdmin):
     list_display = [
         "uuid",
@@ -46,8 +86,11 @@ class DiscordMessageAdmin(admin.ModelAdmin):
         "created_at",
         "modified_at",
         "sent_at",
+        "delivery_latency",
+        "attempts",
     ]
     list_filter = [
+        DeliveryStatusFilter,
         "created_at",
         "sent_at",
         "channel_name",
@@ -56,16 +99,40 @@ class DiscordMessageAdmin(admin.ModelAdmin):
         "uuid",
         "channel_id",
         "content",
+        "meta",
         "created_at",
         "modified_at",
         "sent_at",
+        "claimed_by",
+        "claimed_at",
+        "attempts",
+        "next_attempt_at",
+        "last_error",
+        "dead_at",
     ]
+    actions = ["requeue"]
 
     def content_short(self, obj: DiscordMessage):
         # NOTE(artcz) This can create false shortcuts, but for most messages is
         # good enough, because most of them are longer than 20 chars
         return f"{obj.content[:10]}...{obj.content[-10:]}"
 
+    @admin.action(description="Requeue selected (unsent) messages")
+    def requeue(self, request, queryset):
+        messages = list(queryset.filter(sent_at__isnull=True))
+
+        DiscordMessage.objects.filter(pk__in=[m.pk for m in messages]).update(
+            attempts=0,
+            next_attempt_at=None,
+            last_error="",
+            dead_at=None,
+            claimed_by="",
+            claimed_at=None,
+        )
+        notify_new_messages(messages)
+
+        self.message_user(request, f"Requeued {len(messages)} message(s)")
+
 
 class PretalxDataAdmin(admin.ModelAdmin):
     list_display = [
@@ -82,6 +149,8 @@ class PretalxDataAdmin(admin.ModelAdmin):
         "uuid",
         "resource",
         "pretty_content",
+        "content_hash",
+        "same_as",
         "created_at",
         "modified_at",
         "processed_at",
@@ -113,6 +182,8 @@ class PretixDataAdmin(admin.ModelAdmin):
         "uuid",
         "resource",
         "pretty_content",
+        "content_hash",
+        "same_as",
         "created_at",
         "modified_at",
         "processed_at",
@@ -129,7 +200,103 @@ class PretixDataAdmin(admin.ModelAdmin):
     pretty_content.short_description = "Content"
 
 
+class PretixOrderPositionInline(admin.TabularInline):
+    model = PretixOrderPosition
+    extra = 0
+    can_delete = False
+    readonly_fields = fields = [
+        "pretix_id",
+        "item_id",
+        "variation_id",
+        "price",
+        "attendee_name",
+        "canceled",
+    ]
+
+
+class PretixOrderAdmin(admin.ModelAdmin):
+    list_display = [
+        "code",
+        "event",
+        "status",
+        "total",
+        "datetime",
+        "last_modified",
+    ]
+    list_filter = ["event", "status"]
+    search_fields = ["code", "email"]
+    inlines = [PretixOrderPositionInline]
+    readonly_fields = fields = [
+        "event",
+        "code",
+        "status",
+        "email",
+        "total",
+        "datetime",
+        "last_modified",
+        "pretty_content",
+        "created_at",
+        "modified_at",
+    ]
+
+    def pretty_content(self, obj: PretixOrder):
+        return format_html("<pre>{}</pre>", json.dumps(obj.content, indent=4))
+
+    pretty_content.short_description = "Content"
+
+
+class PretixProductAdmin(admin.ModelAdmin):
+    list_display = [
+        "pretix_id",
+        "event",
+        "name",
+        "active",
+        "default_price",
+    ]
+    list_filter = ["event", "active"]
+
+
+class PretixVoucherAdmin(admin.ModelAdmin):
+    list_display = [
+        "code",
+        "event",
+        "tag",
+        "item_id",
+        "redeemed",
+        "max_usages",
+        "valid_until",
+    ]
+    list_filter = ["event", "tag"]
+    search_fields = ["code"]
+
+
+class PretixSyncStateAdmin(admin.ModelAdmin):
+    list_display = [
+        "event",
+        "resource",
+        "last_modified",
+        "synced_at",
+    ]
+
+
+class PretixOrderHistoryAdmin(admin.ModelAdmin):
+    list_display = [
+        "event",
+        "downloaded_at",
+        "keyframe",
+        "added",
+        "changed",
+        "removed",
+    ]
+    list_filter = ["event", "keyframe"]
+
+
 admin.site.register(Webhook, WebhookAdmin)
 admin.site.register(DiscordMessage, DiscordMessageAdmin)
 admin.site.register(PretalxData, PretalxDataAdmin)
 admin.site.register(PretixData, PretixDataAdmin)
+admin.site.register(PretixOrder, PretixOrderAdmin)
+admin.site.register(PretixProduct, PretixProductAdmin)
+admin.site.register(PretixVoucher, PretixVoucherAdmin)
+admin.site.register(PretixSyncState, PretixSyncStateAdmin)
+admin.site.register(PretixOrderHistory, PretixOrderHistoryAdmin)
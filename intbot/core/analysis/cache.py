@@ -0,0 +1,69 @@
+"""
+Cache of analysis results.
+
+Results of the analysis depend only on the download (PretalxData/PretixData
+row) they were computed from, and we get a new download once a day. So
+instead of parsing and aggregating the data on every view or bot command,
+results are stored in the shared Django cache (as Arrow IPC bytes), keyed by
+uuid of the download, and name and version of the analysis function.
+
+A new download means new keys - the old results are not used anymore, and
+get evicted by the cache (after ANALYSIS_CACHE_TTL, or earlier if the cache is
+full). The version is there to bump when an analysis function changes, so
+that we don't get stale results computed by the old code.
+"""
+
+import functools
+import io
+from typing import Callable
+
+import polars as pl
+from core.analysis.snapshots import restore_decimals
+from core.models import PretalxData, PretixData
+from django.core.cache import cache
+
+ANALYSIS_CACHE_PREFIX = "analysis:"
+ANALYSIS_CACHE_TTL = 60 * 60 * 24 * 7
+
+Data = PretalxData | PretixData
+
+
+def analysis_cache_key(name: str, version: int, data: Data) -> str:
+    return f"{ANALYSIS_CACHE_PREFIX}{name}:v{version}:{data.uuid}"
+
+
+def frame_to_bytes(df: pl.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.write_ipc(buffer, compression="zstd")
+    return buffer.getvalue()
+
+
+def frame_from_bytes(payload: bytes) -> pl.DataFrame:
+    return restore_decimals(pl.read_ipc(io.BytesIO(payload)).lazy()).collect()
+
+
+def cached_analysis(version: int):
+    """
+    Cache results of the decorated function - which takes a PretalxData or
+    PretixData row, and returns a data frame computed from it.
+    """
+
+    def decorator(func: Callable[[Data], pl.DataFrame]):
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(data: Data) -> pl.DataFrame:
+            key = analysis_cache_key(name, version, data)
+
+            payload = cache.get(key)
+            if payload is not None:
+                return frame_from_bytes(payload)
+
+            df = func(data)
+            cache.set(key, frame_to_bytes(df), ANALYSIS_CACHE_TTL)
+
+            return df
+
+        return wrapper
+
+    return decorator
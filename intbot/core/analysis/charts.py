@@ -0,0 +1,93 @@
+"""
+Cache of rendered charts.
+
+Rendering a plotly figure to PNG goes through kaleido (a headless browser),
+and takes seconds the first time. Rendering to HTML is faster, but still
+serializes all the data with every page view. Charts depend only on the
+download they show, so - like the analysis results - they are rendered once
+per download and stored in the Django cache.
+
+Download commands pre-render all the charts in a background task, so the bot
+commands and the views usually just read them from the cache.
+"""
+
+import logging
+from typing import Callable
+
+import plotly.graph_objects as go
+from core.analysis.cache import ANALYSIS_CACHE_TTL
+from core.analysis.submissions import (
+    get_latest_submissions_data,
+    piechart_submissions_by_state,
+    snapshot_submissions_by_state,
+)
+from core.models import PretalxData
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CHART_CACHE_PREFIX = "chart:"
+CHART_CACHE_TTL = ANALYSIS_CACHE_TTL
+
+CHART_FORMATS = ["png", "html"]
+
+
+def submissions_by_state_figure(pretalx_data: PretalxData) -> go.Figure:
+    by_state = snapshot_submissions_by_state(pretalx_data)
+    return piechart_submissions_by_state(by_state)
+
+
+# Charts of the submissions, by name
+SUBMISSIONS_CHARTS: dict[str, Callable[[PretalxData], go.Figure]] = {
+    "submissions_by_state": submissions_by_state_figure,
+}
+
+
+def chart_cache_key(name: str, format: str, data: PretalxData) -> str:
+    return f"{CHART_CACHE_PREFIX}{name}.{format}:{data.uuid}"
+
+
+def render_figure(figure: go.Figure, format: str) -> bytes | str:
+    if format == "html":
+        return figure.to_html(full_html=False, include_plotlyjs="cdn")
+
+    return figure.to_image(format=format)
+
+
+def get_submissions_chart(
+    name: str, format: str, pretalx_data: PretalxData
+) -> bytes | str:
+    """Chart rendered to `format`, from the cache if it was rendered before"""
+    key = chart_cache_key(name, format, pretalx_data)
+
+    rendered = cache.get(key)
+    if rendered is None:
+        figure = SUBMISSIONS_CHARTS[name](pretalx_data)
+        rendered = render_figure(figure, format)
+        cache.set(key, rendered, CHART_CACHE_TTL)
+
+    return rendered
+
+
+def latest_submissions_chart(name: str, format: str) -> bytes | str:
+    return get_submissions_chart(name, format, get_latest_submissions_data())
+
+
+def prerender_submissions_charts(pretalx_data: PretalxData) -> None:
+    """Render all the charts of the download in all the formats"""
+    for name in SUBMISSIONS_CHARTS:
+        for format in CHART_FORMATS:
+            get_submissions_chart(name, format, pretalx_data)
+
+
+def warm_up_chart_renderer() -> None:
+    """
+    Kaleido starts a headless browser with the first PNG render, and then
+    keeps it running - render something small upfront in long running
+    processes, so that the first chart that isn't in the cache doesn't have
+    to wait for that.
+    """
+    try:
+        render_figure(go.Figure(), "png")
+    except Exception:
+        logger.exception("Failed to start the chart renderer")
@@ -3,10 +3,14 @@ Parse Products from PretixData for further joins and analysis in other places.
 """
 
 from decimal import Decimal
+from pathlib import Path
 from typing import ClassVar, Iterable
 
 import polars as pl
+from core.analysis.cache import cached_analysis
+from core.analysis.snapshots import scan_or_parse, write_snapshot
 from core.models import PretixData
+from django.db import connection
 from pydantic import BaseModel, model_validator
 
 
@@ -55,11 +59,16 @@ class FlatProductDescription(BaseModel):
 
 def get_latest_products_data() -> PretixData:
     qs = PretixData.objects.filter(resource=PretixData.PretixResources.products)
-    return qs.latest("created_at")
+    # Content is loaded only if it's needed (if there's no snapshot)
+    return qs.defer("content").latest("created_at").original()
 
 
 def parse_latest_products_to_objects(pretix_data: PretixData) -> list[Product]:
-    data = pretix_data.content
+    # Unchanged downloads are stored without content, see core.integrations.storage
+    data = pretix_data.original().content
+    if data is None:
+        raise ValueError(f"{pretix_data} has no content")
+
     products = [Product.model_validate(entry) for entry in data]
     return products
 
@@ -109,11 +118,121 @@ def flat_product_data(products: list[Product]) -> pl.DataFrame:
     return pl.DataFrame(rows)
 
 
+def localised_sql(field: str) -> str:
+    """Same as LocalisedFieldsMixin, but in SQL, for a jsonb `field`"""
+    return (
+        f"CASE WHEN jsonb_typeof({field}) = 'object' AND {field} ? 'en' "
+        f"THEN {field}->>'en' ELSE {field} #>> '{{}}' END"
+    )
+
+
+# Products and their variations, one row per variation (or product without
+# variations), in the same order as in the downloaded JSON.
+PRODUCT_ROWS_SQL = f"""
+    SELECT
+        (product->>'id')::bigint AS product_id,
+        (variation->>'id')::bigint AS variation_id,
+        {localised_sql("product->'name'")} AS product_name,
+        {localised_sql("variation->'value'")} AS variation_value,
+        product->>'default_price' AS default_price,
+        variation->>'price' AS variation_price
+    FROM {PretixData._meta.db_table},
+        jsonb_array_elements(content) WITH ORDINALITY AS p(product, product_pos)
+        LEFT JOIN LATERAL jsonb_array_elements(product->'variations')
+            WITH ORDINALITY AS v(variation, variation_pos) ON true
+    WHERE id = %s
+    ORDER BY product_pos, variation_pos
+"""
+
+PRODUCT_ROWS_SCHEMA = {
+    "product_id": pl.Int64,
+    "variation_id": pl.Int64,
+    "product_name": pl.String,
+    "variation_value": pl.String,
+    "default_price": pl.String,
+    "variation_price": pl.String,
+}
+
+
+def product_rows(pretix_data: PretixData) -> pl.DataFrame:
+    """
+    Products flattened by the database, straight from the jsonb content -
+    without loading the JSON and validating every product and variation with
+    pydantic.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(PRODUCT_ROWS_SQL, [pretix_data.pk])
+        rows = cursor.fetchall()
+
+    return pl.DataFrame(rows, schema=PRODUCT_ROWS_SCHEMA, orient="row")
+
+
+def flat_product_data_from_rows(rows: pl.DataFrame) -> pl.DataFrame:
+    """
+    Same as flat_product_data, but with polars expressions on product_rows,
+    instead of python code for every product and variation.
+    """
+    if rows.is_empty():
+        return pl.DataFrame()
+
+    if rows["product_id"].has_nulls() or rows["product_name"].has_nulls():
+        raise ValueError("Products without id or name")
+
+    # Products without variations are described by the product itself
+    has_variation = pl.col("variation_id").is_not_null()
+    product_name = pl.col("product_name")
+    value = pl.col("variation_value")
+
+    is_late = (
+        pl.when(has_variation)
+        .then(value)
+        .otherwise(product_name)
+        .str.contains("Late", literal=True)
+    )
+    name = (
+        pl.when(is_late)
+        .then(value.str.replace_all("Late", "", literal=True).str.strip_chars())
+        .otherwise(value)
+    )
+
+    return rows.select(
+        "product_id",
+        "variation_id",
+        "product_name",
+        type=pl.when(is_late).then(pl.lit("Late")).otherwise(pl.lit("Regular")),
+        variant=(
+            pl.when(~has_variation)
+            .then(product_name)
+            .when(name.str.contains("Combined", literal=True))
+            .then(pl.lit("Combined"))
+            .otherwise(name)
+        ),
+        price=(
+            pl.when(has_variation)
+            .then(pl.col("variation_price"))
+            .otherwise(pl.col("default_price"))
+            # Infer the scale from all the prices, like for python Decimals
+            .str.to_decimal(inference_length=len(rows))
+        ),
+    )
+
+
+def parse_flat_product_data(pretix_data: PretixData) -> pl.DataFrame:
+    return flat_product_data_from_rows(product_rows(pretix_data))
+
+
+def write_products_snapshot(pretix_data: PretixData) -> Path:
+    return write_snapshot(pretix_data, parse_flat_product_data(pretix_data))
+
+
+@cached_analysis(version=1)
+def snapshot_flat_product_data(pretix_data: PretixData) -> pl.DataFrame:
+    return scan_or_parse(pretix_data, parse_flat_product_data).collect()
+
+
 def latest_flat_product_data() -> pl.DataFrame:
     """
     Thin wrapper on getting latest information from the database, and
     converting into a polars data frame
     """
-    pretix_data = get_latest_products_data()
-    products = parse_latest_products_to_objects(pretix_data)
-    return flat_product_data(products)
+    return snapshot_flat_product_data(get_latest_products_data())
@@ -0,0 +1,108 @@
+"""
+Columnar (Parquet) snapshots of the data downloaded from Pretalx and Pretix.
+
+PretalxData and PretixData keep the raw JSON from the APIs, and parsing it
+(and validating every entry with pydantic) on every bot command gets slow with
+more data. So the download commands also save the already flattened data
+frame of every download to a compressed Parquet file, and the analysis reads
+those lazily - only the columns it needs.
+
+The JSON in the database stays the source of truth - if there is no snapshot
+(for example for older downloads), the analysis falls back to parsing it.
+"""
+
+import logging
+from pathlib import Path
+from typing import Callable, Literal, TypeVar
+
+import polars as pl
+from core.models import PretalxData, PretixData
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_COMPRESSION: Literal["zstd"] = "zstd"
+
+# Either of the downloads, with functions that take only one of them
+Download = TypeVar("Download", bound=PretalxData | PretixData)
+
+
+def snapshot_path(data: PretalxData | PretixData) -> Path:
+    """One file per source/event/resource/download"""
+    source = "pretalx" if isinstance(data, PretalxData) else "pretix"
+    timestamp = data.created_at.strftime("%Y%m%dT%H%M%S")
+
+    return (
+        Path(settings.SNAPSHOTS_DIR)
+        / source
+        / (data.event or "unknown")
+        / data.resource
+        / f"{timestamp}-{data.uuid}.parquet"
+    )
+
+
+def write_snapshot(data: PretalxData | PretixData, df: pl.DataFrame) -> Path:
+    path = snapshot_path(data)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temporary file first, so that nobody reads half of a snapshot
+    tmp_path = path.with_suffix(".tmp")
+    df.write_parquet(tmp_path, compression=SNAPSHOT_COMPRESSION)
+    tmp_path.replace(path)
+
+    return path
+
+
+def try_write_snapshot(
+    write: Callable[[Download], Path],
+    data: Download,
+) -> Path | None:
+    """
+    Snapshots are only an optimisation (the data is already in the database),
+    so failing to write one shouldn't fail the whole download.
+    """
+    try:
+        return write(data)
+    except Exception:
+        logger.exception("Failed to write a snapshot of %s", data)
+        return None
+
+
+def scan_snapshot(data: PretalxData | PretixData) -> pl.LazyFrame | None:
+    """Lazy frame with the snapshot of `data`, or None if there is none"""
+    path = snapshot_path(data)
+
+    if not path.exists():
+        return None
+
+    return restore_decimals(pl.scan_parquet(path))
+
+
+def restore_decimals(lazy: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Parquet (and Arrow IPC) need a precision for decimals, while data frames
+    built from python Decimals don't have one. Casting to a Decimal without
+    precision keeps it, so go through strings instead - this way the schema
+    is the same as it was before saving the data.
+    """
+    decimals = [
+        pl.col(name).cast(pl.String).cast(pl.Decimal(None, dtype.scale))
+        for name, dtype in lazy.collect_schema().items()
+        if isinstance(dtype, pl.Decimal)
+    ]
+
+    return lazy.with_columns(decimals) if decimals else lazy
+
+
+def scan_or_parse(
+    data: Download,
+    parse: Callable[[Download], pl.DataFrame],
+) -> pl.LazyFrame:
+    """Snapshot of `data` if it exists, otherwise `parse` the JSON"""
+    lazy = scan_snapshot(data)
+
+    if lazy is None:
+        logger.info("No snapshot for %s, parsing the JSON", data)
+        lazy = parse(data).lazy()
+
+    return lazy
@@ -3,12 +3,15 @@ Basic analysis of Pretalx Submissions data
 """
 
 from datetime import datetime
+from pathlib import Path
 from typing import ClassVar, Iterable
 
 import plotly.express as px
 import polars as pl
+from core.analysis.cache import cached_analysis
+from core.analysis.snapshots import scan_or_parse, scan_snapshot, write_snapshot
 from core.models import PretalxData
-from pydantic import BaseModel, model_validator
+from pydantic import BaseModel, TypeAdapter, model_validator
 
 
 class LocalisedFieldsMixin:
@@ -45,49 +48,101 @@ class Submission(LocalisedFieldsMixin, BaseModel):
         level = "Expected audience expertise"
         outline = "Outline"
 
+    # Fields extracted from answers, by text of the question - so that every
+    # answer is looked up once, instead of compared with every question
+    _answer_fields: ClassVar[dict[str, str]] = {
+        Questions.level: "level",
+        Questions.outline: "outline",
+    }
+
     @model_validator(mode="before")
     def extract_answers(cls, values):
         # Some things are available as answers to questions and we can extract
         # them here
         # Using .get since this should be optional when creating Submission
         # objects manually
+        answer_fields = cls._answer_fields
         for answer in values.get("answers", ""):
             # Submission in the API will include answers to questions asked on
             # submission and on the speaker. Let's explicitly filter out only
             # submission questions.
-            is_submission_question = answer["submission"] is not None
-
-            if is_submission_question and cls.matches_question(answer, cls.Questions.level):
-                values["level"] = answer["answer"]
+            if answer["submission"] is None:
+                continue
 
-            if is_submission_question and cls.matches_question(answer, cls.Questions.outline):
-                values["outline"] = answer["answer"]
+            # Same as question_text, inlined - this runs for every answer
+            question = answer.get("question", {}).get("question", {}).get("en")
+            field = answer_fields.get(question)
+            if field is not None:
+                values[field] = answer["answer"]
 
         return values
 
+    @staticmethod
+    def question_text(answer: dict) -> str | None:
+        """
+        Answers come in a nested structure that includes localised question
+        text. This function is a small wrapper to encapsulate that behaviour.
+        """
+        return answer.get("question", {}).get("question", {}).get("en")
+
     @staticmethod
     def matches_question(answer: dict, question: str) -> bool:
         """
         Returns True if the answer corresponds to the question passed as the second
         argument.
-
-        Answers come in a nested structure that includes localised question
-        text. This function is a small wrapper to encapsulate that behaviour.
         """
-        return question == answer.get("question", {}).get("question", {}).get("en")
+        return question == Submission.question_text(answer)
+
+
+# Validates the whole list at once, which is faster than validating the
+# submissions one by one
+SUBMISSIONS_ADAPTER = TypeAdapter(list[Submission])
 
 
 def get_latest_submissions_data() -> PretalxData:
-    return PretalxData.objects.filter(
-        resource=PretalxData.PretalxResources.submissions
-    ).latest("created_at")
+    # Content is loaded only if it's needed (if there's no snapshot)
+    return (
+        PretalxData.objects.filter(resource=PretalxData.PretalxResources.submissions)
+        .defer("content")
+        .latest("created_at")
+        .original()
+    )
 
 
-def parse_latest_submissions_to_objects(pretalx_data: PretalxData) -> list[Submission]:
-    data = pretalx_data.content
+def parse_submissions(data: list[dict]) -> list[Submission]:
     # NOTE: add event as context here
-    submissions = [Submission.model_validate(entry) for entry in data]
-    return submissions
+    return SUBMISSIONS_ADAPTER.validate_python(data)
+
+
+def submissions_from_snapshot(snapshot: pl.DataFrame) -> list[Submission]:
+    """
+    Snapshots are written from already validated (and flattened) submissions
+    at download time, so there are no answers or localised fields to extract
+    again - only the objects to build.
+
+    NOTE: Submission.model_construct would skip the validation altogether,
+    but with pydantic 2 it's slower than validating the flat rows.
+    """
+    return SUBMISSIONS_ADAPTER.validate_python(snapshot.to_dicts())
+
+
+def parse_latest_submissions_to_objects(
+    pretalx_data: PretalxData, use_snapshot: bool = True
+) -> list[Submission]:
+    """
+    Submissions from the snapshot of the download if there is one (and
+    `use_snapshot` is set), otherwise validated from the JSON.
+    """
+    snapshot = scan_snapshot(pretalx_data) if use_snapshot else None
+    if snapshot is not None:
+        return submissions_from_snapshot(snapshot.collect())
+
+    # Unchanged downloads are stored without content, see core.integrations.storage
+    content = pretalx_data.original().content
+    if content is None:
+        raise ValueError(f"{pretalx_data} has no content")
+
+    return parse_submissions(content)
 
 
 def flat_submissions_data(submissions: list[Submission]) -> pl.DataFrame:
@@ -100,20 +155,57 @@ def flat_submissions_data(submissions: list[Submission]) -> pl.DataFrame:
     return pl.DataFrame(submissions)
 
 
+def parse_flat_submissions_data(pretalx_data: PretalxData) -> pl.DataFrame:
+    # Used to write the snapshots, so always from the JSON
+    submissions = parse_latest_submissions_to_objects(pretalx_data, use_snapshot=False)
+    return flat_submissions_data(submissions)
+
+
+def write_submissions_snapshot(pretalx_data: PretalxData) -> Path:
+    return write_snapshot(pretalx_data, parse_flat_submissions_data(pretalx_data))
+
+
+def latest_submissions_lazy() -> pl.LazyFrame:
+    """
+    Latest submissions as a lazy frame - from the Parquet snapshot if there
+    is one, so that only the selected columns are read.
+    """
+    return scan_or_parse(get_latest_submissions_data(), parse_flat_submissions_data)
+
+
+def latest_submissions_data(*columns: str) -> pl.DataFrame:
+    """Latest submissions, with only the given `columns` (or all of them)"""
+    lazy = latest_submissions_lazy()
+    return lazy.select(columns).collect() if columns else lazy.collect()
+
+
+@cached_analysis(version=1)
+def snapshot_flat_submissions_data(pretalx_data: PretalxData) -> pl.DataFrame:
+    return scan_or_parse(pretalx_data, parse_flat_submissions_data).collect()
+
+
 def latest_flat_submissions_data() -> pl.DataFrame:
     """
     Thin wrapper on getting latest information from the database, and
     converting into a polars data frame
     """
-    pretalx_data = get_latest_submissions_data()
-    submissions = parse_latest_submissions_to_objects(pretalx_data)
-    return flat_submissions_data(submissions)
+    return snapshot_flat_submissions_data(get_latest_submissions_data())
 
 
 def group_submissions_by_state(submissions: pl.DataFrame) -> pl.DataFrame:
     return submissions.group_by("state").len().sort("len", descending=True)
 
 
+@cached_analysis(version=1)
+def snapshot_submissions_by_state(pretalx_data: PretalxData) -> pl.DataFrame:
+    lazy = scan_or_parse(pretalx_data, parse_flat_submissions_data)
+    return group_submissions_by_state(lazy.select("state").collect())
+
+
+def latest_submissions_by_state() -> pl.DataFrame:
+    return snapshot_submissions_by_state(get_latest_submissions_data())
+
+
 def piechart_submissions_by_state(submissions_by_state: pl.DataFrame):
     fig = px.pie(
         submissions_by_state,
@@ -0,0 +1,492 @@
+"""
+Delivery of queued DiscordMessages to Discord.
+
+Messages are created outside of the bot (by the worker in core.tasks, or by
+management commands), and stored in the database until the bot sends them.
+
+1. Whoever creates a message notifies the bot over a Postgres channel (NOTIFY)
+2. The bot LISTENs on that channel and sends just the new messages right away
+3. A slow polling loop in the bot picks up everything that was missed, for
+   example messages created while the bot was offline.
+
+Either way the bot first claims the messages (see claim_messages), so that
+even with multiple bot processes running every message is sent only once.
+Claimed messages go to the ChannelSender, which merges queued messages for
+the same channel into as few posts as possible (see coalesce), and sends
+them to multiple channels concurrently.
+
+Messages that fail to send are retried later with exponential backoff (see
+record_failure), and after MAX_ATTEMPTS they are marked as dead and left for
+someone to look at (and requeue) in the admin.
+"""
+
+import asyncio
+import logging
+import os
+import platform
+import statistics
+import time
+from collections import defaultdict, deque
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+import psycopg
+from asgiref.sync import sync_to_async
+from core.models import DiscordMessage
+from django.db import connection, transaction
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "discord_messages"
+
+# Postgres limits the payload of a notification to 8000 bytes, so bigger
+# batches of messages are split into multiple notifications.
+NOTIFY_BATCH_SIZE = 500
+
+
+def notify_new_messages(messages: Iterable[DiscordMessage]) -> None:
+    """
+    Wake up the bot, so it can send the new messages without waiting for the
+    next polling round.
+
+    The notification goes out only after the current transaction commits, so
+    the bot never wakes up before it can see the new rows.
+    """
+    pks = [str(message.pk) for message in messages]
+
+    def notify():
+        with connection.cursor() as cursor:
+            for i in range(0, len(pks), NOTIFY_BATCH_SIZE):
+                payload = ",".join(pks[i : i + NOTIFY_BATCH_SIZE])
+                cursor.execute("SELECT pg_notify(%s, %s)", [NOTIFY_CHANNEL, payload])
+
+    if pks:
+        transaction.on_commit(notify)
+
+
+def parse_notification_payload(payload: str) -> list[int]:
+    return [int(pk) for pk in payload.split(",") if pk]
+
+
+async def listen_for_new_messages(
+    on_new_messages: Callable[[list[int]], Awaitable[None]],
+) -> None:
+    """
+    Wait for notifications about new messages, and call `on_new_messages` with
+    primary keys of the messages from every notification.
+
+    This uses a separate, dedicated, connection to the database, because
+    Django connections are not meant to be kept open (and blocked) forever.
+    Returns if the connection is lost (or anything else fails, like sending
+    the messages), so the caller can decide when to reconnect.
+    """
+    db = connection.settings_dict
+
+    try:
+        aconn = await psycopg.AsyncConnection.connect(
+            dbname=db["NAME"],
+            user=db["USER"],
+            password=db["PASSWORD"],
+            host=db["HOST"],
+            port=db["PORT"],
+            autocommit=True,
+        )
+        async with aconn:
+            await aconn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            logger.info("Listening for new messages on %s", NOTIFY_CHANNEL)
+
+            async for notification in aconn.notifies():
+                await on_new_messages(parse_notification_payload(notification.payload))
+
+    except psycopg.OperationalError:
+        logger.exception("Lost connection while listening for new messages")
+    except Exception:
+        # Raising would stop the listening loop of the bot for good
+        logger.exception("Failed while listening for new messages")
+
+
+# How long a claim on a message is valid. If the process that claimed the
+# message dies before sending it, other processes can pick it up after that.
+CLAIM_LEASE = timedelta(minutes=5)
+
+# Upper limit of messages claimed at once, so that they can be sent well
+# within the lease, even with rate limits.
+CLAIM_BATCH_SIZE = 100
+
+
+def default_claimed_by() -> str:
+    """Identifies the current process in claims"""
+    return f"{platform.node()}:{os.getpid()}"
+
+
+def claim_messages(
+    messages: QuerySet[DiscordMessage],
+    claimed_by: str,
+    limit: int = CLAIM_BATCH_SIZE,
+) -> list[DiscordMessage]:
+    """
+    Atomically claim (up to `limit`) unsent messages for sending.
+
+    Uses SELECT ... FOR UPDATE SKIP LOCKED, so processes claiming at the same
+    time never wait for each other, and never get the same messages. Claims
+    that are older than CLAIM_LEASE have expired and can be claimed again.
+
+    Dead messages, and messages still waiting for their next retry, are
+    skipped.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        claimed = list(
+            messages.filter(
+                Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - CLAIM_LEASE),
+                Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+                sent_at__isnull=True,
+                dead_at__isnull=True,
+            ).select_for_update(skip_locked=True)[:limit]
+        )
+
+        DiscordMessage.objects.filter(pk__in=[m.pk for m in claimed]).update(
+            claimed_by=claimed_by,
+            claimed_at=now,
+        )
+
+    for message in claimed:
+        message.claimed_by = claimed_by
+        message.claimed_at = now
+
+    return claimed
+
+
+def release_messages(messages: list[DiscordMessage], claimed_by: str) -> None:
+    """
+    Release claims on messages that were not sent, so they can be retried
+    without waiting for the lease to expire.
+    """
+    DiscordMessage.objects.filter(
+        pk__in=[m.pk for m in messages],
+        claimed_by=claimed_by,
+        sent_at__isnull=True,
+    ).update(claimed_by="", claimed_at=None)
+
+
+# After that many failed attempts the message is considered dead, and is not
+# retried anymore (until it's requeued from the admin).
+MAX_ATTEMPTS = 8
+
+# Delay before the first retry, doubled after every failed attempt, up to
+# BACKOFF_MAX. The bot checks for due retries every BACKOFF_BASE (see
+# retry_failed_messages in core.bot.main).
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=1)
+
+
+def backoff(attempts: int) -> timedelta:
+    """Delay before the next attempt, after `attempts` failed attempts"""
+    delay = BACKOFF_BASE
+    for _ in range(attempts - 1):
+        if delay >= BACKOFF_MAX:
+            break
+        delay *= 2
+
+    return min(delay, BACKOFF_MAX)
+
+
+def record_failure(message: DiscordMessage, error: str) -> None:
+    """
+    Record a failed attempt on the (unsaved) message, and either schedule the
+    next attempt, or mark the message as dead.
+
+    The claim is released at the same time, so the message doesn't wait for
+    the lease to expire once it's due.
+    """
+    now = timezone.now()
+
+    message.attempts += 1
+    message.last_error = error
+    message.claimed_by = ""
+    message.claimed_at = None
+
+    if message.attempts >= MAX_ATTEMPTS:
+        message.dead_at = now
+        message.next_attempt_at = None
+        logger.error(
+            "Giving up on message %s after %s attempts: %s",
+            message.uuid,
+            message.attempts,
+            error,
+        )
+    else:
+        message.next_attempt_at = now + backoff(message.attempts)
+
+
+async def deliver(
+    sender: "ChannelSender",
+    messages: QuerySet[DiscordMessage],
+    claimed_by: str,
+) -> list[DiscordMessage]:
+    """
+    Claim, send, and release whatever couldn't be sent (and wasn't already
+    released by recording the failure).
+
+    Returns the sent messages.
+    """
+    claimed = await sync_to_async(claim_messages)(messages, claimed_by)
+    sent = await sender.send(claimed)
+
+    if unsent := [m for m in claimed if m.sent_at is None and m.claimed_by]:
+        await sync_to_async(release_messages)(unsent, claimed_by)
+
+    return sent
+
+
+# Discord doesn't accept messages longer than that
+MESSAGE_LENGTH_LIMIT = 2000
+
+
+@dataclass
+class Post:
+    """A single post in a Discord channel, made of one or more messages"""
+
+    content: str
+    messages: list[DiscordMessage] = field(default_factory=list)
+
+
+def collapse(messages: list[DiscordMessage]) -> list[Post]:
+    """
+    Collapse successive changes of the same thing into one line.
+
+    Successive messages with the same `coalesce_key` in their meta (for
+    example: the same field of the same GitHub project item) are replaced with
+    a single line, going from the first `from` to the last `to`. Changes that
+    were reverted (back to the first `from`) become an empty line - there's
+    nothing to post, but the messages still have to be marked as sent.
+    Everything else is passed through as is, in the same order.
+    """
+    lines: list[Post] = []
+
+    for message in messages:
+        key = message.meta.get("coalesce_key")
+
+        if (
+            key is not None
+            and lines
+            and lines[-1].messages[-1].meta.get("coalesce_key") == key
+        ):
+            lines[-1].messages.append(message)
+        else:
+            lines.append(Post(message.content, [message]))
+
+    for line in lines:
+        if len(line.messages) > 1:
+            first, last = line.messages[0], line.messages[-1]
+            if first.meta["from"] == last.meta["to"]:
+                line.content = ""
+            else:
+                line.content = last.meta["template"].format(
+                    **{"from": first.meta["from"], "to": last.meta["to"]}
+                )
+
+    return lines
+
+
+def coalesce(messages: list[DiscordMessage]) -> list[Post]:
+    """
+    Merge queued messages for a single channel into as few posts as possible,
+    without going over Discord's message length limit.
+
+    Order of the messages is preserved. A post can be empty, if all of its
+    messages were collapsed into nothing (see collapse).
+    """
+    posts: list[Post] = []
+
+    for line in collapse(messages):
+        if posts and not line.content:
+            posts[-1].messages += line.messages
+        elif posts and not posts[-1].content:
+            posts[-1].content = line.content
+            posts[-1].messages += line.messages
+        elif posts and (
+            len(posts[-1].content) + 1 + len(line.content) <= MESSAGE_LENGTH_LIMIT
+        ):
+            posts[-1].content += "\n" + line.content
+            posts[-1].messages += line.messages
+        else:
+            posts.append(line)
+
+    return posts
+
+
+class RateLimiter:
+    """
+    Sliding window rate limiter for a single Discord route.
+
+    discord.py already handles rate limits, but only after Discord responds
+    with 429 Too Many Requests. Waiting here instead means we never hit the
+    limit in the first place.
+    """
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self._sent_at: deque[float] = deque()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+
+            while self._sent_at and self._sent_at[0] <= now - self.per:
+                self._sent_at.popleft()
+
+            if len(self._sent_at) < self.rate:
+                self._sent_at.append(now)
+                return
+
+            await asyncio.sleep(self._sent_at[0] + self.per - now)
+
+
+class ChannelSender:
+    """
+    Sends messages to Discord, with one worker per channel.
+
+    Channels are independent of each other, so they are handled concurrently
+    and a slow (or rate limited) channel doesn't block the others. Messages
+    within a channel are still sent one by one, in order.
+
+    A post that fails doesn't stop the rest of the channel; the failure is
+    recorded on its messages, so they are retried later.
+    """
+
+    # Discord allows 5 messages per 5 seconds in a given channel
+    RATE = 5
+    PER = 5.0
+
+    def __init__(self, bot, rate: int = RATE, per: float = PER):
+        self.bot = bot
+        self.rate_limiters: defaultdict[str, RateLimiter] = defaultdict(
+            lambda: RateLimiter(rate, per)
+        )
+
+    async def send(self, messages: Iterable[DiscordMessage]) -> list[DiscordMessage]:
+        """
+        Send the messages, and mark the ones that were sent (and the ones that
+        failed) with one UPDATE each at the end.
+
+        Returns the sent messages.
+        """
+        by_channel: defaultdict[str, list[DiscordMessage]] = defaultdict(list)
+        for message in messages:
+            by_channel[message.channel_id].append(message)
+
+        sent: list[DiscordMessage] = []
+        failed: list[DiscordMessage] = []
+        workers = []
+
+        for channel_id, channel_messages in by_channel.items():
+            channel = self.bot.get_channel(int(channel_id))
+
+            if channel is None:
+                logger.warning("Channel %s does not exist!", channel_id)
+                for message in channel_messages:
+                    record_failure(message, f"Channel {channel_id} does not exist")
+                failed += channel_messages
+                continue
+
+            workers.append(
+                self.send_to_channel(
+                    channel_id, channel, channel_messages, sent, failed
+                )
+            )
+
+        results = await asyncio.gather(*workers, return_exceptions=True)
+
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error("Failed to send messages", exc_info=result)
+
+        if sent:
+            await DiscordMessage.objects.abulk_update(sent, ["sent_at"])
+
+        if failed:
+            await DiscordMessage.objects.abulk_update(
+                failed,
+                [
+                    "attempts",
+                    "next_attempt_at",
+                    "last_error",
+                    "dead_at",
+                    "claimed_by",
+                    "claimed_at",
+                ],
+            )
+
+        return sent
+
+    async def send_to_channel(
+        self,
+        channel_id: str,
+        channel,
+        messages: list[DiscordMessage],
+        sent: list[DiscordMessage],
+        failed: list[DiscordMessage],
+    ) -> None:
+        rate_limiter = self.rate_limiters[channel_id]
+
+        for post in coalesce(messages):
+            try:
+                # Empty posts have nothing to send, only messages to mark
+                if post.content:
+                    await rate_limiter.acquire()
+                    await channel.send(post.content, suppress_embeds=True)
+            except Exception as e:
+                logger.exception("Failed to send a post to %s", channel_id)
+                for message in post.messages:
+                    record_failure(message, repr(e))
+                failed += post.messages
+                continue
+
+            # All the messages merged into the post are marked as sent at
+            # once (in the same UPDATE), so none of them can be sent again.
+            sent_at = timezone.now()
+            for message in post.messages:
+                message.sent_at = sent_at
+            sent += post.messages
+
+
+def latency_stats(latencies: list[float]) -> dict[str, float]:
+    """
+    Summary of the end-to-end delivery latency (created_at -> sent_at), in
+    seconds.
+    """
+    if not latencies:
+        return {}
+
+    if len(latencies) > 1:
+        p95 = statistics.quantiles(latencies, n=20, method="inclusive")[-1]
+    else:
+        p95 = latencies[0]
+
+    return {
+        "count": len(latencies),
+        "median": statistics.median(latencies),
+        "p95": p95,
+        "max": max(latencies),
+    }
+
+
+async def recent_latency_stats(limit: int = 100) -> dict[str, float]:
+    """Latency stats of the `limit` most recently sent messages"""
+    messages = DiscordMessage.objects.filter(sent_at__isnull=False).order_by(
+        "-sent_at"
+    )[:limit]
+
+    latencies = [
+        latency.total_seconds()
+        async for message in messages
+        if (latency := message.delivery_latency()) is not None
+    ]
+
+    return latency_stats(latencies)
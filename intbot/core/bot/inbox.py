@@ -0,0 +1,361 @@
+"""
+Paginated inbox, for the !inbox command.
+
+The inbox used to be loaded whole, and sent as a single embed - which got
+slow for users tracking lots of messages, and failed completely once the
+summaries didn't fit in the description of an embed anymore.
+
+Now the inbox is shown one page at a time, with Previous/Next buttons that
+load the other pages only when they are clicked. Pages are fetched with
+keyset pagination - every page starts right after the (created_at, id) of
+the last item of the previous page, so getting any page is a single query
+over the index, no matter how far into the inbox it is (unlike OFFSET, that
+has to go through all the items before the page).
+
+The inbox can also be filtered by channel, author, and since a date, like:
+
+    !inbox channel: #general author: alice since: 2025-01-31
+
+Messages are added to (and removed from) the inbox with 📥 reactions. A
+popular announcement can get dozens of them at once, and each used to fetch
+the same message from the Discord API, and save (or delete) its own item.
+Now the messages come from the gateway cache of the bot, or from the
+MessageCache (only the rest is fetched from the API), and the changes are
+collected in the InboxBuffer for a moment, and then written all at once.
+"""
+
+import asyncio
+import logging
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, time
+
+import discord
+from asgiref.sync import sync_to_async
+from core.models import InboxItem
+from discord.ext import commands
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+logger = logging.getLogger(__name__)
+
+INBOX_PAGE_SIZE = 10
+
+INBOX_HEADER = "Currently tracking the following messages:\n"
+
+# Discord limit for the description of an embed
+EMBED_DESCRIPTION_LIMIT = 4096
+
+# How long (in seconds) the Previous/Next buttons keep working
+INBOX_VIEW_TIMEOUT = 300
+
+# Fields needed by InboxItem.summary(), and for the cursor
+SUMMARY_FIELDS = [
+    "id",
+    "created_at",
+    "author",
+    "channel_name",
+    "content",
+    "server_id",
+    "channel_id",
+    "message_id",
+]
+
+# Number of messages kept in the MessageCache
+MESSAGE_CACHE_SIZE = 256
+
+# How long (in seconds) changes of the inboxes wait in the InboxBuffer
+INBOX_FLUSH_DELAY = 2
+
+CHANNEL_MENTION = re.compile(r"<#(\d+)>")
+
+# (created_at, id) of the last item before the page
+Cursor = tuple[datetime, int]
+
+
+class InboxFlags(commands.FlagConverter):
+    """Filters of the !inbox command"""
+
+    channel: str | None = None
+    author: str | None = None
+    since: str | None = None
+
+
+@dataclass(frozen=True)
+class InboxFilters:
+    channel: str | None = None
+    author: str | None = None
+    since: datetime | None = None
+
+    @classmethod
+    def from_flags(cls, flags: InboxFlags | None) -> "InboxFilters":
+        if flags is None:
+            return cls()
+
+        since = None
+        if flags.since:
+            day = parse_date(flags.since)
+            if day is None:
+                raise ValueError(f"Invalid date {flags.since}, use YYYY-MM-DD")
+            since = datetime.combine(
+                day, time.min, tzinfo=timezone.get_current_timezone()
+            )
+
+        return cls(channel=flags.channel, author=flags.author, since=since)
+
+    def apply(self, items: QuerySet[InboxItem]) -> QuerySet[InboxItem]:
+        if self.channel:
+            # Channels picked in Discord are sent as mentions, like <#1234>
+            if mention := CHANNEL_MENTION.fullmatch(self.channel):
+                items = items.filter(channel_id=mention.group(1))
+            else:
+                items = items.filter(channel_name=f"#{self.channel.lstrip('#')}")
+
+        if self.author:
+            items = items.filter(author__iexact=self.author.lstrip("@"))
+
+        if self.since:
+            items = items.filter(created_at__gte=self.since)
+
+        return items
+
+
+@dataclass
+class InboxPage:
+    items: list[InboxItem] = field(default_factory=list)
+    has_next: bool = False
+
+    @property
+    def cursor(self) -> Cursor:
+        """Cursor of the next page"""
+        last = self.items[-1]
+        return last.created_at, last.pk
+
+    def description(self) -> str:
+        return INBOX_HEADER + "".join(f"* {item.summary()}\n" for item in self.items)
+
+
+def inbox_page(
+    user_id: str,
+    filters: InboxFilters = InboxFilters(),
+    after: Cursor | None = None,
+    size: int = INBOX_PAGE_SIZE,
+) -> InboxPage:
+    """
+    Page of the inbox of the user - up to `size` items, starting from the most
+    recently saved one, after the `after` cursor (if any).
+
+    Pages can be shorter, if the summaries of all the items wouldn't fit in
+    an embed.
+    """
+    items = filters.apply(InboxItem.objects.filter(user_id=user_id))
+
+    if after:
+        created_at, pk = after
+        items = items.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+        )
+
+    # One more item than needed, to know if there is a next page
+    rows = list(items.only(*SUMMARY_FIELDS).order_by("-created_at", "-pk")[: size + 1])
+
+    page = InboxPage()
+    length = len(INBOX_HEADER)
+    for item in rows[:size]:
+        length += len(f"* {item.summary()}\n")
+        if page.items and length > EMBED_DESCRIPTION_LIMIT:
+            break
+        page.items.append(item)
+
+    page.has_next = len(rows) > len(page.items)
+    return page
+
+
+class InboxView(discord.ui.View):
+    """Previous/Next buttons, that load the pages of the inbox when clicked"""
+
+    def __init__(self, user_id: str, filters: InboxFilters, page: InboxPage):
+        super().__init__(timeout=INBOX_VIEW_TIMEOUT)
+        self.user_id = user_id
+        self.filters = filters
+        self.page = page
+        # Cursors of the pages up to the current one - going back doesn't
+        # need any other cursor than where the previous page started
+        self.cursors: list[Cursor | None] = [None]
+        self.update_buttons()
+
+    def embed(self) -> discord.Embed:
+        embed = discord.Embed(description=self.page.description())
+        embed.set_footer(text=f"Page {len(self.cursors)}")
+        return embed
+
+    def update_buttons(self) -> None:
+        self.previous_page.disabled = len(self.cursors) == 1
+        self.next_page.disabled = not self.page.has_next
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # Only the owner of the inbox can go through it
+        return str(interaction.user.id) == self.user_id
+
+    async def show(self, interaction: discord.Interaction) -> None:
+        self.page = await sync_to_async(inbox_page)(
+            self.user_id, self.filters, after=self.cursors[-1]
+        )
+        self.update_buttons()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="Previous")
+    async def previous_page(
+        self, interaction: discord.Interaction, button: discord.ui.Button
+    ) -> None:
+        self.cursors.pop()
+        await self.show(interaction)
+
+    @discord.ui.button(label="Next")
+    async def next_page(
+        self, interaction: discord.Interaction, button: discord.ui.Button
+    ) -> None:
+        self.cursors.append(self.page.cursor)
+        await self.show(interaction)
+
+
+@dataclass(frozen=True)
+class MessageInfo:
+    """Details of a Discord message, that are saved in the inbox"""
+
+    channel_name: str
+    author: str
+    content: str
+
+
+class MessageCache:
+    """
+    Least recently used messages added to inboxes, so that every message is
+    fetched from the Discord API only once, no matter how many users add it.
+    """
+
+    def __init__(self, size: int = MESSAGE_CACHE_SIZE):
+        self.size = size
+        self.messages: OrderedDict[int, MessageInfo] = OrderedDict()
+
+    async def get(
+        self, bot: discord.Client, channel_id: int, message_id: int
+    ) -> MessageInfo:
+        # Messages sent while the bot was running are in its gateway cache
+        message = discord.utils.get(bot.cached_messages, id=message_id)
+        if message is not None:
+            return MessageInfo(
+                channel_name=f"#{message.channel.name}",
+                author=str(message.author.name),
+                content=message.content,
+            )
+
+        if message_id in self.messages:
+            self.messages.move_to_end(message_id)
+            return self.messages[message_id]
+
+        channel = bot.get_channel(channel_id)
+        message = await channel.fetch_message(message_id)
+        info = self.messages[message_id] = MessageInfo(
+            channel_name=f"#{channel.name}",
+            author=str(message.author.name),
+            content=message.content,
+        )
+
+        if len(self.messages) > self.size:
+            self.messages.popitem(last=False)
+
+        return info
+
+    def invalidate(self, message_id: int) -> None:
+        """Forget the message, so that it's fetched again after an edit"""
+        self.messages.pop(message_id, None)
+
+
+# (user_id, message_id) of an inbox item
+InboxKey = tuple[str, str]
+
+
+class InboxBuffer:
+    """
+    Write-behind buffer of the inboxes - items added and removed in the last
+    INBOX_FLUSH_DELAY seconds, saved with a single bulk_create and removed
+    with a single delete.
+
+    Anything that reads the inboxes has to flush() the buffer first, and the
+    bot flushes it when it's closed.
+    """
+
+    def __init__(self, delay: float = INBOX_FLUSH_DELAY):
+        self.delay = delay
+        self.added: dict[InboxKey, InboxItem] = {}
+        self.removed: set[InboxKey] = set()
+        self.timer: asyncio.TimerHandle | None = None
+        self.flushing: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self.added) + len(self.removed)
+
+    def add(self, item: InboxItem) -> None:
+        key = (item.user_id, item.message_id)
+        self.removed.discard(key)
+        self.added[key] = item
+        self.schedule()
+
+    def remove(self, user_id: str, message_id: str) -> None:
+        key = (user_id, message_id)
+        # The item may have been saved before it was added again, so it's
+        # removed in any case
+        self.added.pop(key, None)
+        self.removed.add(key)
+        self.schedule()
+
+    def schedule(self) -> None:
+        if self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(
+                self.delay, self.flush_later
+            )
+
+    def flush_later(self) -> None:
+        self.flushing = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        if not self:
+            return
+
+        added, removed = self.added, self.removed
+        self.added, self.removed = {}, set()
+
+        # Writes from overlapping flushes are still done in order, as all the
+        # sync_to_async calls run in the same thread
+        try:
+            await sync_to_async(write_inbox_changes)(list(added.values()), removed)
+        except Exception:
+            logger.exception(
+                "Failed to save %s inbox changes", len(added) + len(removed)
+            )
+            # Retry with the next flush, unless there are newer changes
+            for key, item in added.items():
+                if key not in self.removed:
+                    self.added.setdefault(key, item)
+            self.removed |= removed - self.added.keys()
+            self.schedule()
+
+
+def write_inbox_changes(added: list[InboxItem], removed: set[InboxKey]) -> None:
+    with transaction.atomic():
+        if removed:
+            condition = Q()
+            for user_id, message_id in removed:
+                condition |= Q(user_id=user_id, message_id=message_id)
+            InboxItem.objects.filter(condition).delete()
+
+        # Messages already in the inbox (by the unique constraint) are skipped
+        InboxItem.objects.bulk_create(added, ignore_conflicts=True)
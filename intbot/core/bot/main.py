@@ -1,51 +1,99 @@
+import asyncio
 import io
+import logging
 
 import discord
 from asgiref.sync import sync_to_async
+from core.analysis.charts import latest_submissions_chart, warm_up_chart_renderer
 from core.analysis.products import latest_flat_product_data
-from core.analysis.submissions import (
-    group_submissions_by_state,
-    latest_flat_submissions_data,
-    piechart_submissions_by_state,
+from core.analysis.submissions import latest_submissions_by_state
+from core.bot.delivery import (
+    BACKOFF_BASE,
+    ChannelSender,
+    default_claimed_by,
+    deliver,
+    listen_for_new_messages,
+    recent_latency_stats,
+)
+from core.bot.inbox import (
+    InboxBuffer,
+    InboxFilters,
+    InboxFlags,
+    InboxView,
+    MessageCache,
+    inbox_page,
 )
 from core.models import DiscordMessage, InboxItem
 from discord.ext import commands, tasks
 from django.conf import settings
 from django.utils import timezone
 
+logger = logging.getLogger(__name__)
+
 intents = discord.Intents.default()
 intents.members = True
 intents.message_content = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
-
 # Inbox emoji used for adding messages to user's inbox
 INBOX_EMOJI = "📥"
 
+message_cache = MessageCache()
+inbox_buffer = InboxBuffer()
+
+
+class Bot(commands.Bot):
+    async def close(self):
+        # Save the inbox changes that are still waiting in the buffer
+        await inbox_buffer.flush()
+        await super().close()
+
+
+bot = Bot(command_prefix="!", intents=intents)
+
+# The event loop keeps only a weak reference to its tasks
+warm_up_task: asyncio.Task | None = None
+
+
+def log_warm_up_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Failed to warm up the chart renderer", exc_info=task.exception())
+
 
 @bot.event
 async def on_ready():
     print(f"Bot is ready. Logged in as {bot.user}")
-    poll_database.start()  # Start polling the database
+    # on_ready is called again after every reconnect, the loops keep running
+    if not poll_database.is_running():
+        poll_database.start()  # Start polling the database
+    if not listen_to_database.is_running():
+        listen_to_database.start()  # Start waiting for new messages
+    if not retry_failed_messages.is_running():
+        retry_failed_messages.start()  # Start retrying failed messages
+    # Start the chart renderer in the background, it takes a few seconds
+    global warm_up_task
+    if warm_up_task is None:
+        warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up_chart_renderer))
+        warm_up_task.add_done_callback(log_warm_up_failure)
 
 
 @bot.event
 async def on_raw_reaction_add(payload):
     """Handle adding messages to inbox when users react with the inbox emoji"""
     if payload.emoji.name == INBOX_EMOJI:
-        # Get the channel and message details
-        channel = bot.get_channel(payload.channel_id)
-        message = await channel.fetch_message(payload.message_id)
-
-        # Create a new inbox item using async
-        await InboxItem.objects.acreate(
-            message_id=str(message.id),
-            channel_id=str(payload.channel_id),
-            channel_name=f"#{channel.name}",
-            server_id=str(payload.guild_id),
-            user_id=str(payload.user_id),
-            author=str(message.author.name),
-            content=message.content,
+        # Get the message details, fetching the message only if needed
+        message = await message_cache.get(bot, payload.channel_id, payload.message_id)
+
+        # Add a new inbox item, saved with the next flush of the buffer
+        inbox_buffer.add(
+            InboxItem(
+                message_id=str(payload.message_id),
+                channel_id=str(payload.channel_id),
+                channel_name=message.channel_name,
+                server_id=str(payload.guild_id),
+                user_id=str(payload.user_id),
+                author=message.author,
+                content=message.content,
+            )
         )
 
 
@@ -53,16 +101,18 @@ async def on_raw_reaction_add(payload):
 async def on_raw_reaction_remove(payload):
     """Handle removing messages from inbox when users remove the inbox emoji"""
     if payload.emoji.name == INBOX_EMOJI:
-        # Remove the inbox item
-        items = InboxItem.objects.filter(
-            message_id=str(payload.message_id),
-            user_id=str(payload.user_id),
-        )
-        await items.adelete()
+        # Remove the inbox item, with the next flush of the buffer
+        inbox_buffer.remove(str(payload.user_id), str(payload.message_id))
+
+
+@bot.event
+async def on_raw_message_edit(payload):
+    """Make sure edited messages are added to inboxes with the new content"""
+    message_cache.invalidate(payload.message_id)
 
 
 @bot.command()
-async def inbox(ctx):
+async def inbox(ctx, *, filters: InboxFlags | None = None):
     """
     Displays the content of the inbox for the user that calls the command.
 
@@ -71,25 +121,33 @@ async def inbox(ctx):
 
     It retuns all tracked messages, starting from the one most recently saved
     (a message that was most recently tagged with inbox emoji, not the message
-    that was most recently sent).
+    that was most recently sent), one page at a time (see core.bot.inbox).
+
+    Messages can be filtered, like `!inbox channel: #general since: 2025-01-31`
     """
     user_id = str(ctx.message.author.id)
-    inbox_items = InboxItem.objects.filter(user_id=user_id).order_by("-created_at")
 
-    # Use async query
-    if not await inbox_items.aexists():
-        await ctx.send("Your inbox is empty.")
+    # Include the messages that were just added (or removed)
+    await inbox_buffer.flush()
+
+    try:
+        inbox_filters = InboxFilters.from_flags(filters)
+    except ValueError as e:
+        await ctx.send(str(e))
         return
 
-    msg = "Currently tracking the following messages:\n"
+    page = await sync_to_async(inbox_page)(user_id, inbox_filters)
+
+    if not page.items:
+        await ctx.send("Your inbox is empty.")
+        return
 
-    async for item in inbox_items:
-        msg += "* " + item.summary() + "\n"
+    if not page.has_next:
+        await ctx.send(embed=discord.Embed(description=page.description()))
+        return
 
-    # Create an embed to display the inbox
-    embed = discord.Embed()
-    embed.description = msg
-    await ctx.send(embed=embed)
+    view = InboxView(user_id, inbox_filters, page)
+    await ctx.send(embed=view.embed(), view=view)
 
 
 @bot.command()
@@ -175,27 +233,86 @@ async def qlen(ctx):
 
 
 def get_messages():
-    messages = DiscordMessage.objects.filter(sent_at__isnull=True)
+    messages = DiscordMessage.objects.filter(
+        sent_at__isnull=True,
+        dead_at__isnull=True,
+    ).order_by("created_at")
     return messages
 
 
-@tasks.loop(seconds=60)  # Seconds
+# Messages are claimed before sending, so even if the listener and the
+# polling loop pick up the same message, only one of them sends it. The lock
+# is there to keep the order of the messages within a channel.
+sending_lock = asyncio.Lock()
+sender = ChannelSender(bot)
+claimed_by = default_claimed_by()
+
+
+async def send_messages(messages):
+    async with sending_lock:
+        # Messages are claimed in batches, keep going while there's progress
+        while await deliver(sender, messages, claimed_by):
+            pass
+
+
+async def send_new_messages(pks: list[int]):
+    """Send just the messages we got notified about"""
+    await send_messages(get_messages().filter(pk__in=pks))
+
+
+@tasks.loop(seconds=5)
+async def listen_to_database():
+    """
+    Send new messages as soon as they are created.
+
+    Returns only if the connection to the database is lost, in which case the
+    loop reconnects on the next iteration.
+    """
+    await listen_for_new_messages(send_new_messages)
+
+
+@tasks.loop(minutes=5)
 async def poll_database():
-    """Check for unsent messages and send them."""
+    """
+    Check for unsent messages and send them.
+
+    New messages are normally sent as soon as we get notified about them (see
+    listen_to_database), this is a fallback for everything that was missed.
+    """
     messages = get_messages()
     print("Polling database.... ", timezone.now())
 
-    async for message in messages:
-        channel = bot.get_channel(int(message.channel_id))
-        if channel:
-            await channel.send(
-                message.content,
-                suppress_embeds=True,
-            )
-            message.sent_at = timezone.now()
-            await message.asave()
-        else:
-            print("Channel does not exist!")
+    await send_messages(messages)
+
+
+@tasks.loop(seconds=BACKOFF_BASE.total_seconds())
+async def retry_failed_messages():
+    """
+    Send messages that failed to send before, once their next attempt is due.
+
+    The first retry is due BACKOFF_BASE after the failure, much sooner than
+    the next polling round.
+    """
+    await send_messages(get_messages().filter(attempts__gt=0))
+
+
+@bot.command()
+async def latency(ctx):
+    """
+    Returns end-to-end latency (from scheduling to sending) of recent messages
+    """
+    stats = await recent_latency_stats()
+
+    if not stats:
+        await ctx.send("No messages were sent yet")
+        return
+
+    await ctx.send(
+        f"Last {stats['count']} messages: "
+        f"median {stats['median']:.3f}s, "
+        f"p95 {stats['p95']:.3f}s, "
+        f"max {stats['max']:.3f}s"
+    )
 
 
 @bot.command()
@@ -229,19 +346,16 @@ async def products(ctx):
 
 @bot.command()
 async def submissions_status(ctx):
-    df = await sync_to_async(latest_flat_submissions_data)()
-    by_state = group_submissions_by_state(df)
+    by_state = await sync_to_async(latest_submissions_by_state)()
 
     await ctx.send(f"```{str(by_state)}```")
 
 
 @bot.command()
 async def submissions_status_pie_chart(ctx):
-    df = await sync_to_async(latest_flat_submissions_data)()
-    by_state = group_submissions_by_state(df)
-    piechart = piechart_submissions_by_state(by_state)
-
-    png_bytes = piechart.to_image(format="png")
+    png_bytes = await sync_to_async(latest_submissions_chart)(
+        "submissions_by_state", "png"
+    )
     file = discord.File(io.BytesIO(png_bytes), filename="submissions_by_state.png")
 
     await ctx.send(file=file)
@@ -1,14 +1,102 @@
 import hashlib
 import hmac
 import json
+import threading
+from collections import OrderedDict
 
 from core.models import Webhook
-from core.tasks import process_webhook
+from core.tasks import enqueue_github_webhook, process_webhook, process_webhooks
 from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.http import HttpResponseForbidden
 from django.http.response import HttpResponseNotAllowed, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
+# Upper limit of events accepted in a single batch request
+BATCH_MAX_SIZE = 1000
+
+# Number of webhooks processed by a single task scheduled from the batch
+# endpoint
+BATCH_TASK_SIZE = 100
+
+
+class RecentWebhooks:
+    """
+    Small, in-process, LRU cache of dedup keys of recently stored webhooks
+    (and their uuids).
+
+    Duplicates are usually delivered shortly after the original, so most of
+    them are acknowledged from here, without touching the database. The unique
+    index on Webhook.dedup_key catches everything else.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._uuids: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            if key in self._uuids:
+                self._uuids.move_to_end(key)
+                return self._uuids[key]
+
+        return None
+
+    def add(self, key: str, uuid: str) -> None:
+        with self._lock:
+            self._uuids[key] = uuid
+            self._uuids.move_to_end(key)
+
+            if len(self._uuids) > self.maxsize:
+                self._uuids.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._uuids.clear()
+
+
+recent_webhooks = RecentWebhooks()
+
+
+def store_webhook(dedup_key: str, **fields) -> tuple[str, bool]:
+    """
+    Store (and schedule processing of) the webhook, unless a webhook with the
+    same dedup_key was already stored.
+
+    Returns uuid of the webhook, and whether it was created.
+    """
+    if uuid := recent_webhooks.get(dedup_key):
+        return uuid, False
+
+    try:
+        with transaction.atomic():
+            wh = Webhook.objects.create(dedup_key=dedup_key, **fields)
+    except IntegrityError:
+        wh = Webhook.objects.get(dedup_key=dedup_key)
+        recent_webhooks.add(dedup_key, str(wh.uuid))
+        return str(wh.uuid), False
+
+    recent_webhooks.add(dedup_key, str(wh.uuid))
+
+    # Schedule a task for the worker to process the webhook outside of
+    # request/response cycle. GitHub webhooks often come in bursts, so they
+    # are processed together.
+    if wh.source == "github":
+        enqueue_github_webhook()
+    else:
+        process_webhook.enqueue(str(wh.uuid))
+
+    return str(wh.uuid), True
+
+
+def webhook_response(uuid: str, created: bool) -> JsonResponse:
+    return JsonResponse({"status": "created" if created else "duplicate", "guid": uuid})
+
+
+def content_dedup_key(source: str, body: bytes) -> str:
+    return f"{source}:sha256:{hashlib.sha256(body).hexdigest()}"
+
 
 @csrf_exempt
 def internal_webhook_endpoint(request):
@@ -32,6 +120,65 @@ def internal_webhook_endpoint(request):
     return HttpResponseNotAllowed("Only POST")
 
 
+@csrf_exempt
+def internal_webhook_batch_endpoint(request):
+    """
+    Same as internal_webhook_endpoint, but for many events at once.
+
+    Accepts either a JSON array of events, or NDJSON (one event per line, with
+    Content-Type: application/x-ndjson). All the webhooks are inserted with a
+    single query, and processed in batches of BATCH_TASK_SIZE.
+    """
+    if request.method == "POST":
+        try:
+            verify_internal_webhook(request)
+        except ValueError as e:
+            return JsonResponse({"status": "bad", "message": str(e)}, status=403)
+
+        try:
+            events = parse_webhook_batch(request)
+        except ValueError as e:
+            return JsonResponse({"status": "bad", "message": str(e)}, status=400)
+
+        webhooks = Webhook.objects.bulk_create(
+            [Webhook(source="internal", content=event, extra={}) for event in events]
+        )
+        uuids = [str(wh.uuid) for wh in webhooks]
+
+        # Schedule tasks for the worker to process the webhooks outside of
+        # request/response cycle.
+        for i in range(0, len(uuids), BATCH_TASK_SIZE):
+            process_webhooks.enqueue(uuids[i : i + BATCH_TASK_SIZE])
+
+        return JsonResponse({"status": "created", "guids": uuids})
+
+    return HttpResponseNotAllowed(permitted_methods=["POST"])
+
+
+def parse_webhook_batch(request) -> list:
+    """raise ValueError if the body is not a valid batch of events"""
+
+    try:
+        if request.content_type == "application/x-ndjson":
+            lines = request.body.decode("utf-8").splitlines()
+            events = [json.loads(line) for line in lines if line.strip()]
+        else:
+            events = json.loads(request.body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid JSON: {e}") from e
+
+    if not isinstance(events, list):
+        raise ValueError("Expected a list of events")
+
+    if not events:
+        raise ValueError("No events in the batch")
+
+    if len(events) > BATCH_MAX_SIZE:
+        raise ValueError(f"Too many events, at most {BATCH_MAX_SIZE} per batch")
+
+    return events
+
+
 def verify_internal_webhook(request):
     """raise ValueError if incorrect token"""
 
@@ -56,17 +203,21 @@ def github_webhook_endpoint(request):
             k: v for k, v in request.headers.items() if k.startswith("X-Github")
         }
 
-        wh = Webhook.objects.create(
+        # Redeliveries (automatic or manual) keep the original delivery id
+        if delivery := request.headers.get("X-Github-Delivery"):
+            dedup_key = f"github:{delivery}"
+        else:
+            dedup_key = content_dedup_key("github", request.body)
+
+        uuid, created = store_webhook(
+            dedup_key,
             source="github",
             meta=github_headers,
             signature=signature,
             content=json.loads(request.body),
             extra={},
         )
-        # Schedule a task for the worker to process the webhook outside of
-        # request/response cycle.
-        process_webhook.enqueue(str(wh.uuid))
-        return JsonResponse({"status": "created", "guid": wh.uuid})
+        return webhook_response(uuid, created)
 
     return HttpResponseNotAllowed("Only POST")
 
@@ -105,17 +256,17 @@ def zammad_webhook_endpoint(request):
             k: v for k, v in request.headers.items() if k.startswith("X-Zammad")
         }
 
-        wh = Webhook.objects.create(
+        # Triggers that fire twice send the same payload as separate
+        # deliveries, so the payload is the only thing to go by.
+        uuid, created = store_webhook(
+            content_dedup_key("zammad", request.body),
             source="zammad",
             meta=zammad_headers,
             signature=signature,
             content=json.loads(request.body),
             extra={},
         )
-        # Schedule a task for the worker to process the webhook outside of
-        # request/response cycle.
-        process_webhook.enqueue(str(wh.uuid))
-        return JsonResponse({"status": "created", "guid": wh.uuid})
+        return webhook_response(uuid, created)
 
     return HttpResponseNotAllowed(permitted_methods=["POST"])
 
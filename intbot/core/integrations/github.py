@@ -8,13 +8,18 @@ This is split into three parts.
 3. Proces webhook - usually means create a discord message with a notification
 """
 
+import logging
+import math
 from typing import Any
 
-import httpx
+from core.integrations.http import get_client
 from core.models import Webhook
 from django.conf import settings
+from django.core.cache import cache
 from pydantic import BaseModel
 
+logger = logging.getLogger(__name__)
+
 GITHUB_API_URL = "https://api.github.com/graphql"
 
 # GraphQL query
@@ -45,6 +50,44 @@ query($itemId: ID!) {
 }
 """
 
+# Same as above, but for many items at once
+project_items_details_query = """
+query($itemIds: [ID!]!) {
+  nodes(ids: $itemIds) {
+    ... on ProjectV2Item {
+      id
+      project {
+          id
+          title
+          url
+      }
+      content {
+        __typename
+        ... on DraftIssue {
+          id
+          title
+        }
+        ... on Issue {
+          id
+          title
+          url
+        }
+      }
+    }
+  }
+}
+"""
+
+# GitHub doesn't accept more than 100 ids in a single nodes(ids: ...) query
+GITHUB_NODES_BATCH_SIZE = 100
+
+# Project items (titles and urls of the project and the issue) rarely change
+# between consecutive edits - it's mostly the fields that change, and those
+# are in the webhook anyway. So they are cached for a while, in Django's
+# cache, which is shared by all the worker processes.
+PROJECT_ITEM_CACHE_PREFIX = "github:project_item:"
+PROJECT_ITEM_CACHE_TTL = 60 * 60
+
 
 class GithubRepositories:
     website_repo = ...
@@ -148,7 +191,8 @@ class GithubProjectV2Item(GithubWebhook):
         return GithubSender.model_validate(self.content["sender"])
 
     def github_object(self) -> GithubDraftIssue | GithubIssue:
-        content = self.extra["content"]
+        # Copy, so that we don't modify the webhook, and can call it again.
+        content = dict(self.extra["content"])
         typename = content.pop("__typename")
 
         if typename == "Issue":
@@ -198,45 +242,210 @@ class GithubProjectV2Item(GithubWebhook):
             "to": changed_to,
         }
 
-    def as_discord_message(self) -> str:
-        message = "{sender} {action} {details}".format
+    def node_id(self) -> str:
+        return self.content["projects_v2_item"]["node_id"]
 
+    def as_discord_message(self) -> str:
         changes = self.changes()
 
         if changes:
-            details = "**{field}** of **{obj}** from **{from}** to **{to}**".format(
-                **{"obj": self.github_object().as_discord_message(), **changes}
-            )
-
-        else:
-            details = self.github_object().as_discord_message()
+            return self.field_change_template().format(**changes)
 
-        return message(
+        return "{sender} {action} {details}".format(
             **{
                 "sender": self.sender,
                 "action": self.short_action(),
-                "details": details,
+                "details": self.github_object().as_discord_message(),
             }
         )
 
+    def field_change_template(self, prefix: str = "") -> str:
+        """
+        Message about a change of a field, with `{from}` and `{to}` left as
+        placeholders to fill in.
+        """
+        head = "{prefix}{sender} {action} **{field}** of **{obj}**".format(
+            prefix=prefix,
+            sender=self.sender,
+            action=self.short_action(),
+            field=self.changes()["field"],
+            obj=self.github_object().as_discord_message(),
+        )
+        # Escape braces coming from titles, so that they are not treated as
+        # placeholders.
+        head = head.replace("{", "{{").replace("}", "}}")
+
+        return head + " from **{from}** to **{to}**"
+
+    def as_discord_message_meta(self, prefix: str = "") -> dict:
+        """
+        Extra information for the DiscordMessage, so that successive changes
+        of the same field of the same item can be collapsed into one line
+        before sending (see core.bot.delivery.coalesce).
+        """
+        changes = self.changes()
+
+        if not changes:
+            return {}
+
+        return {
+            "coalesce_key": f"github:{self.node_id()}:{changes['field']}",
+            "template": self.field_change_template(prefix=prefix),
+            "from": changes["from"],
+            "to": changes["to"],
+        }
+
 
 def prep_github_webhook(wh: Webhook):
     """
     Downloads the extra data that is missing in the webhook but needed for processing.
+
+    Skips the download if the data was already prefetched (see
+    prefetch_github_project_items).
     """
     event = wh.meta["X-Github-Event"]
 
     if event == "projects_v2_item":
-        node_id = wh.content["projects_v2_item"]["node_id"]
-        project_item = fetch_github_project_item(node_id)
+        if not wh.extra:
+            node_id = wh.content["projects_v2_item"]["node_id"]
+            if project_item_changed(wh.content):
+                invalidate_github_project_item(node_id)
+            wh.extra = get_github_project_item(node_id)
         wh.event = f"{event}.{wh.content['action']}"
-        wh.extra = project_item
-        wh.save()
         return wh
 
     raise ValueError(f"Event `{event}` not supported")
 
 
+def prefetch_github_project_items(webhooks: list[Webhook]) -> None:
+    """
+    Download the extra data for many projects_v2_item webhooks at once, for
+    example when a project board was bulk-edited.
+
+    Webhooks that couldn't be prefetched are left as they are, so
+    prep_github_webhook downloads (and fails) for each of them separately.
+    """
+    webhooks = [
+        wh
+        for wh in webhooks
+        if not wh.extra and wh.meta.get("X-Github-Event") == "projects_v2_item"
+    ]
+    node_ids = [wh.content["projects_v2_item"]["node_id"] for wh in webhooks]
+
+    if not node_ids:
+        return
+
+    for wh, node_id in zip(webhooks, node_ids):
+        if project_item_changed(wh.content):
+            invalidate_github_project_item(node_id)
+
+    try:
+        project_items = get_github_project_items(node_ids)
+    except GithubAPIError:
+        logger.exception("Failed to prefetch %s project items", len(node_ids))
+        return
+
+    for wh, node_id in zip(webhooks, node_ids):
+        if node_id in project_items:
+            wh.extra = project_items[node_id]
+
+
+def project_item_cache_key(item_id: str) -> str:
+    return f"{PROJECT_ITEM_CACHE_PREFIX}{item_id}"
+
+
+def project_item_changed(content: dict) -> bool:
+    """
+    Does the webhook say that the cached project item is out of date?
+
+    This happens when the title (of a draft issue) was changed, or when the
+    item itself was converted (from a draft to an issue), deleted, or restored.
+    """
+    if content.get("action") in ("converted", "deleted", "restored"):
+        return True
+
+    field_value = content.get("changes", {}).get("field_value", {})
+    return field_value.get("field_name") == "Title"
+
+
+def invalidate_github_project_item(item_id: str) -> None:
+    cache.delete(project_item_cache_key(item_id))
+
+
+def count_project_item_cache(result: str, count: int = 1) -> None:
+    """
+    Counters of cache hits and misses (and requests saved by batching),
+    shared like the cache itself
+    """
+    if not count:
+        return
+
+    key = f"{PROJECT_ITEM_CACHE_PREFIX}stats:{result}"
+    try:
+        cache.incr(key, count)
+    except ValueError:
+        cache.set(key, count, timeout=None)
+
+
+def project_item_cache_stats() -> dict[str, int]:
+    """
+    How many GraphQL lookups were avoided (hits) and made (misses) thanks to
+    the cache, and how many requests to GitHub were saved by looking up many
+    project items at once (saved_requests)
+    """
+    return {
+        result: cache.get(f"{PROJECT_ITEM_CACHE_PREFIX}stats:{result}", 0)
+        for result in ["hits", "misses", "saved_requests"]
+    }
+
+
+def get_github_project_item(item_id: str) -> dict[str, Any]:
+    """Cached version of fetch_github_project_item"""
+    key = project_item_cache_key(item_id)
+
+    if (project_item := cache.get(key)) is not None:
+        count_project_item_cache("hits")
+        return project_item
+
+    count_project_item_cache("misses")
+    project_item = fetch_github_project_item(item_id)
+
+    if project_item is not None:
+        cache.set(key, project_item, PROJECT_ITEM_CACHE_TTL)
+
+    return project_item
+
+
+def get_github_project_items(item_ids: list[str]) -> dict[str, dict[str, Any]]:
+    """Cached version of fetch_github_project_items"""
+    item_ids = list(dict.fromkeys(item_ids))
+    cached = cache.get_many([project_item_cache_key(i) for i in item_ids])
+
+    project_items = {}
+    missing = []
+    for item_id in item_ids:
+        if (key := project_item_cache_key(item_id)) in cached:
+            project_items[item_id] = cached[key]
+        else:
+            missing.append(item_id)
+
+    count_project_item_cache("hits", len(project_items))
+    count_project_item_cache("misses", len(missing))
+
+    if missing:
+        fetched = fetch_github_project_items(missing)
+        requests = math.ceil(len(missing) / GITHUB_NODES_BATCH_SIZE)
+        count_project_item_cache("saved_requests", len(missing) - requests)
+        logger.info("Fetched %s project items with %s requests", len(missing), requests)
+        cache.set_many(
+            {project_item_cache_key(i): item for i, item in fetched.items()},
+            PROJECT_ITEM_CACHE_TTL,
+        )
+        project_items.update(fetched)
+
+    return project_items
+
+
 class GithubAPIError(Exception):
     """Custom exception for GithubAPI Errors"""
 
@@ -251,7 +460,9 @@ def fetch_github_project_item(item_id: str) -> dict[str, Any]:
         "Content-Type": "application/json",
     }
     payload = {"query": project_item_details_query, "variables": {"itemId": item_id}}
-    response = httpx.post(GITHUB_API_URL, json=payload, headers=headers)
+    response = get_client(GITHUB_API_URL).post(
+        GITHUB_API_URL, json=payload, headers=headers
+    )
 
     if response.status_code == 200:
         return response.json()["data"]["node"]
@@ -261,6 +472,46 @@ def fetch_github_project_item(item_id: str) -> dict[str, Any]:
         )
 
 
+def fetch_github_project_items(item_ids: list[str]) -> dict[str, dict[str, Any]]:
+    """
+    Batched version of fetch_github_project_item: one request per (up to)
+    GITHUB_NODES_BATCH_SIZE items.
+
+    Returns project items by their id. Items that GitHub couldn't resolve
+    (for example, because they were deleted in the meantime) are missing.
+    """
+    headers = {
+        "Authorization": f"Bearer {settings.GITHUB_API_TOKEN}",
+        "Content-Type": "application/json",
+    }
+    item_ids = list(dict.fromkeys(item_ids))
+    project_items = {}
+
+    for i in range(0, len(item_ids), GITHUB_NODES_BATCH_SIZE):
+        batch = item_ids[i : i + GITHUB_NODES_BATCH_SIZE]
+        payload = {
+            "query": project_items_details_query,
+            "variables": {"itemIds": batch},
+        }
+        response = get_client(GITHUB_API_URL).post(
+            GITHUB_API_URL, json=payload, headers=headers
+        )
+
+        if response.status_code != 200:
+            raise GithubAPIError(
+                f"GitHub API error: {response.status_code} - {response.text}"
+            )
+
+        # Nodes come back in the same order as the ids, with nulls for the
+        # ones that couldn't be resolved.
+        nodes = response.json()["data"]["nodes"]
+        for item_id, node in zip(batch, nodes):
+            if node is not None:
+                project_items[item_id] = node
+
+    return project_items
+
+
 def parse_github_webhook(wh: Webhook):
     event = wh.meta["X-Github-Event"]
     if not wh.extra:
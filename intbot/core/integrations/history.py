@@ -0,0 +1,306 @@
+"""
+Delta-encoded history of the pretix orders.
+
+To analyze sales over time, we used to keep every daily download of all the
+orders - and looking at any trend meant decoding every one of them.
+
+The history keeps all the orders only once in a while, in keyframes
+(downloads at least KEYFRAME_INTERVAL apart), and for every download the
+changes since the previous one - orders added, changed or removed, by their
+code - as PretixOrderChange rows. So:
+
+- reconstruct_orders gets all the orders at any point in time, from the
+  latest keyframe before it, and the changes since then.
+- iter_order_changes goes through the changes in the order they happened,
+  so how the orders evolved over the last 30 days is a single pass over the
+  changes, instead of decoding 30 downloads.
+
+The changes are computed by the database, from the jsonb of the downloads,
+so recording a download (on every run of the cron) doesn't load any orders
+into memory.
+
+Once recorded, downloads of orders that aren't keyframes are not needed
+anymore, and can be removed with prune_orders_history.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Iterator
+
+from core.models import PretixData, PretixOrderChange, PretixOrderHistory
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+KEYFRAME_INTERVAL = timedelta(days=7)
+
+# Number of changes written, or read, with a single query
+CHANGES_BATCH_SIZE = 1000
+
+JsonType = dict[str, Any]
+
+# Orders by their code
+Orders = dict[str, JsonType]
+
+
+def orders_by_code(content: list[JsonType]) -> Orders:
+    return {order["code"]: order for order in content}
+
+
+def iter_order_changes(
+    event: str,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> Iterator[PretixOrderChange]:
+    """
+    Changes of the orders downloaded after `since`, and up to `until` (both
+    optional), in the order they happened - loaded in batches, instead of
+    all at once.
+    """
+    changes = PretixOrderChange.objects.filter(event=event)
+
+    if since:
+        changes = changes.filter(downloaded_at__gt=since)
+    if until:
+        changes = changes.filter(downloaded_at__lte=until)
+
+    return changes.order_by("downloaded_at", "pk").iterator(
+        chunk_size=CHANGES_BATCH_SIZE
+    )
+
+
+def reconstruct_orders(event: str, at: datetime) -> Orders:
+    """
+    All the orders of the `event`, as they were in the last download recorded
+    up to `at` - empty if there is none.
+    """
+    keyframe = (
+        PretixOrderHistory.objects.filter(
+            event=event,
+            keyframe=True,
+            downloaded_at__lte=at,
+        )
+        .order_by("-downloaded_at")
+        .first()
+    )
+
+    if keyframe is None:
+        return {}
+
+    if keyframe.download is None:
+        raise ValueError(f"Download of the keyframe {keyframe} was removed")
+
+    orders = orders_by_code(keyframe.download.original().content)
+
+    for change in iter_order_changes(event, since=keyframe.downloaded_at, until=at):
+        if change.kind == PretixOrderChange.Kind.removed:
+            orders.pop(change.code, None)
+        else:
+            orders[change.code] = change.order
+
+    return orders
+
+
+# Changes between the last recorded download (the latest keyframe, and the
+# latest change of every order since then), and the new one - computed by
+# the database, from the jsonb of both downloads, so that the orders are
+# never loaded into memory.
+RECORD_CHANGES_SQL = """
+    WITH after AS (
+        SELECT item->>'code' AS code, item AS "order"
+        FROM {data}, jsonb_array_elements(content) AS item
+        WHERE id = %(download)s
+    ),
+    keyframe AS (
+        SELECT item->>'code' AS code, item AS "order"
+        FROM {data}, jsonb_array_elements(content) AS item
+        WHERE id = %(keyframe)s
+    ),
+    latest_changes AS (
+        SELECT DISTINCT ON (code) code, kind, "order"
+        FROM {changes}
+        WHERE event = %(event)s AND downloaded_at > %(since)s
+        ORDER BY code, downloaded_at DESC, id DESC
+    ),
+    before AS (
+        SELECT code, "order" FROM keyframe
+        WHERE code NOT IN (SELECT code FROM latest_changes)
+        UNION ALL
+        SELECT code, "order" FROM latest_changes WHERE kind <> 'removed'
+    ),
+    inserted AS (
+        INSERT INTO {changes} (history_id, event, code, kind, "order", downloaded_at)
+        SELECT
+            %(history)s,
+            %(event)s,
+            COALESCE(after.code, before.code),
+            CASE
+                WHEN before.code IS NULL THEN 'added'
+                WHEN after.code IS NULL THEN 'removed'
+                ELSE 'changed'
+            END,
+            after."order",
+            %(downloaded_at)s
+        FROM after FULL JOIN before ON after.code = before.code
+        WHERE after."order" IS DISTINCT FROM before."order"
+        RETURNING kind
+    )
+    SELECT kind, count(*) FROM inserted GROUP BY kind
+"""
+
+
+def save_history(pretix_data: PretixData) -> PretixOrderHistory:
+    """Record changes between the last recorded download and this one"""
+    event = pretix_data.event
+    downloaded_at = pretix_data.created_at
+
+    last_keyframe = (
+        PretixOrderHistory.objects.filter(event=event, keyframe=True)
+        .order_by("-downloaded_at")
+        .first()
+    )
+    keyframe = (
+        last_keyframe is None
+        or downloaded_at - last_keyframe.downloaded_at >= KEYFRAME_INTERVAL
+    )
+
+    keyframe_download = None
+    if last_keyframe:
+        keyframe_download = (
+            PretixData.objects.defer("content")
+            .get(pk=last_keyframe.download_id)
+            .original()
+        )
+
+    with transaction.atomic():
+        history = PretixOrderHistory.objects.create(
+            event=event,
+            download=pretix_data,
+            downloaded_at=downloaded_at,
+            keyframe=keyframe,
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                RECORD_CHANGES_SQL.format(
+                    data=PretixData._meta.db_table,
+                    changes=PretixOrderChange._meta.db_table,
+                ),
+                {
+                    "download": pretix_data.same_as_id or pretix_data.pk,
+                    "keyframe": keyframe_download.pk if keyframe_download else None,
+                    "since": last_keyframe.downloaded_at if last_keyframe else None,
+                    "event": event,
+                    "history": history.pk,
+                    "downloaded_at": downloaded_at,
+                },
+            )
+            counts = dict(cursor.fetchall())
+
+        history.added = counts.get(PretixOrderChange.Kind.added, 0)
+        history.changed = counts.get(PretixOrderChange.Kind.changed, 0)
+        history.removed = counts.get(PretixOrderChange.Kind.removed, 0)
+        history.save(update_fields=["added", "changed", "removed"])
+
+    logger.info(
+        "Recorded %s changes of %s orders (keyframe: %s)",
+        history.added + history.changed + history.removed,
+        event,
+        keyframe,
+    )
+
+    return history
+
+
+def record_orders_history(pretix_data: PretixData) -> PretixOrderHistory | None:
+    """
+    Record a new download of the orders in the history.
+
+    Downloads that are not newer than the last recorded one (like unchanged
+    downloads - see core.integrations.storage) are skipped, and return None.
+    """
+    last = (
+        PretixOrderHistory.objects.filter(event=pretix_data.event)
+        .order_by("-downloaded_at")
+        .first()
+    )
+
+    if last and pretix_data.created_at <= last.downloaded_at:
+        return None
+
+    return save_history(pretix_data)
+
+
+def backfill_orders_history(event: str) -> int:
+    """
+    Record all the downloads of orders of the `event` that are newer than the
+    last recorded one, in the order they were downloaded.
+
+    Returns number of recorded downloads.
+    """
+    downloads = PretixData.objects.filter(
+        event=event,
+        resource=PretixData.PretixResources.orders,
+        # Unchanged downloads have nothing to record
+        same_as=None,
+    )
+
+    last = (
+        PretixOrderHistory.objects.filter(event=event)
+        .order_by("-downloaded_at")
+        .first()
+    )
+    if last:
+        downloads = downloads.filter(created_at__gt=last.downloaded_at)
+
+    count = 0
+    for pretix_data in downloads.defer("content").order_by("created_at"):
+        save_history(pretix_data)
+        count += 1
+
+    return count
+
+
+def prune_orders_history(event: str) -> int:
+    """
+    Remove downloads of orders of the `event`, that are recorded in the
+    history and not needed anymore - all of them except the keyframes, and
+    the latest download (that update_pretix_tables loads into the tables).
+
+    Returns number of removed downloads.
+    """
+    orders = PretixData.objects.filter(
+        event=event,
+        resource=PretixData.PretixResources.orders,
+    )
+    latest = orders.defer("content").order_by("-created_at").first()
+    if latest is None:
+        return 0
+
+    keyframes = PretixOrderHistory.objects.filter(event=event, keyframe=True)
+    keep = {latest.pk, latest.same_as_id}
+    for pk, same_as_id in orders.filter(
+        pk__in=keyframes.values("download")
+    ).values_list("pk", "same_as_id"):
+        keep |= {pk, same_as_id}
+    keep.discard(None)
+
+    recorded = PretixOrderHistory.objects.filter(event=event, keyframe=False)
+    prunable = set(
+        orders.filter(pk__in=recorded.values("download")).values_list("pk", flat=True)
+    )
+    prunable -= keep
+
+    with transaction.atomic():
+        # Markers of unchanged downloads first, so that the downloads they
+        # point at can be removed too
+        markers = orders.filter(same_as__in=prunable).exclude(pk__in=keep)
+        recorded.filter(download__in=markers).update(download=None)
+        _, markers = markers.delete()
+
+        downloads = orders.filter(pk__in=prunable, duplicates=None)
+        recorded.filter(download__in=downloads).update(download=None)
+        _, downloads = downloads.delete()
+
+    label = PretixData._meta.label
+    return markers.get(label, 0) + downloads.get(label, 0)
@@ -0,0 +1,119 @@
+"""
+Shared HTTP clients for all the integrations.
+
+Module level httpx.get/post open a new connection (TCP + TLS handshake) for
+every single request, which adds up quickly with paginated APIs. Instead,
+integrations get a long lived client per upstream host, that keeps the
+connections alive between requests.
+
+Clients are closed when the process exits.
+"""
+
+import asyncio
+import atexit
+import logging
+import threading
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_clients: dict[str, httpx.Client] = {}
+
+# AsyncClients can't be shared between event loops, so there is a separate
+# set of them for every loop (and they go away together with the loop).
+_async_clients: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]
+] = weakref.WeakKeyDictionary()
+
+
+def client_options() -> dict:
+    return {
+        "timeout": httpx.Timeout(
+            settings.HTTP_CLIENT_TIMEOUT,
+            connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT,
+        ),
+        "limits": httpx.Limits(
+            max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+def get_host(url: str) -> str:
+    """Scheme, host and port of the url - one client per each of those"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_client(url: str) -> httpx.Client:
+    """Shared client for the host of the `url`"""
+    host = get_host(url)
+
+    with _lock:
+        if host not in _clients:
+            _clients[host] = httpx.Client(**client_options())
+
+        return _clients[host]
+
+
+def get_async_client(url: str) -> httpx.AsyncClient:
+    """
+    Shared async client for the host of the `url`, in the current event loop.
+    """
+    loop = asyncio.get_running_loop()
+    host = get_host(url)
+
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        if host not in clients:
+            clients[host] = httpx.AsyncClient(**client_options())
+
+        return clients[host]
+
+
+async def aclose_async_clients() -> None:
+    """Close the async clients of the current event loop"""
+    loop = asyncio.get_running_loop()
+
+    with _lock:
+        clients = list(_async_clients.pop(loop, {}).values())
+
+    for client in clients:
+        await client.aclose()
+
+
+def close_clients() -> None:
+    """
+    Close all the clients.
+
+    Async clients can be closed only in their own event loop, so this works
+    only for loops that are not running (or closed) anymore. For the running
+    ones, use aclose_async_clients.
+    """
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        async_clients = list(_async_clients.items())
+        _async_clients.clear()
+
+    for client in clients:
+        client.close()
+
+    for loop, loop_clients in async_clients:
+        if loop.is_closed() or loop.is_running():
+            continue
+
+        for async_client in loop_clients.values():
+            try:
+                loop.run_until_complete(async_client.aclose())
+            except Exception:
+                logger.exception("Failed to close %s", async_client)
+
+
+atexit.register(close_clients)
@@ -0,0 +1,137 @@
+"""
+Pagination for the Pretix and Pretalx APIs.
+
+By default the integrations follow the `next` links one page at a time. Both
+APIs also return the total `count` of results with the first page, so once
+we have it we know every other page upfront, and can fetch them at the same
+time (up to `max_concurrency` requests at once).
+
+Pages are put back together in order, so the result is the same as with
+the sequential download.
+"""
+
+import asyncio
+import logging
+import math
+from typing import Any, Iterator
+
+import httpx
+from core.integrations.http import aclose_async_clients, get_async_client, get_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 4
+
+JsonType = dict[str, Any]
+
+
+def iter_pages(url: str, headers: dict[str, str]) -> Iterator[list[JsonType]]:
+    """
+    Results of every page, one page at a time - so that streamed downloads
+    never keep more than a single page in memory.
+    """
+    page = 0
+
+    # This takes advantage of the fact that url will contain a url to the
+    # next page, until there is more data to fetch. If this is the last page,
+    # then the url will be None (falsy), and thus stop the while loop.
+    while url:
+        page += 1
+        response = get_client(url).get(url, headers=headers)
+
+        if response.status_code != 200:
+            raise Exception(f"Error {response.status_code}: {response.text}")
+
+        logger.info("Fetching data from %s, page %s", url, page)
+
+        data = response.json()
+        yield data["results"]
+        url = data["next"]
+
+
+def page_urls(url: str, first_page: JsonType) -> list[str]:
+    """
+    Urls of all the pages after the first one.
+
+    The `next` link of the first page says how the API paginates: either with
+    page numbers (?page=2), or with offsets (?limit=25&offset=25).
+    """
+    if not first_page["next"] or not first_page["results"]:
+        return []
+
+    page_size = len(first_page["results"])
+    pages = math.ceil(first_page["count"] / page_size)
+    next_url = httpx.URL(first_page["next"])
+
+    if "offset" in next_url.params:
+        limit = int(next_url.params.get("limit", page_size))
+        return [
+            str(next_url.copy_set_param("offset", offset))
+            for offset in range(limit, first_page["count"], limit)
+        ]
+
+    return [
+        str(httpx.URL(url).copy_set_param("page", page)) for page in range(2, pages + 1)
+    ]
+
+
+async def afetch_page(url: str, headers: dict[str, str]) -> JsonType:
+    response = await get_async_client(url).get(url, headers=headers)
+
+    if response.status_code != 200:
+        raise Exception(f"Error {response.status_code}: {response.text}")
+
+    logger.info("Fetched data from %s", url)
+
+    return response.json()
+
+
+async def afetch_all_pages(
+    url: str,
+    headers: dict[str, str],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+) -> list[JsonType]:
+    """Fetch the first page, and then all the other pages concurrently"""
+    first_page = await afetch_page(url, headers)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch(page_url: str) -> JsonType:
+        async with semaphore:
+            return await afetch_page(page_url, headers)
+
+    # gather keeps the order of the pages, no matter which ones finish first
+    pages = await asyncio.gather(
+        *[fetch(page_url) for page_url in page_urls(url, first_page)]
+    )
+
+    results = list(first_page["results"])
+    for page in pages:
+        results += page["results"]
+
+    # The data can change while we're downloading it, in which case some
+    # results can be missing or repeated - the next download fixes it.
+    if len(results) != first_page["count"]:
+        logger.warning(
+            "Expected %s results from %s, got %s",
+            first_page["count"],
+            url,
+            len(results),
+        )
+
+    return results
+
+
+def fetch_all_pages(
+    url: str,
+    headers: dict[str, str],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+) -> list[JsonType]:
+    """Sync version of afetch_all_pages, for the management commands"""
+
+    async def run():
+        try:
+            return await afetch_all_pages(url, headers, max_concurrency)
+        finally:
+            await aclose_async_clients()
+
+    return asyncio.run(run())
@@ -1,7 +1,9 @@
 import logging
-from typing import Any
+from typing import Any, Iterator
 
-import httpx
+from core.integrations.pagination import fetch_all_pages, iter_pages
+from core.integrations.storage import deduplicate
+from core.integrations.streaming import save_pages
 from core.models import PretalxData
 from django.conf import settings
 
@@ -31,59 +33,84 @@ def get_event_url(event: str) -> str:
     return f"https://pretalx.com/api/events/{event}/"
 
 
-def fetch_pretalx_data(
-    event: str, resource: PretalxData.PretalxResources
-) -> list[JsonType]:
-    headers = {
-        "Authorization": f"Token {settings.PRETALX_API_TOKEN}",
-        "Content-Type": "application/json",
-    }
-
+def get_resource_url(event: str, resource: PretalxData.PretalxResources) -> str:
     base_url = get_event_url(event)
     endpoint = ENDPOINTS[resource]
-    url = f"{base_url}{endpoint}"
-
-    # Pretalx paginates the output, so we will need to do multiple requests and
-    # then merge multiple pages to one big dictionary
-    results = []
-    page = 0
-
-    # This takes advantage of the fact that url will contain a url to the
-    # next page, until there is more data to fetch. If this is the last page,
-    # then the url will be None (falsy), and thus stop the while loop.
-    while url:
-        page += 1
-        response = httpx.get(url, headers=headers)
-
-        if response.status_code != 200:
-            raise Exception(f"Error {response.status_code}: {response.text}")
+    return f"{base_url}{endpoint}"
 
-        logger.info("Fetching data from %s, page %s", url, page)
-
-        data = response.json()
-        results += data["results"]
-        url = data["next"]
-
-    return results
 
+def get_headers() -> dict[str, str]:
+    return {
+        "Authorization": f"Token {settings.PRETALX_API_TOKEN}",
+        "Content-Type": "application/json",
+    }
 
-def download_latest_submissions(event: str) -> PretalxData:
-    data = fetch_pretalx_data(event, PretalxData.PretalxResources.submissions)
 
-    pretalx_data = PretalxData.objects.create(
-        resource=PretalxData.PretalxResources.submissions,
-        content=data,
-    )
+def fetch_pretalx_data(
+    event: str,
+    resource: PretalxData.PretalxResources,
+    max_concurrency: int | None = None,
+) -> list[JsonType]:
+    """
+    Download all the pages of the `resource`, one by one, or concurrently
+    (with up to `max_concurrency` requests at once) if it's set.
+    """
+    url = get_resource_url(event, resource)
 
-    return pretalx_data
+    if max_concurrency:
+        return fetch_all_pages(url, get_headers(), max_concurrency)
 
+    # Pretalx paginates the output, so we will need to do multiple requests and
+    # then merge multiple pages to one big list
+    results = []
+    for page in iter_pages(url, get_headers()):
+        results += page
 
-def download_latest_speakers(event: str) -> PretalxData:
-    data = fetch_pretalx_data(event, PretalxData.PretalxResources.speakers)
+    return results
 
-    pretalx_data = PretalxData.objects.create(
-        resource=PretalxData.PretalxResources.speakers,
-        content=data,
-    )
 
-    return pretalx_data
+def iter_pretalx_pages(
+    event: str, resource: PretalxData.PretalxResources
+) -> Iterator[list[JsonType]]:
+    """Same as fetch_pretalx_data, but one page at a time"""
+    return iter_pages(get_resource_url(event, resource), get_headers())
+
+
+def download_latest_submissions(
+    event: str, max_concurrency: int | None = None, stream: bool = False
+) -> PretalxData:
+    resource = PretalxData.PretalxResources.submissions
+
+    if stream:
+        pages = iter_pretalx_pages(event, resource)
+        pretalx_data = save_pages(PretalxData(event=event, resource=resource), pages)
+    else:
+        data = fetch_pretalx_data(event, resource, max_concurrency)
+        pretalx_data = PretalxData.objects.create(
+            event=event,
+            resource=resource,
+            content=data,
+        )
+
+    # Returns an earlier download instead, if nothing changed since then
+    return deduplicate(pretalx_data)
+
+
+def download_latest_speakers(
+    event: str, max_concurrency: int | None = None, stream: bool = False
+) -> PretalxData:
+    resource = PretalxData.PretalxResources.speakers
+
+    if stream:
+        pages = iter_pretalx_pages(event, resource)
+        pretalx_data = save_pages(PretalxData(event=event, resource=resource), pages)
+    else:
+        data = fetch_pretalx_data(event, resource, max_concurrency)
+        pretalx_data = PretalxData.objects.create(
+            event=event,
+            resource=resource,
+            content=data,
+        )
+
+    # Returns an earlier download instead, if nothing changed since then
+    return deduplicate(pretalx_data)
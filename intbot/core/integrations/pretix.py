@@ -1,9 +1,23 @@
 import logging
-from typing import Any
+from datetime import datetime
+from typing import Any, Iterable, Iterator
 
 import httpx
-from core.models import PretixData
+from core.integrations.pagination import fetch_all_pages, iter_pages
+from core.integrations.storage import deduplicate
+from core.integrations.streaming import iter_content, save_pages
+from core.models import (
+    PretixData,
+    PretixOrder,
+    PretixOrderPosition,
+    PretixProduct,
+    PretixSyncState,
+    PretixVoucher,
+)
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 logger = logging.getLogger(__name__)
 
@@ -31,70 +45,384 @@ def get_event_url(event: str) -> str:
     return f"{pretix_url}/api/v1/organizers/europython/events/{event}/"
 
 
-def fetch_pretix_data(
-    event: str, resource: PretixData.PretixResources
-) -> list[JsonType]:
-    headers = {
+def get_resource_url(
+    event: str,
+    resource: PretixData.PretixResources,
+    params: dict[str, str] | None = None,
+) -> str:
+    """
+    Url of the first page of the `resource`, `params` are added to the query
+    string (for example `modified_since`).
+    """
+    base_url = get_event_url(event)
+    endpoint = ENDPOINTS[resource]
+    url = f"{base_url}{endpoint}"
+
+    if params:
+        url = str(httpx.URL(url, params=params))
+
+    return url
+
+
+def get_headers() -> dict[str, str]:
+    return {
         "Authorization": f"Token {settings.PRETIX_API_TOKEN}",
         "Content-Type": "application/json",
     }
 
-    base_url = get_event_url(event)
-    endpoint = ENDPOINTS[resource]
-    url = f"{base_url}{endpoint}"
+
+def fetch_pretix_data(
+    event: str,
+    resource: PretixData.PretixResources,
+    max_concurrency: int | None = None,
+    params: dict[str, str] | None = None,
+) -> list[JsonType]:
+    """
+    Download all the pages of the `resource`, one by one, or concurrently
+    (with up to `max_concurrency` requests at once) if it's set.
+
+    `params` are added to the query string (for example `modified_since`).
+    """
+    url = get_resource_url(event, resource, params)
+
+    if max_concurrency:
+        return fetch_all_pages(url, get_headers(), max_concurrency)
 
     # Pretix paginates the output, so we will need to do multiple requests and
-    # then merge multiple pages to one big dictionary
+    # then merge multiple pages to one big list
     results = []
-    page = 0
+    for page in iter_pages(url, get_headers()):
+        results += page
+
+    return results
 
-    # This takes advantage of the fact that url will contain a url to the
-    # next page, until there is more data to fetch. If this is the last page,
-    # then the url will be None (falsy), and thus stop the while loop.
-    while url:
-        page += 1
-        response = httpx.get(url, headers=headers)
 
-        if response.status_code != 200:
-            raise Exception(f"Error {response.status_code}: {response.text}")
+def iter_pretix_pages(
+    event: str, resource: PretixData.PretixResources
+) -> Iterator[list[JsonType]]:
+    """Same as fetch_pretix_data, but one page at a time"""
+    return iter_pages(get_resource_url(event, resource), get_headers())
 
-        logger.info("Fetching data from %s, page %s", url, page)
 
-        data = response.json()
-        results += data["results"]
-        url = data["next"]
+def download_latest_orders(
+    event: str, max_concurrency: int | None = None, stream: bool = False
+) -> PretixData:
+    resource = PretixData.PretixResources.orders
 
-    return results
+    if stream:
+        pages = iter_pretix_pages(event, resource)
+        pretix_data = save_pages(PretixData(event=event, resource=resource), pages)
+    else:
+        data = fetch_pretix_data(event, resource, max_concurrency)
+        pretix_data = PretixData.objects.create(
+            event=event,
+            resource=resource,
+            content=data,
+        )
+
+    # Returns an earlier download instead, if nothing changed since then
+    return deduplicate(pretix_data)
+
+
+def download_latest_products(
+    event: str, max_concurrency: int | None = None, stream: bool = False
+) -> PretixData:
+    resource = PretixData.PretixResources.products
+
+    if stream:
+        pages = iter_pretix_pages(event, resource)
+        pretix_data = save_pages(PretixData(event=event, resource=resource), pages)
+    else:
+        data = fetch_pretix_data(event, resource, max_concurrency)
+        pretix_data = PretixData.objects.create(
+            event=event,
+            resource=resource,
+            content=data,
+        )
+
+    # Returns an earlier download instead, if nothing changed since then
+    return deduplicate(pretix_data)
+
+
+def download_latest_vouchers(
+    event: str, max_concurrency: int | None = None, stream: bool = False
+) -> PretixData:
+    resource = PretixData.PretixResources.vouchers
+
+    if stream:
+        pages = iter_pretix_pages(event, resource)
+        pretix_data = save_pages(PretixData(event=event, resource=resource), pages)
+    else:
+        data = fetch_pretix_data(event, resource, max_concurrency)
+        pretix_data = PretixData.objects.create(
+            event=event,
+            resource=resource,
+            content=data,
+        )
+
+    # Returns an earlier download instead, if nothing changed since then
+    return deduplicate(pretix_data)
+
+
+# Number of rows written to the database with a single query
+SYNC_BATCH_SIZE = 500
+
+
+def parse_optional_datetime(value: str | None) -> datetime | None:
+    return parse_datetime(value) if value else None
+
+
+def localised(value: str | dict) -> str:
+    """Pretix returns some of the fields in all the languages of the event"""
+    if isinstance(value, dict):
+        return value.get("en") or next(iter(value.values()), "")
+
+    return value
+
+
+def order_from_json(event: str, order: JsonType) -> PretixOrder:
+    return PretixOrder(
+        event=event,
+        code=order["code"],
+        status=order["status"],
+        email=order.get("email") or "",
+        total=order.get("total") or 0,
+        datetime=parse_optional_datetime(order.get("datetime")),
+        last_modified=parse_optional_datetime(order.get("last_modified")),
+        content=order,
+    )
+
+
+def position_from_json(order: PretixOrder, position: JsonType) -> PretixOrderPosition:
+    return PretixOrderPosition(
+        order=order,
+        event=order.event,
+        pretix_id=position["id"],
+        item_id=position["item"],
+        variation_id=position.get("variation"),
+        price=position.get("price") or 0,
+        attendee_name=position.get("attendee_name") or "",
+        attendee_email=position.get("attendee_email") or "",
+        canceled=position.get("canceled", False),
+    )
+
+
+def product_from_json(event: str, product: JsonType) -> PretixProduct:
+    return PretixProduct(
+        event=event,
+        pretix_id=product["id"],
+        name=localised(product["name"]),
+        active=product.get("active", True),
+        default_price=product.get("default_price"),
+        content=product,
+    )
+
+
+def voucher_from_json(event: str, voucher: JsonType) -> PretixVoucher:
+    return PretixVoucher(
+        event=event,
+        pretix_id=voucher["id"],
+        code=voucher["code"],
+        tag=voucher.get("tag") or "",
+        item_id=voucher.get("item"),
+        max_usages=voucher.get("max_usages", 1),
+        redeemed=voucher.get("redeemed", 0),
+        valid_until=parse_optional_datetime(voucher.get("valid_until")),
+        content=voucher,
+    )
 
 
-def download_latest_orders(event: str) -> PretixData:
-    data = fetch_pretix_data(event, PretixData.PretixResources.orders)
+def upsert_orders(event: str, data: list[JsonType]) -> list[PretixOrder]:
+    """
+    Insert new orders (with their positions), and update the existing ones.
 
-    pretix_data = PretixData.objects.create(
-        resource=PretixData.PretixResources.orders,
-        content=data,
+    Positions that are not part of the order anymore are removed.
+    """
+    orders = PretixOrder.objects.bulk_create(
+        [order_from_json(event, order) for order in data],
+        batch_size=SYNC_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["event", "code"],
+        update_fields=[
+            "status",
+            "email",
+            "total",
+            "datetime",
+            "last_modified",
+            "content",
+            "modified_at",
+        ],
     )
 
-    return pretix_data
+    # On PostgreSQL the upsert sets primary keys of all the orders, even the
+    # ones that were only updated, so the positions can point at them.
+    positions = [
+        position_from_json(order, position)
+        for order in orders
+        for position in order.content.get("positions", [])
+    ]
 
+    PretixOrderPosition.objects.bulk_create(
+        positions,
+        batch_size=SYNC_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["event", "pretix_id"],
+        update_fields=[
+            "order",
+            "item_id",
+            "variation_id",
+            "price",
+            "attendee_name",
+            "attendee_email",
+            "canceled",
+            "modified_at",
+        ],
+    )
+
+    PretixOrderPosition.objects.filter(order__in=orders).exclude(
+        pretix_id__in=[position.pretix_id for position in positions]
+    ).delete()
+
+    return orders
 
-def download_latest_products(event: str) -> PretixData:
-    data = fetch_pretix_data(event, PretixData.PretixResources.products)
 
-    pretix_data = PretixData.objects.create(
-        resource=PretixData.PretixResources.products,
-        content=data,
+def upsert_products(event: str, data: list[JsonType]) -> list[PretixProduct]:
+    """
+    Replace the products of the event with the ones from `data` - it's always
+    the full list of them, so the ones that are not there were removed.
+    """
+    products = PretixProduct.objects.bulk_create(
+        [product_from_json(event, product) for product in data],
+        batch_size=SYNC_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["event", "pretix_id"],
+        update_fields=["name", "active", "default_price", "content", "modified_at"],
     )
 
-    return pretix_data
+    PretixProduct.objects.filter(event=event).exclude(
+        pretix_id__in=[product.pretix_id for product in products]
+    ).delete()
 
+    return products
 
-def download_latest_vouchers(event: str) -> PretixData:
-    data = fetch_pretix_data(event, PretixData.PretixResources.vouchers)
 
-    pretix_data = PretixData.objects.create(
-        resource=PretixData.PretixResources.vouchers,
-        content=data,
+def upsert_vouchers(event: str, data: list[JsonType]) -> list[PretixVoucher]:
+    """Same as upsert_products, but for vouchers"""
+    vouchers = PretixVoucher.objects.bulk_create(
+        [voucher_from_json(event, voucher) for voucher in data],
+        batch_size=SYNC_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["event", "pretix_id"],
+        update_fields=[
+            "code",
+            "tag",
+            "item_id",
+            "max_usages",
+            "redeemed",
+            "valid_until",
+            "content",
+            "modified_at",
+        ],
     )
 
-    return pretix_data
+    PretixVoucher.objects.filter(event=event).exclude(
+        pretix_id__in=[voucher.pretix_id for voucher in vouchers]
+    ).delete()
+
+    return vouchers
+
+
+UPSERTS = {
+    PretixData.PretixResources.orders: upsert_orders,
+    PretixData.PretixResources.products: upsert_products,
+    PretixData.PretixResources.vouchers: upsert_vouchers,
+}
+
+
+def update_pretix_tables(event: str) -> dict[str, int]:
+    """
+    Load the latest download of every resource into the normalized tables
+    (PretixOrder, PretixOrderPosition, PretixProduct and PretixVoucher).
+
+    Only downloads of the `event` are loaded - older downloads, from before
+    PretixData knew its event, are not.
+
+    Downloads that were already loaded (with `processed_at` set) are skipped.
+
+    Returns number of rows loaded for every resource.
+    """
+    counts = {}
+
+    for resource, upsert in UPSERTS.items():
+        pretix_data = (
+            PretixData.objects.filter(event=event, resource=resource)
+            .defer("content")
+            .order_by("-created_at")
+            .first()
+        )
+
+        if pretix_data is None:
+            counts[resource] = 0
+            continue
+
+        # If nothing changed, it's the earlier download that was loaded before
+        pretix_data = pretix_data.original()
+        if pretix_data.processed_at:
+            counts[resource] = 0
+            continue
+
+        batches: Iterable[list[JsonType]]
+        if resource == PretixData.PretixResources.orders:
+            # Orders are upserted one by one, so they can be loaded a batch at
+            # a time (like streamed downloads, with bounded memory)
+            batches = iter_content(pretix_data, SYNC_BATCH_SIZE)
+        else:
+            # Products and vouchers not in the download are removed, so they
+            # need all of them at once - there are only a few of them anyway
+            batches = [pretix_data.content]
+
+        with transaction.atomic():
+            counts[resource] = sum(len(upsert(event, batch)) for batch in batches)
+            pretix_data.processed_at = timezone.now()
+            pretix_data.save(update_fields=["processed_at", "modified_at"])
+
+        logger.info("Loaded %s %s of %s", counts[resource], resource, event)
+
+    return counts
+
+
+def sync_orders(event: str, max_concurrency: int | None = None) -> int:
+    """
+    Incremental sync of orders: download only the orders modified since the
+    last sync, and merge them into PretixOrder.
+
+    The watermark is the latest `last_modified` we got from pretix (and not our
+    own clock), so we don't miss anything if the clocks are off. Pretix
+    includes orders modified exactly at `modified_since`, so a few orders are
+    downloaded again with every sync - that's fine, upserts are idempotent.
+
+    Returns number of downloaded orders.
+    """
+    resource = PretixData.PretixResources.orders
+    state, _ = PretixSyncState.objects.get_or_create(event=event, resource=resource)
+
+    params = None
+    if state.last_modified:
+        params = {"modified_since": state.last_modified.isoformat()}
+
+    data = fetch_pretix_data(event, resource, max_concurrency, params=params)
+
+    with transaction.atomic():
+        orders = upsert_orders(event, data)
+
+        watermarks = [o.last_modified for o in orders if o.last_modified]
+        if state.last_modified:
+            watermarks.append(state.last_modified)
+
+        state.last_modified = max(watermarks, default=None)
+        state.synced_at = timezone.now()
+        state.save()
+
+    logger.info("Synced %s orders of %s", len(orders), event)
+
+    return len(orders)
@@ -0,0 +1,110 @@
+"""
+Content-addressed storage of the downloads from Pretix and Pretalx.
+
+The cron downloads everything again every day, even though most of it (like
+products and vouchers) rarely changes - and every download used to store
+another copy of the same JSON.
+
+Now every download is hashed (by the database, from the normalized jsonb, so
+that the order of keys or whitespace in the responses doesn't matter), and if
+an earlier download of the same event and resource has the same hash, the new
+one only keeps a marker of when the data was downloaded (`created_at`),
+without the content, pointing at the earlier one (`same_as`).
+
+`PretalxData.original()` / `PretixData.original()` get the download with the
+content, and everything that reads the downloads goes through them.
+"""
+
+import logging
+
+from core.models import PretalxData, PretixData
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+CONTENT_HASH_SQL = """
+    UPDATE {table}
+    SET content_hash = encode(sha256(convert_to(content::text, 'UTF8')), 'hex')
+    WHERE {where}
+    RETURNING content_hash
+"""
+
+
+def deduplicate(
+    download: PretalxData | PretixData,
+) -> PretalxData | PretixData:
+    """
+    Hash the content of the (saved) `download`, and if an earlier download of
+    the same event and resource has the same content, drop the content, and
+    point at the earlier download instead.
+
+    Returns the download with the content - `download` itself, or the earlier
+    one (without loading its content).
+    """
+    model = type(download)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            CONTENT_HASH_SQL.format(table=model._meta.db_table, where="id = %s"),
+            [download.pk],
+        )
+        (download.content_hash,) = cursor.fetchone()
+
+    original = (
+        model.objects.filter(
+            event=download.event,
+            resource=download.resource,
+            content_hash=download.content_hash,
+            same_as=None,
+        )
+        .exclude(pk=download.pk)
+        .defer("content")
+        .order_by("created_at")
+        .first()
+    )
+
+    if original is None:
+        return download
+
+    model.objects.filter(pk=download.pk).update(content=None, same_as=original)
+    logger.info("%s %s is the same as %s", download.resource, download, original)
+
+    return original
+
+
+def compact_downloads(model: type[PretalxData] | type[PretixData]) -> int:
+    """
+    Deduplicate downloads stored before they were hashed - the first download
+    with a given content keeps it, and all the later ones point at it.
+
+    Returns number of downloads that were deduplicated.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                CONTENT_HASH_SQL.format(
+                    table=model._meta.db_table,
+                    where="content_hash = '' AND content IS NOT NULL",
+                )
+            )
+
+        downloads = (
+            model.objects.filter(same_as=None)
+            .exclude(content_hash="")
+            .order_by("created_at")
+            .values_list("pk", "event", "resource", "content_hash")
+        )
+
+        originals = {}
+        duplicates = {}
+        for pk, *key in downloads:
+            original = originals.setdefault(tuple(key), pk)
+            if original != pk:
+                duplicates.setdefault(original, []).append(pk)
+
+        for original, pks in duplicates.items():
+            # Including markers pointing at the downloads that are now markers
+            model.objects.filter(same_as__in=pks).update(same_as=original)
+            model.objects.filter(pk__in=pks).update(content=None, same_as=original)
+
+    return sum(len(pks) for pks in duplicates.values())
@@ -0,0 +1,105 @@
+"""
+Streamed downloads from the Pretix and Pretalx APIs, with bounded memory.
+
+Regular downloads collect all the pages of a resource into one list, and
+then save it with a single query - so the whole download is in memory (a few
+times over: parsed pages, the list, and its JSON for the query) at the same
+time. For the biggest resources, like orders during ticket sales, that's more
+than our container has.
+
+Streamed downloads save every page as soon as it's downloaded (as a
+DownloadPage row), and then let the database put the pages together into
+`content` of the download. This way only a single page is in memory at any
+time, no matter how big the download is, and everything that reads the
+downloads works the same way for both of them.
+
+iter_content reads a download back in the same way, a batch of results at
+a time, for code that doesn't need all of them at once.
+"""
+
+import json
+import logging
+from typing import Any, Iterable, Iterator
+
+from core.models import DownloadPage, PretalxData, PretixData
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+JsonType = dict[str, Any]
+
+# Results of all the pages, in order, as a single JSON array
+MERGE_PAGES_SQL = """
+    UPDATE {download_table}
+    SET content = (
+        SELECT coalesce(jsonb_agg(result ORDER BY page.number, position), '[]')
+        FROM {page_table} AS page,
+            jsonb_array_elements(page.content) WITH ORDINALITY AS r(result, position)
+        WHERE page.download_uuid = %s
+    )
+    WHERE id = %s
+"""
+
+# Results of the download one by one, in order
+ITER_CONTENT_SQL = """
+    SELECT result::text
+    FROM {download_table},
+        jsonb_array_elements(content) WITH ORDINALITY AS r(result, position)
+    WHERE id = %s
+    ORDER BY position
+"""
+
+
+def save_pages(
+    download: PretalxData | PretixData, pages: Iterable[list[JsonType]]
+) -> PretalxData | PretixData:
+    """
+    Save the (new, unsaved) `download`, with results of all the `pages` as
+    its content - one page at a time.
+
+    Returns the saved download, without its content loaded.
+    """
+    model = type(download)
+    sql = MERGE_PAGES_SQL.format(
+        download_table=model._meta.db_table,
+        page_table=DownloadPage._meta.db_table,
+    )
+
+    # If the download fails, there's neither the download, nor its pages
+    with transaction.atomic():
+        download.content = []
+        download.save()
+
+        count = 0
+        for number, results in enumerate(pages):
+            DownloadPage.objects.create(
+                download_uuid=download.uuid,
+                number=number,
+                content=results,
+            )
+            count += len(results)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [download.uuid, download.pk])
+
+        DownloadPage.objects.filter(download_uuid=download.uuid).delete()
+
+    logger.info("Saved %s %s of %s", count, download.resource, download.event)
+
+    return model.objects.defer("content").get(pk=download.pk)
+
+
+def iter_content(
+    download: PretalxData | PretixData, size: int
+) -> Iterator[list[JsonType]]:
+    """
+    Results in the content of the (saved) `download`, in batches of `size`,
+    read with a server side cursor - so only a single batch is in memory at
+    any time.
+    """
+    sql = ITER_CONTENT_SQL.format(download_table=type(download)._meta.db_table)
+
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, [download.pk])
+        while rows := cursor.fetchmany(size):
+            yield [json.loads(result) for (result,) in rows]
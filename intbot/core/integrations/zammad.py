@@ -164,6 +164,4 @@ def prep_zammad_webhook(wh: Webhook):
     wh.event = zp.action
     wh.extra = zp.meta()
 
-    wh.save()
-
     return wh
@@ -0,0 +1,30 @@
+from core.integrations.history import backfill_orders_history, prune_orders_history
+from core.integrations.pretix import PRETIX_EVENTS
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Records the downloads of pretix orders in the history of orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--event",
+            choices=PRETIX_EVENTS,
+            help="slug of the event (for example `ep2025`)",
+            required=True,
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="remove the recorded downloads that are not keyframes",
+        )
+
+    def handle(self, **kwargs):
+        event = kwargs["event"]
+
+        count = backfill_orders_history(event)
+        self.stdout.write(f"Recorded {count} downloads of orders of {event}")
+
+        if kwargs["prune"]:
+            count = prune_orders_history(event)
+            self.stdout.write(f"Removed {count} recorded downloads of orders")
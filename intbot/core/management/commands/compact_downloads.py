@@ -0,0 +1,17 @@
+from core.integrations.storage import compact_downloads
+from core.models import PretalxData, PretixData
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Removes duplicated content of Pretalx and Pretix downloads (the space "
+        "is reused by the database after it vacuums the tables)"
+    )
+
+    def handle(self, **kwargs):
+        for model in [PretalxData, PretixData]:
+            count = compact_downloads(model)
+            self.stdout.write(
+                f"Deduplicated {count} downloads of {model._meta.verbose_name}"
+            )
@@ -1,8 +1,12 @@
+from core.analysis.snapshots import try_write_snapshot
+from core.analysis.submissions import write_submissions_snapshot
+from core.integrations.pagination import DEFAULT_MAX_CONCURRENCY
 from core.integrations.pretalx import (
     PRETALX_EVENTS,
     download_latest_speakers,
     download_latest_submissions,
 )
+from core.tasks import prerender_charts
 from django.core.management.base import BaseCommand
 
 
@@ -17,12 +21,36 @@ class Command(BaseCommand):
             help="slug of the event (for example `europython-2025`)",
             required=True,
         )
+        parser.add_argument(
+            "--concurrent",
+            action="store_true",
+            help="download pages concurrently, instead of one by one",
+        )
+        parser.add_argument(
+            "--max-concurrency",
+            type=int,
+            default=DEFAULT_MAX_CONCURRENCY,
+            help="max number of pages downloaded at once with --concurrent",
+        )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="save pages one by one as they are downloaded (with bounded "
+            "memory), instead of all of them at once",
+        )
 
     def handle(self, **kwargs):
         event = kwargs["event"]
+        max_concurrency = kwargs["max_concurrency"] if kwargs["concurrent"] else None
+        stream = kwargs["stream"]
 
         self.stdout.write(f"Downloading latest speakers from pretalx... {event}")
-        download_latest_speakers(event)
+        download_latest_speakers(event, max_concurrency, stream)
 
         self.stdout.write(f"Downloading latest submissions from pretalx... {event}")
-        download_latest_submissions(event)
+        submissions = download_latest_submissions(event, max_concurrency, stream)
+
+        if path := try_write_snapshot(write_submissions_snapshot, submissions):
+            self.stdout.write(f"Saved submissions snapshot to {path}")
+
+        prerender_charts.enqueue(str(submissions.uuid))
@@ -1,8 +1,13 @@
+from core.analysis.products import write_products_snapshot
+from core.analysis.snapshots import try_write_snapshot
+from core.integrations.history import record_orders_history
+from core.integrations.pagination import DEFAULT_MAX_CONCURRENCY
 from core.integrations.pretix import (
     PRETIX_EVENTS,
     download_latest_orders,
     download_latest_products,
     download_latest_vouchers,
+    sync_orders,
 )
 from django.core.management.base import BaseCommand
 
@@ -18,15 +23,54 @@ class Command(BaseCommand):
             help="slug of the event (for example `ep2025`)",
             required=True,
         )
+        parser.add_argument(
+            "--concurrent",
+            action="store_true",
+            help="download pages concurrently, instead of one by one",
+        )
+        parser.add_argument(
+            "--max-concurrency",
+            type=int,
+            default=DEFAULT_MAX_CONCURRENCY,
+            help="max number of pages downloaded at once with --concurrent",
+        )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="save pages one by one as they are downloaded (with bounded "
+            "memory), instead of all of them at once",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="only sync orders modified since the last incremental sync",
+        )
 
     def handle(self, **kwargs):
         event = kwargs["event"]
+        max_concurrency = kwargs["max_concurrency"] if kwargs["concurrent"] else None
+        stream = kwargs["stream"]
+
+        if kwargs["incremental"]:
+            self.stdout.write(f"Syncing modified orders from pretix... {event}")
+            count = sync_orders(event, max_concurrency)
+            self.stdout.write(f"Synced {count} orders")
+            return
 
         self.stdout.write(f"Downloading latest products from pretix... {event}")
-        download_latest_products(event)
+        products = download_latest_products(event, max_concurrency, stream)
+
+        if path := try_write_snapshot(write_products_snapshot, products):
+            self.stdout.write(f"Saved products snapshot to {path}")
 
         self.stdout.write(f"Downloading latest vouchers from pretix... {event}")
-        download_latest_vouchers(event)
+        download_latest_vouchers(event, max_concurrency, stream)
 
         self.stdout.write(f"Downloading latest orders from pretix... {event}")
-        download_latest_orders(event)
+        orders = download_latest_orders(event, max_concurrency, stream)
+
+        if history := record_orders_history(orders):
+            self.stdout.write(
+                f"Recorded {history.added} added, {history.changed} changed and "
+                f"{history.removed} removed orders in the history"
+            )
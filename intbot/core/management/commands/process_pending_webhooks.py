@@ -0,0 +1,25 @@
+from core.tasks import MESSAGE_BUILDERS, process_pending_webhooks
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Processes all the unprocessed webhooks, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            choices=MESSAGE_BUILDERS.keys(),
+            help="Process webhooks only from this source (default: all of them)",
+        )
+
+    def handle(self, *args, **options):
+        sources = [options["source"]] if options["source"] else MESSAGE_BUILDERS
+
+        for source in sources:
+            created = process_pending_webhooks.call(source)
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Processed pending {source} webhooks, created {created} messages"
+                )
+            )
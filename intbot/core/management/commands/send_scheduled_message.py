@@ -1,3 +1,4 @@
+from core.bot.delivery import notify_new_messages
 from core.bot.scheduled_messages import MESSAGE_FACTORIES
 from django.core.management.base import BaseCommand
 
@@ -19,6 +20,7 @@ class Command(BaseCommand):
         factory = MESSAGE_FACTORIES[message_template]
         message = factory()
         message.save()
+        notify_new_messages([message])
 
         self.stdout.write(
             self.style.SUCCESS(
@@ -0,0 +1,20 @@
+from core.integrations.pretix import PRETIX_EVENTS, update_pretix_tables
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Loads the latest pretix downloads into the normalized pretix tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--event",
+            choices=PRETIX_EVENTS,
+            help="slug of the event the downloads are from (for example `ep2025`)",
+            required=True,
+        )
+
+    def handle(self, **kwargs):
+        counts = update_pretix_tables(kwargs["event"])
+
+        for resource, count in counts.items():
+            self.stdout.write(self.style.SUCCESS(f"Loaded {count} {resource}"))
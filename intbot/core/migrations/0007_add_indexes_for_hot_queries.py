@@ -0,0 +1,78 @@
+# Generated by Django 5.1.4 on 2026-10-18 00:41
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0006_add_pretix_data_model"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="pretalxdata",
+            options={"verbose_name_plural": "Pretalx Data"},
+        ),
+        migrations.AlterModelOptions(
+            name="pretixdata",
+            options={"verbose_name_plural": "Pretix Data"},
+        ),
+        migrations.AlterField(
+            model_name="discordmessage",
+            name="uuid",
+            field=models.UUIDField(default=uuid.uuid4, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="inboxitem",
+            name="uuid",
+            field=models.UUIDField(default=uuid.uuid4, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="pretalxdata",
+            name="uuid",
+            field=models.UUIDField(default=uuid.uuid4, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="pretixdata",
+            name="uuid",
+            field=models.UUIDField(default=uuid.uuid4, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="webhook",
+            name="uuid",
+            field=models.UUIDField(default=uuid.uuid4, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name="discordmessage",
+            index=models.Index(
+                condition=models.Q(("sent_at__isnull", True)),
+                fields=["created_at"],
+                name="discordmessage_unsent_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="inboxitem",
+            index=models.Index(
+                fields=["user_id", "-created_at"], name="inboxitem_user_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="inboxitem",
+            index=models.Index(
+                fields=["message_id", "user_id"], name="inboxitem_message_user_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pretalxdata",
+            index=models.Index(
+                fields=["resource", "-created_at"], name="pretalxdata_latest_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pretixdata",
+            index=models.Index(
+                fields=["resource", "-created_at"], name="pretixdata_latest_idx"
+            ),
+        ),
+    ]
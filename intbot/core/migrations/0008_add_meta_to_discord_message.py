@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 00:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0007_add_indexes_for_hot_queries"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="discordmessage",
+            name="meta",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 00:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0008_add_meta_to_discord_message"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="discordmessage",
+            name="claimed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="discordmessage",
+            name="claimed_by",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
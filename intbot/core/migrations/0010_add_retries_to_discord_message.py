@@ -0,0 +1,46 @@
+# Generated by Django 5.1.4 on 2026-10-18 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0009_add_claim_to_discord_message"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="discordmessage",
+            name="discordmessage_unsent_idx",
+        ),
+        migrations.AddField(
+            model_name="discordmessage",
+            name="attempts",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="discordmessage",
+            name="dead_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="discordmessage",
+            name="last_error",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="discordmessage",
+            name="next_attempt_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="discordmessage",
+            index=models.Index(
+                condition=models.Q(
+                    ("dead_at__isnull", True), ("sent_at__isnull", True)
+                ),
+                fields=["created_at"],
+                name="discordmessage_unsent_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0010_add_retries_to_discord_message"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="webhook",
+            name="dedup_key",
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 00:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0011_add_dedup_key_to_webhook"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="webhook",
+            index=models.Index(
+                condition=models.Q(("processed_at__isnull", True)),
+                fields=["source", "id"],
+                name="webhook_unprocessed_idx",
+            ),
+        ),
+    ]
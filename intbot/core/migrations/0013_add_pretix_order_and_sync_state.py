@@ -0,0 +1,78 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0012_add_unprocessed_index_to_webhook"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PretixOrder",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event", models.CharField(max_length=255)),
+                ("code", models.CharField(max_length=255)),
+                ("status", models.CharField(max_length=255)),
+                ("datetime", models.DateTimeField(blank=True, null=True)),
+                ("last_modified", models.DateTimeField(blank=True, null=True)),
+                ("content", models.JSONField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("modified_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("event", "code"), name="pretixorder_event_code_unique"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="PretixSyncState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event", models.CharField(max_length=255)),
+                (
+                    "resource",
+                    models.CharField(
+                        choices=[
+                            ("orders", "Orders"),
+                            ("products", "Products"),
+                            ("vouchers", "Vouchers"),
+                        ],
+                        max_length=255,
+                    ),
+                ),
+                ("last_modified", models.DateTimeField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("modified_at", models.DateTimeField(auto_now=True)),
+                ("synced_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("event", "resource"), name="pretixsyncstate_unique"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,167 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0013_add_pretix_order_and_sync_state"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PretixOrderPosition",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event", models.CharField(max_length=255)),
+                ("pretix_id", models.IntegerField()),
+                ("item_id", models.IntegerField()),
+                ("variation_id", models.IntegerField(blank=True, null=True)),
+                (
+                    "price",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=13),
+                ),
+                ("attendee_name", models.CharField(blank=True, max_length=255)),
+                ("attendee_email", models.CharField(blank=True, max_length=255)),
+                ("canceled", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("modified_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="PretixProduct",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event", models.CharField(max_length=255)),
+                ("pretix_id", models.IntegerField()),
+                ("name", models.CharField(max_length=255)),
+                ("active", models.BooleanField(default=True)),
+                (
+                    "default_price",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=13, null=True
+                    ),
+                ),
+                ("content", models.JSONField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("modified_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="PretixVoucher",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event", models.CharField(max_length=255)),
+                ("pretix_id", models.IntegerField()),
+                ("code", models.CharField(max_length=255)),
+                ("tag", models.CharField(blank=True, max_length=255)),
+                ("item_id", models.IntegerField(blank=True, null=True)),
+                ("max_usages", models.IntegerField(default=1)),
+                ("redeemed", models.IntegerField(default=0)),
+                ("valid_until", models.DateTimeField(blank=True, null=True)),
+                ("content", models.JSONField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("modified_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="pretixorder",
+            name="email",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="pretixorder",
+            name="total",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=13),
+        ),
+        migrations.AlterField(
+            model_name="pretixorder",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("n", "Pending"),
+                    ("p", "Paid"),
+                    ("e", "Expired"),
+                    ("c", "Canceled"),
+                ],
+                max_length=255,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pretixorder",
+            index=models.Index(
+                fields=["event", "status"], name="pretixorder_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pretixorder",
+            index=models.Index(
+                fields=["event", "datetime"], name="pretixorder_datetime_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="pretixorderposition",
+            name="order",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="positions",
+                to="core.pretixorder",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="pretixproduct",
+            constraint=models.UniqueConstraint(
+                fields=("event", "pretix_id"), name="pretixproduct_unique"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pretixvoucher",
+            index=models.Index(
+                fields=["event", "item_id"], name="pretixvoucher_item_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="pretixvoucher",
+            constraint=models.UniqueConstraint(
+                fields=("event", "pretix_id"), name="pretixvoucher_unique"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pretixorderposition",
+            index=models.Index(
+                fields=["event", "item_id", "variation_id"],
+                name="pretixposition_item_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="pretixorderposition",
+            constraint=models.UniqueConstraint(
+                fields=("event", "pretix_id"), name="pretixposition_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0014_add_normalized_pretix_tables"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pretalxdata",
+            name="event",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="pretixdata",
+            name="event",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
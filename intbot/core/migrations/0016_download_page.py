@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0015_add_event_to_pretalx_and_pretix_data"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DownloadPage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("download_uuid", models.UUIDField()),
+                ("number", models.PositiveIntegerField()),
+                ("content", models.JSONField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("download_uuid", "number"), name="downloadpage_unique"
+                    )
+                ],
+            },
+        ),
+    ]
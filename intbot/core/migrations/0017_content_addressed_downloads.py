@@ -0,0 +1,68 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0016_download_page"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pretalxdata",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="pretalxdata",
+            name="same_as",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="duplicates",
+                to="core.pretalxdata",
+            ),
+        ),
+        migrations.AddField(
+            model_name="pretixdata",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="pretixdata",
+            name="same_as",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="duplicates",
+                to="core.pretixdata",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="pretalxdata",
+            name="content",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="pretixdata",
+            name="content",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="pretalxdata",
+            index=models.Index(
+                fields=["event", "resource", "content_hash"],
+                name="pretalxdata_hash_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pretixdata",
+            index=models.Index(
+                fields=["event", "resource", "content_hash"], name="pretixdata_hash_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0017_content_addressed_downloads"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PretixOrderHistory",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event", models.CharField(max_length=255)),
+                ("downloaded_at", models.DateTimeField()),
+                ("keyframe", models.BooleanField(default=False)),
+                ("added", models.PositiveIntegerField(default=0)),
+                ("changed", models.PositiveIntegerField(default=0)),
+                ("removed", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "download",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="core.pretixdata",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Pretix order history",
+            },
+        ),
+        migrations.CreateModel(
+            name="PretixOrderChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event", models.CharField(max_length=255)),
+                ("code", models.CharField(max_length=255)),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("added", "Added"),
+                            ("changed", "Changed"),
+                            ("removed", "Removed"),
+                        ],
+                        max_length=255,
+                    ),
+                ),
+                ("order", models.JSONField(blank=True, null=True)),
+                ("downloaded_at", models.DateTimeField()),
+                (
+                    "history",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="changes",
+                        to="core.pretixorderhistory",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="pretixorderhistory",
+            index=models.Index(
+                fields=["event", "downloaded_at"], name="pretixorderhistory_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pretixorderchange",
+            index=models.Index(
+                fields=["event", "downloaded_at"], name="pretixorderchange_time_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pretixorderchange",
+            index=models.Index(
+                fields=["event", "code"], name="pretixorderchange_code_idx"
+            ),
+        ),
+    ]
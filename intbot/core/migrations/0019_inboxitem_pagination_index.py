@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0018_pretix_order_history"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="inboxitem",
+            name="inboxitem_user_idx",
+        ),
+        migrations.AddIndex(
+            model_name="inboxitem",
+            index=models.Index(
+                fields=["user_id", "-created_at", "-id"], name="inboxitem_user_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:50
+
+from django.db import migrations, models
+
+
+def remove_duplicate_inbox_items(apps, schema_editor):
+    """Keep only the first item of every message in the inbox of a user"""
+    InboxItem = apps.get_model("core", "InboxItem")
+
+    duplicates = (
+        InboxItem.objects.values("message_id", "user_id")
+        .annotate(first=models.Min("id"), count=models.Count("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        InboxItem.objects.filter(
+            message_id=duplicate["message_id"],
+            user_id=duplicate["user_id"],
+        ).exclude(id=duplicate["first"]).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0019_inboxitem_pagination_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_inbox_items, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name="inboxitem",
+            name="inboxitem_message_user_idx",
+        ),
+        migrations.AddConstraint(
+            model_name="inboxitem",
+            constraint=models.UniqueConstraint(
+                fields=("message_id", "user_id"), name="inboxitem_message_user_uniq"
+            ),
+        ),
+    ]
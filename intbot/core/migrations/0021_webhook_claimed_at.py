@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0020_inboxitem_unique_message"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="webhook",
+            name="claimed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0021_webhook_claimed_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="pretixorderhistory",
+            name="download",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="core.pretixdata",
+            ),
+        ),
+    ]
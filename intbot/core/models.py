@@ -1,10 +1,11 @@
 import uuid
+from datetime import timedelta
 
 from django.db import models
 
 
 class Webhook(models.Model):
-    uuid = models.UUIDField(default=uuid.uuid4)
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True)
 
     source = models.CharField(max_length=255)
     event = models.CharField(max_length=255)
@@ -22,16 +23,34 @@ class Webhook(models.Model):
     # information from other sources. This is the field to put that data in.
     extra = models.JSONField()
 
+    # Identifies the delivery (for example GitHub's X-GitHub-Delivery), so that
+    # the same webhook delivered more than once is stored (and processed) only
+    # once.
+    dedup_key = models.CharField(max_length=255, blank=True, null=True, unique=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
     processed_at = models.DateTimeField(blank=True, null=True)
 
+    # When the webhook was claimed for processing (see core.tasks.claim_webhooks)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Batch processing picks up unprocessed webhooks, per source
+            models.Index(
+                fields=["source", "id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="webhook_unprocessed_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.uuid}"
 
 
 class DiscordMessage(models.Model):
-    uuid = models.UUIDField(default=uuid.uuid4)
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True)
 
     # This is intentionally char field, even if discord.py requires later to
     # cast it to int
@@ -41,18 +60,52 @@ class DiscordMessage(models.Model):
 
     content = models.TextField()
 
+    # Structured information about the message, used to merge multiple queued
+    # messages about the same thing into one before sending.
+    meta = models.JSONField(default=dict, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
     # Messages to be have null here
     sent_at = models.DateTimeField(blank=True, null=True)
 
+    # Bot process that is currently sending the message, see
+    # core.bot.delivery.claim_messages
+    claimed_by = models.CharField(max_length=255, blank=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+
+    # Failed deliveries are retried with exponential backoff, until there are
+    # too many failed attempts and the message is marked as dead.
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    dead_at = models.DateTimeField(blank=True, null=True)
+
+    def delivery_latency(self) -> timedelta | None:
+        """End-to-end latency, from scheduling the message to sending it"""
+        if self.sent_at is None:
+            return None
+
+        return self.sent_at - self.created_at
+
+    class Meta:
+        indexes = [
+            # The bot is constantly looking for unsent messages, and there
+            # should be only a handful of them at any given moment.
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(sent_at__isnull=True, dead_at__isnull=True),
+                name="discordmessage_unsent_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.uuid} {self.content[:30]}"
 
 
 class InboxItem(models.Model):
-    uuid = models.UUIDField(default=uuid.uuid4)
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True)
 
     # Discord message details
     message_id = models.CharField(max_length=255)
@@ -67,6 +120,24 @@ class InboxItem(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Listing the inbox of a given user, page by page (the id is a
+            # tie breaker for items saved at the same time)
+            models.Index(
+                fields=["user_id", "-created_at", "-id"],
+                name="inboxitem_user_idx",
+            ),
+        ]
+        constraints = [
+            # Every message is in the inbox of a given user only once (and
+            # it's also the index for removing it from the inbox)
+            models.UniqueConstraint(
+                fields=["message_id", "user_id"],
+                name="inboxitem_message_user_uniq",
+            ),
+        ]
+
     def url(self) -> str:
         """Return URL to the Discord message"""
         return f"https://discord.com/channels/{self.server_id}/{self.channel_id}/{self.message_id}"
@@ -95,12 +166,24 @@ class PretalxData(models.Model):
         speakers = "speakers", "Speakers"
         schedule = "schedule", "Schedule"
 
-    uuid = models.UUIDField(default=uuid.uuid4)
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True)
     resource = models.CharField(
         max_length=255,
         choices=PretalxResources.choices,
     )
-    content = models.JSONField()
+    # Slug of the event, empty for older downloads
+    event = models.CharField(max_length=255, blank=True)
+    # Empty if the content is the same as of an earlier download (`same_as`)
+    content = models.JSONField(blank=True, null=True)
+    # sha256 of the content, see core.integrations.storage
+    content_hash = models.CharField(max_length=64, blank=True)
+    same_as = models.ForeignKey(
+        "self",
+        on_delete=models.PROTECT,
+        blank=True,
+        null=True,
+        related_name="duplicates",
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
@@ -108,10 +191,32 @@ class PretalxData(models.Model):
 
     class Meta:
         verbose_name_plural = "Pretalx Data"
+        indexes = [
+            # Getting the latest download of a given resource
+            models.Index(
+                fields=["resource", "-created_at"],
+                name="pretalxdata_latest_idx",
+            ),
+            # Finding an earlier download with the same content
+            models.Index(
+                fields=["event", "resource", "content_hash"],
+                name="pretalxdata_hash_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.uuid}"
 
+    def original(self) -> "PretalxData":
+        """
+        The download with the content - this one, or the earlier download it
+        is the same as (without loading its content).
+        """
+        if self.same_as_id is None:
+            return self
+
+        return PretalxData.objects.defer("content").get(pk=self.same_as_id)
+
 
 class PretixData(models.Model):
     """
@@ -125,12 +230,24 @@ class PretixData(models.Model):
         products = "products", "Products"
         vouchers = "vouchers", "Vouchers"
 
-    uuid = models.UUIDField(default=uuid.uuid4)
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True)
     resource = models.CharField(
         max_length=255,
         choices=PretixResources.choices,
     )
-    content = models.JSONField()
+    # Slug of the event, empty for older downloads
+    event = models.CharField(max_length=255, blank=True)
+    # Empty if the content is the same as of an earlier download (`same_as`)
+    content = models.JSONField(blank=True, null=True)
+    # sha256 of the content, see core.integrations.storage
+    content_hash = models.CharField(max_length=64, blank=True)
+    same_as = models.ForeignKey(
+        "self",
+        on_delete=models.PROTECT,
+        blank=True,
+        null=True,
+        related_name="duplicates",
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
@@ -138,6 +255,330 @@ class PretixData(models.Model):
 
     class Meta:
         verbose_name_plural = "Pretix Data"
+        indexes = [
+            # Getting the latest download of a given resource
+            models.Index(
+                fields=["resource", "-created_at"],
+                name="pretixdata_latest_idx",
+            ),
+            # Finding an earlier download with the same content
+            models.Index(
+                fields=["event", "resource", "content_hash"],
+                name="pretixdata_hash_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.uuid}"
+
+    def original(self) -> "PretixData":
+        """
+        The download with the content - this one, or the earlier download it
+        is the same as (without loading its content).
+        """
+        if self.same_as_id is None:
+            return self
+
+        return PretixData.objects.defer("content").get(pk=self.same_as_id)
+
+
+class DownloadPage(models.Model):
+    """
+    Single page of a streamed download (of PretalxData or PretixData).
+
+    Pages are stored one by one while downloading, and removed once they are
+    put together in `content` of the download - see
+    core.integrations.streaming.
+    """
+
+    # uuid of the PretalxData or PretixData
+    download_uuid = models.UUIDField()
+    number = models.PositiveIntegerField()
+    content = models.JSONField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["download_uuid", "number"],
+                name="downloadpage_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.download_uuid} page {self.number}"
+
+
+class PretixSyncState(models.Model):
+    """
+    Watermark of the incremental sync of a given pretix event/resource.
+
+    `last_modified` is the latest `last_modified` timestamp (as reported by
+    pretix) that we have seen so far - the next sync asks only for the data
+    modified since then.
+    """
+
+    event = models.CharField(max_length=255)
+    resource = models.CharField(
+        max_length=255,
+        choices=PretixData.PretixResources.choices,
+    )
+    last_modified = models.DateTimeField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+    synced_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["event", "resource"],
+                name="pretixsyncstate_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event} {self.resource} @ {self.last_modified}"
+
+
+class PretixOrder(models.Model):
+    """
+    Current state of a pretix order, kept up to date by the incremental sync
+    (and by update_pretix_tables, from the full downloads).
+
+    Unlike PretixData, that stores a new copy of all the orders with every
+    download, there is exactly one row per order here.
+    """
+
+    class Status(models.TextChoices):
+        pending = "n", "Pending"
+        paid = "p", "Paid"
+        expired = "e", "Expired"
+        canceled = "c", "Canceled"
+
+    event = models.CharField(max_length=255)
+    code = models.CharField(max_length=255)
+    status = models.CharField(max_length=255, choices=Status.choices)
+    email = models.CharField(max_length=255, blank=True)
+    total = models.DecimalField(max_digits=13, decimal_places=2, default=0)
+
+    # Timestamps from pretix
+    datetime = models.DateTimeField(blank=True, null=True)
+    last_modified = models.DateTimeField(blank=True, null=True)
+
+    content = models.JSONField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["event", "code"],
+                name="pretixorder_event_code_unique",
+            ),
+        ]
+        indexes = [
+            # Counting orders in a given status
+            models.Index(
+                fields=["event", "status"],
+                name="pretixorder_status_idx",
+            ),
+            # Sales over time
+            models.Index(
+                fields=["event", "datetime"],
+                name="pretixorder_datetime_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event} {self.code} ({self.status})"
+
+
+class PretixOrderPosition(models.Model):
+    """Single position (ticket, t-shirt, etc.) of a pretix order"""
+
+    order = models.ForeignKey(
+        PretixOrder,
+        on_delete=models.CASCADE,
+        related_name="positions",
+    )
+    event = models.CharField(max_length=255)
+    # Position id from pretix
+    pretix_id = models.IntegerField()
+
+    item_id = models.IntegerField()
+    variation_id = models.IntegerField(blank=True, null=True)
+    price = models.DecimalField(max_digits=13, decimal_places=2, default=0)
+    attendee_name = models.CharField(max_length=255, blank=True)
+    attendee_email = models.CharField(max_length=255, blank=True)
+    canceled = models.BooleanField(default=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["event", "pretix_id"],
+                name="pretixposition_unique",
+            ),
+        ]
+        indexes = [
+            # Counting sold products
+            models.Index(
+                fields=["event", "item_id", "variation_id"],
+                name="pretixposition_item_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event} {self.pretix_id} (item {self.item_id})"
+
+
+class PretixProduct(models.Model):
+    """Product (`item` in the pretix API) of a pretix event"""
+
+    event = models.CharField(max_length=255)
+    # Product id from pretix
+    pretix_id = models.IntegerField()
+
+    name = models.CharField(max_length=255)
+    active = models.BooleanField(default=True)
+    default_price = models.DecimalField(
+        max_digits=13, decimal_places=2, blank=True, null=True
+    )
+
+    content = models.JSONField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["event", "pretix_id"],
+                name="pretixproduct_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event} {self.name}"
+
+
+class PretixVoucher(models.Model):
+    event = models.CharField(max_length=255)
+    # Voucher id from pretix
+    pretix_id = models.IntegerField()
+
+    code = models.CharField(max_length=255)
+    tag = models.CharField(max_length=255, blank=True)
+    item_id = models.IntegerField(blank=True, null=True)
+    max_usages = models.IntegerField(default=1)
+    redeemed = models.IntegerField(default=0)
+    valid_until = models.DateTimeField(blank=True, null=True)
+
+    content = models.JSONField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["event", "pretix_id"],
+                name="pretixvoucher_unique",
+            ),
+        ]
+        indexes = [
+            # Vouchers for a given product
+            models.Index(
+                fields=["event", "item_id"],
+                name="pretixvoucher_item_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event} {self.code}"
+
+
+class PretixOrderHistory(models.Model):
+    """
+    Download of the orders, recorded in the history of orders - see
+    core.integrations.history.
+
+    Keyframes keep all the orders (the content of their download), and all
+    the other downloads only the changes since the previous one.
+    """
+
+    event = models.CharField(max_length=255)
+    download = models.ForeignKey(
+        PretixData,
+        # Keyframes need their download, and the other downloads are removed
+        # only by prune_orders_history (that clears it first)
+        on_delete=models.PROTECT,
+        blank=True,
+        null=True,
+        related_name="+",
+    )
+    downloaded_at = models.DateTimeField()
+    keyframe = models.BooleanField(default=False)
+
+    # Number of changes since the previous download
+    added = models.PositiveIntegerField(default=0)
+    changed = models.PositiveIntegerField(default=0)
+    removed = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "Pretix order history"
+        indexes = [
+            models.Index(
+                fields=["event", "downloaded_at"],
+                name="pretixorderhistory_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event} orders @ {self.downloaded_at}"
+
+
+class PretixOrderChange(models.Model):
+    """Change of a single order between two recorded downloads of orders"""
+
+    class Kind(models.TextChoices):
+        added = "added", "Added"
+        changed = "changed", "Changed"
+        removed = "removed", "Removed"
+
+    history = models.ForeignKey(
+        PretixOrderHistory,
+        on_delete=models.CASCADE,
+        related_name="changes",
+    )
+    event = models.CharField(max_length=255)
+    code = models.CharField(max_length=255)
+    kind = models.CharField(max_length=255, choices=Kind.choices)
+    # The order after the change, empty if it was removed
+    order = models.JSONField(blank=True, null=True)
+    # Same as of the history, to iterate over the changes without joins
+    downloaded_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Changes in a given time range, in order
+            models.Index(
+                fields=["event", "downloaded_at"],
+                name="pretixorderchange_time_idx",
+            ),
+            # Changes of a given order
+            models.Index(
+                fields=["event", "code"],
+                name="pretixorderchange_code_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event} {self.code} {self.kind} @ {self.downloaded_at}"
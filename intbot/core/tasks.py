@@ -1,19 +1,228 @@
 import logging
+from datetime import timedelta
 
-from core.integrations.github import parse_github_webhook, prep_github_webhook
+from core.analysis.charts import prerender_submissions_charts
+from core.integrations.github import (
+    parse_github_webhook,
+    prefetch_github_project_items,
+    prep_github_webhook,
+)
 from core.integrations.zammad import prep_zammad_webhook
 from core.bot.channel_router import discord_channel_router, dont_send_it
-from core.models import DiscordMessage, Webhook
+from core.bot.delivery import notify_new_messages
+from core.models import DiscordMessage, PretalxData, Webhook
+from django.db import transaction
+from django.db.models import Q, QuerySet
 from django.utils import timezone
 from django_tasks import task
 
 logger = logging.getLogger()
 
+# Number of webhooks processed (and written to the database) at once in the
+# batch mode
+BATCH_SIZE = 500
+
+# How long a claim on a webhook is valid. If the process that claimed the
+# webhook dies (or fails) before processing it, it can be claimed again after
+# that - by the next run of process_pending_webhooks.
+WEBHOOK_CLAIM_LEASE = timedelta(minutes=15)
+
+# Pending webhooks are picked up only after their own task had a chance to
+# process them, and only if they are recent - not everything that was left
+# unprocessed since forever.
+PENDING_MIN_AGE = timedelta(minutes=5)
+PENDING_MAX_AGE = timedelta(days=1)
+
+# GitHub webhooks are processed that long after they are received, together
+# with all the other GitHub webhooks received in the meantime - so that when
+# a project board is bulk-edited, the project items of all the webhooks are
+# looked up with a single request (see prefetch_github_project_items).
+GITHUB_BATCH_WINDOW = timedelta(seconds=5)
+
+
+def claim_webhooks(
+    webhooks: QuerySet[Webhook], limit: int = BATCH_SIZE
+) -> list[Webhook]:
+    """
+    Atomically claim (up to `limit`) unprocessed webhooks for processing, in
+    the order they were received.
+
+    Works like claim_messages in core.bot.delivery - with SELECT ... FOR
+    UPDATE SKIP LOCKED, so the same webhook is never processed twice at the
+    same time (and never sent to Discord twice), by its own task, the batch
+    mode, or both. Claims that are older than WEBHOOK_CLAIM_LEASE have
+    expired and can be claimed again.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        claimed = list(
+            webhooks.filter(
+                Q(claimed_at__isnull=True)
+                | Q(claimed_at__lt=now - WEBHOOK_CLAIM_LEASE),
+                processed_at__isnull=True,
+            )
+            .order_by("id")
+            .select_for_update(skip_locked=True)[:limit]
+        )
+
+        Webhook.objects.filter(pk__in=[wh.pk for wh in claimed]).update(claimed_at=now)
+
+    for wh in claimed:
+        wh.claimed_at = now
+
+    return claimed
+
 
 @task
 def process_webhook(wh_uuid: str):
     wh = Webhook.objects.get(uuid=wh_uuid)
 
+    if wh.processed_at is not None:
+        logger.info(f"Webhook {wh.uuid} was already processed")
+        return
+
+    claimed = claim_webhooks(Webhook.objects.filter(pk=wh.pk))
+    if not claimed:
+        logger.info(f"Webhook {wh.uuid} is being processed somewhere else")
+        return
+
+    route_webhook(claimed[0])
+
+
+@task
+def process_webhooks(wh_uuids: list[str]):
+    """
+    Process many webhooks in a single task (used by the batch endpoint), in
+    the order they were received.
+    """
+    webhooks = Webhook.objects.filter(uuid__in=wh_uuids)
+    process_webhook_batch(claim_webhooks(webhooks, limit=len(wh_uuids)))
+
+
+@task
+def process_github_webhooks() -> int:
+    """
+    Process all the GitHub webhooks received recently (that were not picked
+    up yet by another run of this task) in batches.
+
+    Returns number of created messages.
+    """
+    pending = Webhook.objects.filter(
+        source="github",
+        created_at__gte=timezone.now() - PENDING_MAX_AGE,
+    )
+    return process_claimed_webhooks(pending)
+
+
+def enqueue_github_webhook() -> None:
+    """
+    Schedule processing of a new GitHub webhook, GITHUB_BATCH_WINDOW later.
+
+    The first task to run processes everything that arrived until then, and
+    the tasks of the other webhooks find them already processed.
+    """
+    task = process_github_webhooks
+    # Backends that can't defer tasks (like the one in tests) run them now
+    if task.get_backend().supports_defer:
+        task = task.using(run_after=timezone.now() + GITHUB_BATCH_WINDOW)
+    task.enqueue()
+
+
+@task
+def process_pending_webhooks(source: str) -> int:
+    """
+    Batch mode: process the unprocessed webhooks from `source` (received
+    between PENDING_MAX_AGE and PENDING_MIN_AGE ago), in batches of
+    BATCH_SIZE.
+
+    Returns number of created messages.
+    """
+    if source not in MESSAGE_BUILDERS:
+        raise ValueError(f"Unsupported source {source}")
+
+    now = timezone.now()
+    pending = Webhook.objects.filter(
+        source=source,
+        created_at__gte=now - PENDING_MAX_AGE,
+        created_at__lte=now - PENDING_MIN_AGE,
+    )
+
+    return process_claimed_webhooks(pending)
+
+
+def process_claimed_webhooks(pending: QuerySet[Webhook]) -> int:
+    """
+    Claim and process the `pending` webhooks, in batches of BATCH_SIZE.
+
+    Returns number of created messages.
+    """
+    created = 0
+
+    # Webhooks that failed stay claimed (until the lease expires), so they are
+    # not picked up again in the next batch.
+    while batch := claim_webhooks(pending):
+        created += len(process_webhook_batch(batch))
+
+    return created
+
+
+@task
+def prerender_charts(pretalx_data_uuid: str):
+    """
+    Render charts of a new download to the cache, so that they are ready
+    before anyone asks for them.
+    """
+    pretalx_data = PretalxData.objects.defer("content").get(uuid=pretalx_data_uuid)
+    prerender_submissions_charts(pretalx_data)
+
+
+def process_webhook_batch(webhooks: list[Webhook]) -> list[DiscordMessage]:
+    """
+    Process webhooks together, and save the results with one INSERT for all
+    the messages, and one UPDATE for all the webhooks, in a single transaction.
+
+    Webhooks that can't be parsed (like unsupported GitHub events) are marked
+    as processed without a message, like in the one-by-one mode, and so are
+    the ones from unsupported sources (that fail the one-by-one task), so that
+    they are not picked up again with every batch. Webhooks that failed for
+    other reasons (for example, GitHub API errors) are left to be retried.
+    """
+    messages = []
+    processed = []
+    now = timezone.now()
+
+    # One request to GitHub for the whole batch, instead of one per webhook
+    prefetch_github_project_items([wh for wh in webhooks if wh.source == "github"])
+
+    for wh in webhooks:
+        try:
+            if wh.source not in MESSAGE_BUILDERS:
+                raise ValueError(f"Unsupported source {wh.source}")
+
+            dm = MESSAGE_BUILDERS[wh.source](wh)
+        except ValueError as e:
+            logger.info(f"Not processing {wh.source} Webhook {wh.uuid}: {e}")
+            dm = None
+        except Exception:
+            logger.exception(f"Failed to process {wh.source} Webhook {wh.uuid}")
+            continue
+
+        if dm is not None:
+            messages.append(dm)
+
+        wh.processed_at = now
+        processed.append(wh)
+
+    with transaction.atomic():
+        DiscordMessage.objects.bulk_create(messages)
+        Webhook.objects.bulk_update(processed, ["event", "extra", "processed_at"])
+        notify_new_messages(messages)
+
+    return messages
+
+
+def route_webhook(wh: Webhook):
     if wh.source == "internal":
         process_internal_webhook(wh)
 
@@ -27,21 +236,32 @@ def process_webhook(wh_uuid: str):
         raise ValueError(f"Unsupported source {wh.source}")
 
 
+def save_processed_webhook(wh: Webhook, dm: DiscordMessage | None):
+    if dm is not None:
+        dm.save()
+        notify_new_messages([dm])
+
+    wh.processed_at = timezone.now()
+    wh.save()
+
+
 def process_internal_webhook(wh: Webhook):
     if wh.source != "internal":
         raise ValueError("Incorrect wh.source = {wh.source}")
 
+    save_processed_webhook(wh, build_internal_message(wh))
+
+
+def build_internal_message(wh: Webhook) -> DiscordMessage:
     channel = discord_channel_router(wh)
 
-    DiscordMessage.objects.create(
+    return DiscordMessage(
         channel_id=channel.channel_id,
         channel_name=channel.channel_name,
         content=f"Webhook content: {wh.content}",
         # Mark as not sent - to be sent with the next batch
         sent_at=None,
     )
-    wh.processed_at = timezone.now()
-    wh.save()
 
 
 def process_github_webhook(wh: Webhook):
@@ -49,37 +269,52 @@ def process_github_webhook(wh: Webhook):
         raise ValueError("Incorrect wh.source = {wh.source}")
 
     try:
-        wh = prep_github_webhook(wh)
+        dm = build_github_message(wh)
     except ValueError as e:
         # Downgrading to info because it's most likely event not supported
         logger.info(f"Not processing Github Webhook {wh.uuid}: {e}")
-        return
+        # Same as in the batch mode - it's not going to be supported on retry
+        dm = None
+
+    save_processed_webhook(wh, dm)
+
 
+def build_github_message(wh: Webhook) -> DiscordMessage | None:
+    """
+    raise ValueError if the event is not supported.
+
+    Returns None if we shouldn't send a message for this webhook (it should
+    still be marked as processed, to avoid re-processing in the future).
+    """
+    wh = prep_github_webhook(wh)
     parsed = parse_github_webhook(wh)
     channel = discord_channel_router(wh)
 
     if channel == dont_send_it:
-        # Mark as processed, to avoid re-processing in the future if we
-        # shouldn't send a message.
-        wh.processed_at = timezone.now()
-        wh.save()
-        return
+        return None
 
-    DiscordMessage.objects.create(
+    return DiscordMessage(
         channel_id=channel.channel_id,
         channel_name=channel.channel_name,
         content=f"GitHub: {parsed.as_discord_message()}",
+        meta=parsed.as_discord_message_meta(prefix="GitHub: "),
         # Mark as unsent - to be sent with the next batch
         sent_at=None,
     )
-    wh.processed_at = timezone.now()
-    wh.save()
 
 
 def process_zammad_webhook(wh: Webhook):
     if wh.source != "zammad":
         raise ValueError("Incorrect wh.source = {wh.source}")
 
+    save_processed_webhook(wh, build_zammad_message(wh))
+
+
+def build_zammad_message(wh: Webhook) -> DiscordMessage | None:
+    """
+    Returns None if we shouldn't send a message for this webhook (it should
+    still be marked as processed, to avoid re-processing in the future).
+    """
     # Unlike in github, the zammad webhook is richer and
     # contains much more information, so no extra fetch is needed.
     # However, we can extract information and store it in the meta field, that
@@ -88,18 +323,19 @@ def process_zammad_webhook(wh: Webhook):
     channel = discord_channel_router(wh)
 
     if channel == dont_send_it:
-        # Mark as processed, to avoid re-processing in the future if we
-        # shouldn't send a message.
-        wh.processed_at = timezone.now()
-        wh.save()
-        return
+        return None
 
-    DiscordMessage.objects.create(
+    return DiscordMessage(
         channel_id=channel.channel_id,
         channel_name=channel.channel_name,
         content=f"Zammad: {wh.extra['message']}",
         # Mark as unsent - to be sent with the next batch
         sent_at=None,
     )
-    wh.processed_at = timezone.now()
-    wh.save()
+
+
+MESSAGE_BUILDERS = {
+    "internal": build_internal_message,
+    "github": build_github_message,
+    "zammad": build_zammad_message,
+}
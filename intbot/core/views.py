@@ -1,9 +1,5 @@
+from core.analysis.charts import latest_submissions_chart
 from core.analysis.products import latest_flat_product_data
-from core.analysis.submissions import (
-    group_submissions_by_state,
-    latest_flat_submissions_data,
-    piechart_submissions_by_state,
-)
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.template.response import TemplateResponse
@@ -51,19 +47,12 @@ def submissions(request):
     Show some basic aggregation of submissions data
     """
 
-    df = latest_flat_submissions_data()
-    by_state = group_submissions_by_state(df)
-    piechart = piechart_submissions_by_state(by_state)
+    piechart = latest_submissions_chart("submissions_by_state", "html")
 
     return TemplateResponse(
         request,
         "submissions.html",
         {
-            "piechart": mark_safe(
-                piechart.to_html(
-                    full_html=False,
-                    include_plotlyjs="cdn",
-                )
-            ),
+            "piechart": mark_safe(piechart),
         },
     )
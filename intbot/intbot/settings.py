@@ -122,6 +122,16 @@ TASKS: dict[str, Any]
 
 CONFERENCE_START = datetime(2025, 7, 14, tzinfo=timezone.utc)
 
+# Shared HTTP clients used by the integrations (see core.integrations.http)
+HTTP_CLIENT_TIMEOUT = 30.0  # seconds
+HTTP_CLIENT_CONNECT_TIMEOUT = 10.0  # seconds
+HTTP_CLIENT_MAX_CONNECTIONS = 20
+HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS = 10
+HTTP_CLIENT_KEEPALIVE_EXPIRY = 60.0  # seconds
+
+# Parquet snapshots of the downloaded data (see core.analysis.snapshots)
+SNAPSHOTS_DIR = BASE_DIR / ".." / "_snapshots"
+
 
 # There are bunch of settings that we can skip on dev/testing environments if
 # not used - that should be always present on prod/staging deployments.
@@ -237,6 +247,16 @@ if DJANGO_ENV == "dev":
         }
     }
 
+    # Database cache, so that it's shared between the web app, the worker and
+    # the bot. The table is created with `manage.py createcachetable`.
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "django_cache",
+            "OPTIONS": {"MAX_ENTRIES": 10_000},
+        }
+    }
+
     WEBHOOK_INTERNAL_TOKEN = "dev-token"
 
 
@@ -327,6 +347,16 @@ elif DJANGO_ENV == "local_container":
         }
     }
 
+    # Database cache, so that it's shared between the web app, the worker and
+    # the bot. The table is created with `manage.py createcachetable`.
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "django_cache",
+            "OPTIONS": {"MAX_ENTRIES": 10_000},
+        }
+    }
+
     # For 500 errors to appear on stderr
     LOGGING = {
         "version": 1,
@@ -374,6 +404,16 @@ elif DJANGO_ENV == "prod":
         }
     }
 
+    # Database cache, so that it's shared between the web app, the worker and
+    # the bot. The table is created with `manage.py createcachetable`.
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "django_cache",
+            "OPTIONS": {"MAX_ENTRIES": 10_000},
+        }
+    }
+
     # For 500 errors to appear on stderr
     # For now it's good for docker, in the future sentry/or rollabar should be
     # here
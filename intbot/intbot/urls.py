@@ -1,6 +1,7 @@
 from core.endpoints.basic import index
 from core.endpoints.webhooks import (
     github_webhook_endpoint,
+    internal_webhook_batch_endpoint,
     internal_webhook_endpoint,
     zammad_webhook_endpoint,
 )
@@ -13,6 +14,7 @@ urlpatterns = [
     path("", index),
     # Webhooks
     path("webhook/internal/", internal_webhook_endpoint),
+    path("webhook/internal/batch/", internal_webhook_batch_endpoint),
     path("webhook/github/", github_webhook_endpoint),
     path("webhook/zammad/", zammad_webhook_endpoint),
     # Public Pages
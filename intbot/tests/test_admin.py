@@ -2,7 +2,15 @@
 Sanity checks (mostly) if the admin resources are available
 """
 
-from core.models import DiscordMessage, PretalxData, PretixData, Webhook
+from core.models import (
+    DiscordMessage,
+    PretalxData,
+    PretixData,
+    PretixOrder,
+    PretixOrderPosition,
+    Webhook,
+)
+from django.utils import timezone
 
 
 def test_admin_for_webhooks_sanity_check(admin_client):
@@ -34,6 +42,50 @@ def test_admin_for_discordmessages_sanity_check(admin_client):
     assert dm.channel_name.encode() in response.content
 
 
+def test_admin_for_discordmessages_filters_dead_messages(admin_client):
+    url = "/admin/core/discordmessage/?status=dead"
+    alive = DiscordMessage.objects.create(channel_id="1", content="alive")
+    dead = DiscordMessage.objects.create(
+        channel_id="1", content="dead", attempts=8, dead_at=timezone.now()
+    )
+
+    response = admin_client.get(url)
+
+    assert response.status_code == 200
+    assert str(dead.uuid).encode() in response.content
+    assert str(alive.uuid).encode() not in response.content
+
+
+def test_admin_requeue_action_for_discordmessages(admin_client):
+    url = "/admin/core/discordmessage/"
+    dead = DiscordMessage.objects.create(
+        channel_id="1",
+        content="dead",
+        attempts=8,
+        last_error="Channel 1 does not exist",
+        dead_at=timezone.now(),
+    )
+    sent = DiscordMessage.objects.create(
+        channel_id="1", content="sent", sent_at=timezone.now()
+    )
+
+    response = admin_client.post(
+        url,
+        {"action": "requeue", "_selected_action": [dead.pk, sent.pk]},
+        follow=True,
+    )
+
+    assert response.status_code == 200
+    assert b"Requeued 1 message(s)" in response.content
+    dead.refresh_from_db()
+    assert dead.attempts == 0
+    assert dead.last_error == ""
+    assert dead.dead_at is None
+    assert dead.next_attempt_at is None
+    sent.refresh_from_db()
+    assert sent.sent_at is not None
+
+
 class TestPretalxDataAdmin:
     """This class exists only for namespacing purposes"""
 
@@ -100,3 +152,25 @@ class TestPretixDataAdmin:
         assert response.status_code == 200
         assert str(pd.uuid).encode() in response.content
         assert pd.get_resource_display().encode() in response.content
+
+
+def test_admin_change_for_pretix_order_with_positions(admin_client):
+    order = PretixOrder.objects.create(
+        event="ep2025",
+        code="ABC01",
+        status=PretixOrder.Status.paid,
+        content={},
+    )
+    PretixOrderPosition.objects.create(
+        order=order,
+        event="ep2025",
+        pretix_id=1234,
+        item_id=100,
+        attendee_name="Jane Doe",
+    )
+
+    response = admin_client.get(f"/admin/core/pretixorder/{order.pk}/change/")
+
+    assert response.status_code == 200
+    assert b"ABC01" in response.content
+    assert b"Jane Doe" in response.content
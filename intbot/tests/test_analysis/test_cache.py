@@ -0,0 +1,69 @@
+from decimal import Decimal
+
+import polars as pl
+import pytest
+from core.analysis.cache import (
+    analysis_cache_key,
+    cached_analysis,
+    frame_from_bytes,
+    frame_to_bytes,
+)
+from core.analysis.submissions import latest_submissions_by_state
+from core.models import PretalxData
+from polars.testing import assert_frame_equal
+
+
+def test_frame_to_bytes_and_back_keeps_the_schema():
+    df = pl.DataFrame(
+        {
+            "id": [1, None],
+            "name": ["a", "b"],
+            "price": [Decimal("500.00"), None],
+        }
+    )
+
+    assert_frame_equal(frame_from_bytes(frame_to_bytes(df)), df)
+
+
+@pytest.mark.django_db
+def test_cached_analysis_computes_results_once_per_download(create_submissions):
+    calls = []
+
+    @cached_analysis(version=1)
+    def count_submissions(pretalx_data):
+        calls.append(pretalx_data.uuid)
+        return pl.DataFrame({"count": [len(pretalx_data.content)]})
+
+    first = create_submissions(["submitted"])
+    second = create_submissions(["submitted", "accepted"])
+
+    assert count_submissions(first)["count"].to_list() == [1]
+    assert count_submissions(first)["count"].to_list() == [1]
+    assert count_submissions(second)["count"].to_list() == [2]
+    assert calls == [first.uuid, second.uuid]
+
+
+@pytest.mark.django_db
+def test_cached_analysis_key_depends_on_the_version(create_submissions):
+    pretalx_data = create_submissions([])
+
+    assert analysis_cache_key("count", 1, pretalx_data) != analysis_cache_key(
+        "count", 2, pretalx_data
+    )
+    assert str(pretalx_data.uuid) in analysis_cache_key("count", 1, pretalx_data)
+
+
+@pytest.mark.django_db
+def test_latest_submissions_by_state_is_cached_until_a_new_download(create_submissions):
+    create_submissions(["submitted", "submitted", "withdrawn"])
+
+    first = latest_submissions_by_state()
+
+    # Data of an existing download doesn't change, so that's not visible...
+    PretalxData.objects.update(content=[])
+    assert_frame_equal(latest_submissions_by_state(), first)
+
+    # ...but a new download is
+    create_submissions(["accepted"])
+    assert latest_submissions_by_state()["state"].to_list() == ["accepted"]
+    assert first["state"].to_list() == ["submitted", "withdrawn"]
@@ -0,0 +1,65 @@
+from unittest.mock import patch
+
+import pytest
+from core.analysis.charts import (
+    chart_cache_key,
+    get_submissions_chart,
+    latest_submissions_chart,
+)
+from core.tasks import prerender_charts
+from django.core.cache import cache
+
+
+class FakeFig:
+    def __init__(self):
+        self.renders = []
+
+    def to_image(self, *, format):
+        self.renders.append(format)
+        return b"PNG GOES HERE"
+
+    def to_html(self, *, full_html, include_plotlyjs):
+        self.renders.append("html")
+        return "<div>HTML GOES HERE</div>"
+
+
+@pytest.mark.django_db
+def test_get_submissions_chart_renders_once_per_download(create_submissions):
+    pretalx_data = create_submissions()
+    fig = FakeFig()
+
+    with patch("core.analysis.charts.piechart_submissions_by_state", return_value=fig):
+        first = get_submissions_chart("submissions_by_state", "png", pretalx_data)
+        second = get_submissions_chart("submissions_by_state", "png", pretalx_data)
+
+    assert first == second == b"PNG GOES HERE"
+    assert fig.renders == ["png"]
+
+
+@pytest.mark.django_db
+def test_latest_submissions_chart_renders_html(create_submissions):
+    create_submissions()
+
+    html = latest_submissions_chart("submissions_by_state", "html")
+
+    assert "plotly" in html
+    assert "submitted" in html
+
+
+@pytest.mark.django_db
+def test_prerender_charts_task_renders_all_formats(create_submissions):
+    pretalx_data = create_submissions()
+    fig = FakeFig()
+
+    with patch("core.analysis.charts.piechart_submissions_by_state", return_value=fig):
+        prerender_charts.enqueue(str(pretalx_data.uuid))
+
+    assert fig.renders == ["png", "html"]
+    assert (
+        cache.get(chart_cache_key("submissions_by_state", "png", pretalx_data))
+        == b"PNG GOES HERE"
+    )
+    assert (
+        cache.get(chart_cache_key("submissions_by_state", "html", pretalx_data))
+        == "<div>HTML GOES HERE</div>"
+    )
@@ -8,6 +8,8 @@ from core.analysis.products import (
     ProductVariation,
     flat_product_data,
     latest_flat_product_data,
+    parse_flat_product_data,
+    parse_latest_products_to_objects,
 )
 from core.models import PretixData
 from polars.testing import assert_frame_equal
@@ -273,3 +275,122 @@ def test_latest_flat_product_data():
     df = latest_flat_product_data()
 
     assert_frame_equal(df, expected)
+
+
+def product_json(product_id: int, variations: list[str]) -> dict:
+    return {
+        "id": product_id,
+        "name": {"en": f"Product {product_id}", "cs": f"Produkt {product_id}"},
+        "description": {"en": "Description"},
+        "default_price": "100.00",
+        "variations": [
+            {
+                "id": product_id * 10 + i,
+                "value": {"en": value},
+                "description": {"en": ""},
+                "price": f"{100 + i}.50",
+            }
+            for i, value in enumerate(variations)
+        ],
+    }
+
+
+def flat_product_data_with_pydantic(data: list[dict]) -> pl.DataFrame:
+    return flat_product_data([Product.model_validate(product) for product in data])
+
+
+@pytest.mark.django_db
+def test_parse_flat_product_data_is_the_same_as_with_pydantic(create_products):
+    data = [
+        product_json(1, ["Conference", "Late Conference", "Tutorials"]),
+        product_json(2, ["Combined (Conference + Tutorials)", "Late Combined"]),
+        # Without variations
+        product_json(3, []),
+        {
+            "id": 4,
+            "name": {"en": "Late Day Pass"},
+            "description": "Not localised",
+            "default_price": None,
+            "variations": [],
+        },
+        # Not localised at all
+        {
+            "id": 5,
+            "name": "Childcare",
+            "description": "",
+            "default_price": "0.00",
+            "variations": [
+                {"id": 51, "value": "Lately", "description": "", "price": "0.00"},
+            ],
+        },
+    ]
+
+    assert_frame_equal(
+        parse_flat_product_data(create_products(data)),
+        flat_product_data_with_pydantic(data),
+    )
+
+
+@pytest.mark.django_db
+def test_parse_flat_product_data_keeps_the_order_of_products(create_products):
+    data = [product_json(i, ["Conference"]) for i in [3, 1, 2]] + [product_json(4, [])]
+
+    df = parse_flat_product_data(create_products(data))
+
+    assert df["product_id"].to_list() == [3, 1, 2, 4]
+    assert_frame_equal(df, flat_product_data_with_pydantic(data))
+
+
+@pytest.mark.django_db
+def test_parse_flat_product_data_without_products(create_products):
+    assert parse_flat_product_data(create_products([])).shape == (0, 0)
+
+
+@pytest.mark.django_db
+def test_parse_flat_product_data_with_invalid_data(create_products):
+    with pytest.raises(ValueError, match="without id or name"):
+        parse_flat_product_data(create_products([{"not": "a product"}]))
+
+
+@pytest.mark.django_db
+def test_parse_latest_products_to_objects_of_unchanged_download(create_products):
+    original = create_products([product_json(1, ["Conference"])])
+    marker = create_products(None)
+    marker.same_as = original
+
+    assert parse_latest_products_to_objects(marker) == (
+        parse_latest_products_to_objects(original)
+    )
+
+    original.content = None
+    with pytest.raises(ValueError, match="has no content"):
+        parse_latest_products_to_objects(original)
+
+
+@pytest.mark.django_db
+def test_flat_product_data_from_rows_with_a_single_query(
+    create_products, django_assert_num_queries
+):
+    """
+    Flattening 1k products (with 4 variations each) from the database, with
+    pydantic models, and with polars expressions - from a single query,
+    without loading the JSON of the download.
+    """
+    pretix_data = create_products(
+        [
+            product_json(i, ["Conference", "Tutorials", "Late Conference", "Combined"])
+            for i in range(1000)
+        ]
+    )
+
+    products = parse_latest_products_to_objects(
+        PretixData.objects.get(pk=pretix_data.pk)
+    )
+    with_pydantic = flat_product_data(products)
+
+    download = PretixData.objects.defer("content").get(pk=pretix_data.pk)
+    with django_assert_num_queries(1):
+        with_polars = parse_flat_product_data(download)
+
+    assert with_polars.shape == (4000, 6)
+    assert_frame_equal(with_polars, with_pydantic)
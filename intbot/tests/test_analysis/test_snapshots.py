@@ -0,0 +1,184 @@
+import time
+
+import pytest
+from core.analysis.products import (
+    latest_flat_product_data,
+    parse_flat_product_data,
+    write_products_snapshot,
+)
+from core.analysis.snapshots import scan_snapshot, snapshot_path, try_write_snapshot
+from core.analysis.submissions import (
+    latest_flat_submissions_data,
+    latest_submissions_data,
+    parse_flat_submissions_data,
+    write_submissions_snapshot,
+)
+from core.models import PretalxData, PretixData
+from polars.testing import assert_frame_equal
+
+
+def submission_json(i: int) -> dict:
+    return {
+        "code": f"S{i:05}",
+        "state": ["submitted", "accepted", "rejected", "withdrawn"][i % 4],
+        "title": f"Talk number {i}",
+        "track": {"en": f"Track {i % 7}"},
+        "created": "2025-01-14T01:24:36",
+        "answers": [
+            {
+                "answer": "Intermediate",
+                "question": {"question": {"en": "Expected audience expertise"}},
+                "submission": f"S{i:05}",
+            },
+            {
+                "answer": "1. Introduction - 5 minutes" * 5,
+                "question": {"question": {"en": "Outline"}},
+                "submission": f"S{i:05}",
+            },
+        ],
+        "abstract": "Abstract " * 50,
+        "duration": 30,
+        "speakers": [],
+        "submission_type": {"en": "Talk"},
+    }
+
+
+def product_json() -> dict:
+    return {
+        "id": 100,
+        "name": {"en": "Business"},
+        "description": {"en": "Business ticket"},
+        "default_price": "500.00",
+        "variations": [
+            {
+                "id": 1,
+                "value": {"en": "Conference"},
+                "description": {"en": ""},
+                "price": "500.00",
+            },
+            {
+                "id": 2,
+                "value": {"en": "Late Tutorials"},
+                "description": {"en": ""},
+                "price": "450.00",
+            },
+        ],
+    }
+
+
+@pytest.mark.django_db
+def test_snapshot_path_is_per_event_and_resource(snapshots_dir):
+    pretalx_data = PretalxData.objects.create(
+        event="europython-2025",
+        resource=PretalxData.PretalxResources.submissions,
+        content=[],
+    )
+
+    path = snapshot_path(pretalx_data)
+
+    assert path.parent == snapshots_dir / "pretalx" / "europython-2025" / "submissions"
+    assert path.name.endswith(f"-{pretalx_data.uuid}.parquet")
+
+
+@pytest.mark.django_db
+def test_latest_flat_submissions_data_reads_the_snapshot():
+    pretalx_data = PretalxData.objects.create(
+        event="europython-2025",
+        resource=PretalxData.PretalxResources.submissions,
+        content=[submission_json(i) for i in range(10)],
+    )
+    expected = parse_flat_submissions_data(pretalx_data)
+    write_submissions_snapshot(pretalx_data)
+
+    # If the snapshot is there, the JSON is not used at all
+    PretalxData.objects.filter(pk=pretalx_data.pk).update(content=[])
+
+    assert_frame_equal(latest_flat_submissions_data(), expected)
+
+
+@pytest.mark.django_db
+def test_latest_submissions_data_reads_only_selected_columns():
+    pretalx_data = PretalxData.objects.create(
+        resource=PretalxData.PretalxResources.submissions,
+        content=[submission_json(i) for i in range(4)],
+    )
+    write_submissions_snapshot(pretalx_data)
+
+    df = latest_submissions_data("state")
+
+    assert df.columns == ["state"]
+    assert df["state"].to_list() == ["submitted", "accepted", "rejected", "withdrawn"]
+
+
+@pytest.mark.django_db
+def test_latest_flat_product_data_from_snapshot_has_the_same_schema():
+    pretix_data = PretixData.objects.create(
+        event="ep2025",
+        resource=PretixData.PretixResources.products,
+        content=[product_json()],
+    )
+    without_snapshot = latest_flat_product_data()
+
+    write_products_snapshot(pretix_data)
+
+    assert scan_snapshot(pretix_data) is not None
+    assert_frame_equal(latest_flat_product_data(), without_snapshot)
+    assert_frame_equal(without_snapshot, parse_flat_product_data(pretix_data))
+
+
+@pytest.mark.django_db
+def test_latest_flat_submissions_data_without_a_snapshot():
+    pretalx_data = PretalxData.objects.create(
+        resource=PretalxData.PretalxResources.submissions,
+        content=[submission_json(1)],
+    )
+
+    df = latest_flat_submissions_data()
+
+    assert scan_snapshot(pretalx_data) is None
+    assert df["code"].to_list() == ["S00001"]
+    assert df["level"].to_list() == ["Intermediate"]
+
+
+@pytest.mark.django_db
+def test_try_write_snapshot_doesnt_fail_on_invalid_data():
+    pretix_data = PretixData.objects.create(
+        resource=PretixData.PretixResources.products,
+        content=[{"not": "a product"}],
+    )
+
+    assert try_write_snapshot(write_products_snapshot, pretix_data) is None
+    assert scan_snapshot(pretix_data) is None
+
+
+@pytest.mark.slow
+@pytest.mark.django_db
+def test_benchmark_submissions_from_json_and_from_snapshot():
+    """
+    Submissions by state, for 5k submissions: parsing the JSON from the
+    database (with pydantic), and scanning only the `state` column of the
+    Parquet snapshot.
+    """
+    pretalx_data = PretalxData.objects.create(
+        event="europython-2025",
+        resource=PretalxData.PretalxResources.submissions,
+        content=[submission_json(i) for i in range(5000)],
+    )
+
+    start = time.monotonic()
+    from_json = latest_flat_submissions_data().group_by("state").len()
+    json_time = time.monotonic() - start
+
+    path = write_submissions_snapshot(pretalx_data)
+
+    start = time.monotonic()
+    from_snapshot = latest_submissions_data("state").group_by("state").len()
+    snapshot_time = time.monotonic() - start
+
+    print(
+        f"\nJSONField + pydantic: {json_time * 1000:.1f}ms"
+        f"\nParquet scan:         {snapshot_time * 1000:.1f}ms"
+        f"\nsnapshot size:        {path.stat().st_size / 1024:.0f}KiB"
+    )
+    assert_frame_equal(from_json, from_snapshot, check_row_order=False)
+    assert snapshot_time < json_time
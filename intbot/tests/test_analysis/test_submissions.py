@@ -1,3 +1,4 @@
+import time
 from datetime import datetime
 
 import polars as pl
@@ -6,7 +7,10 @@ from core.analysis.submissions import (
     Submission,
     group_submissions_by_state,
     latest_flat_submissions_data,
+    parse_latest_submissions_to_objects,
+    parse_submissions,
     piechart_submissions_by_state,
+    write_submissions_snapshot,
 )
 from core.models import PretalxData
 from polars.testing import assert_frame_equal
@@ -177,3 +181,122 @@ def test_piechart_submissions_by_state():
     # There are actually no assertions here, just running this code in case it
     # fails :D
     piechart_submissions_by_state(df)
+
+
+def submission_with_answers(code: str, answers: list[tuple]) -> dict:
+    return {
+        "code": code,
+        "state": "submitted",
+        "title": "Title",
+        "track": None,
+        "created": "2025-01-14T01:24:36",
+        "answers": [
+            {
+                "answer": answer,
+                "question": {"question": {"en": question}},
+                "submission": submission,
+            }
+            for question, answer, submission in answers
+        ],
+        "abstract": "Abstract",
+        "duration": 30,
+        "submission_type": {"en": "Talk"},
+    }
+
+
+def test_parse_submissions_extracts_answers_to_submission_questions():
+    data = [
+        submission_with_answers(
+            "ABCDEF",
+            [
+                ("Expected audience expertise", "Advanced", "ABCDEF"),
+                ("Outline", "1. Introduction", "ABCDEF"),
+                ("Company", "Python Software Foundation", "ABCDEF"),
+                # Answer to a question about the speaker
+                ("Outline", "Speaker outline", None),
+            ],
+        ),
+        submission_with_answers("GHIJKL", []),
+    ]
+
+    submissions = parse_submissions(data)
+
+    assert [s.code for s in submissions] == ["ABCDEF", "GHIJKL"]
+    assert submissions[0].level == "Advanced"
+    assert submissions[0].outline == "1. Introduction"
+    assert submissions[0].submission_type == "Talk"
+    assert submissions[1].level == ""
+    assert submissions[1].outline is None
+
+
+@pytest.mark.django_db
+def test_parse_latest_submissions_to_objects_from_the_snapshot():
+    _create_pretalx_data()
+    pretalx_data = PretalxData.objects.get()
+    from_json = parse_latest_submissions_to_objects(pretalx_data)
+    write_submissions_snapshot(pretalx_data)
+
+    # The snapshot was validated when it was written, and is used instead
+    PretalxData.objects.update(content=[{"invalid": "submission"}])
+    pretalx_data.refresh_from_db()
+
+    assert parse_latest_submissions_to_objects(pretalx_data) == from_json
+
+
+@pytest.mark.django_db
+def test_parse_latest_submissions_to_objects_of_unchanged_download():
+    _create_pretalx_data()
+    original = PretalxData.objects.get()
+    marker = PretalxData.objects.create(
+        resource=PretalxData.PretalxResources.submissions,
+        content=None,
+        same_as=original,
+    )
+
+    assert parse_latest_submissions_to_objects(
+        marker, use_snapshot=False
+    ) == parse_latest_submissions_to_objects(original, use_snapshot=False)
+
+    PretalxData.objects.filter(pk=original.pk).update(content=None)
+    with pytest.raises(ValueError, match="has no content"):
+        parse_latest_submissions_to_objects(marker, use_snapshot=False)
+
+
+@pytest.mark.slow
+@pytest.mark.django_db
+def test_benchmark_parse_submissions_from_json_and_from_snapshot():
+    """
+    20k submissions (with a dozen answers each): validated from the JSON, and
+    from the snapshot written at download time.
+    """
+    answers = [
+        ("Expected audience expertise", "Intermediate", "S"),
+        ("Outline", "Outline", "S"),
+    ]
+    answers += [(f"Question {i}", "Answer", "S") for i in range(5)]
+    answers += [(f"Speaker question {i}", "Answer", None) for i in range(5)]
+    pretalx_data = PretalxData.objects.create(
+        resource=PretalxData.PretalxResources.submissions,
+        content=[submission_with_answers(f"S{i:05}", answers) for i in range(20_000)],
+    )
+    write_submissions_snapshot(pretalx_data)
+
+    # Content of the download is loaded only if it's needed
+    pretalx_data = PretalxData.objects.defer("content").get(pk=pretalx_data.pk)
+
+    start = time.monotonic()
+    from_json = parse_latest_submissions_to_objects(pretalx_data, use_snapshot=False)
+    json_time = time.monotonic() - start
+
+    pretalx_data = PretalxData.objects.defer("content").get(pk=pretalx_data.pk)
+
+    start = time.monotonic()
+    from_snapshot = parse_latest_submissions_to_objects(pretalx_data)
+    snapshot_time = time.monotonic() - start
+
+    print(
+        f"\nvalidated from JSON:    {json_time * 1000:.1f}ms"
+        f"\nfrom snapshot:          {snapshot_time * 1000:.1f}ms"
+    )
+    assert from_snapshot == from_json
+    assert snapshot_time < json_time
@@ -0,0 +1,791 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from unittest.mock import AsyncMock, Mock
+
+import discord
+import psycopg
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from core.bot.delivery import (
+    BACKOFF_BASE,
+    BACKOFF_MAX,
+    CLAIM_LEASE,
+    MAX_ATTEMPTS,
+    MESSAGE_LENGTH_LIMIT,
+    NOTIFY_CHANNEL,
+    ChannelSender,
+    RateLimiter,
+    backoff,
+    claim_messages,
+    coalesce,
+    deliver,
+    latency_stats,
+    listen_for_new_messages,
+    notify_new_messages,
+    parse_notification_payload,
+    recent_latency_stats,
+    record_failure,
+    release_messages,
+)
+from core.models import DiscordMessage
+from django.db import connection, transaction
+from django.utils import timezone
+from freezegun import freeze_time
+
+
+def listening_connection() -> psycopg.Connection:
+    db = connection.settings_dict
+    conn = psycopg.connect(
+        dbname=db["NAME"],
+        user=db["USER"],
+        password=db["PASSWORD"],
+        host=db["HOST"],
+        port=db["PORT"],
+        autocommit=True,
+    )
+    conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+    return conn
+
+
+@pytest.mark.django_db(transaction=True)
+def test_notify_new_messages_notifies_only_after_commit():
+    with listening_connection() as conn:
+        with transaction.atomic():
+            dm = DiscordMessage.objects.create(channel_id="1234", content="asdf")
+            notify_new_messages([dm])
+
+            # Nothing until the transaction commits
+            assert list(conn.notifies(timeout=0.1, stop_after=1)) == []
+
+        notifications = list(conn.notifies(timeout=1, stop_after=1))
+
+    assert len(notifications) == 1
+    assert notifications[0].channel == NOTIFY_CHANNEL
+    assert notifications[0].payload == str(dm.pk)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_notify_new_messages_splits_big_batches(monkeypatch):
+    monkeypatch.setattr("core.bot.delivery.NOTIFY_BATCH_SIZE", 2)
+    messages = [
+        DiscordMessage.objects.create(channel_id="1234", content=f"{i}")
+        for i in range(3)
+    ]
+
+    with listening_connection() as conn:
+        notify_new_messages(messages)
+        notifications = list(conn.notifies(timeout=1, stop_after=2))
+
+    pks = [pk for n in notifications for pk in parse_notification_payload(n.payload)]
+    assert len(notifications) == 2
+    assert pks == [m.pk for m in messages]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_notify_new_messages_does_nothing_without_messages():
+    with listening_connection() as conn:
+        notify_new_messages([])
+
+        assert list(conn.notifies(timeout=0.1, stop_after=1)) == []
+
+
+def test_parse_notification_payload():
+    assert parse_notification_payload("1,22,333") == [1, 22, 333]
+    assert parse_notification_payload("") == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_listen_for_new_messages_calls_back_with_notified_pks():
+    received = asyncio.Event()
+    pks = []
+
+    async def on_new_messages(new_pks):
+        pks.extend(new_pks)
+        received.set()
+
+    listener = asyncio.create_task(listen_for_new_messages(on_new_messages))
+
+    @sync_to_async
+    def notify():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [NOTIFY_CHANNEL, "1,2"])
+
+    try:
+        # We don't know exactly when the listener starts listening, so keep
+        # notifying until it picks it up.
+        for _ in range(50):
+            await notify()
+            try:
+                await asyncio.wait_for(received.wait(), timeout=0.1)
+                break
+            except TimeoutError:
+                continue
+    finally:
+        listener.cancel()
+        # Let it close the connection
+        await asyncio.gather(listener, return_exceptions=True)
+
+    assert pks[:2] == [1, 2]
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_listen_for_new_messages_returns_when_sending_fails():
+    async def on_new_messages(new_pks):
+        raise discord.HTTPException(Mock(status=500), "Server error")
+
+    listener = asyncio.create_task(listen_for_new_messages(on_new_messages))
+
+    @sync_to_async
+    def notify():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [NOTIFY_CHANNEL, "1"])
+
+    try:
+        for _ in range(50):
+            await notify()
+            try:
+                # Returns instead of raising, so the bot can listen again
+                await asyncio.wait_for(asyncio.shield(listener), timeout=0.1)
+                break
+            except TimeoutError:
+                continue
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+    assert listener.done() and not listener.cancelled()
+    assert listener.exception() is None
+
+
+def test_latency_stats():
+    stats = latency_stats([0.1, 0.2, 0.3, 0.4, 10.0])
+
+    assert stats["count"] == 5
+    assert stats["median"] == 0.3
+    assert stats["max"] == 10.0
+    assert 0.4 < stats["p95"] < 10.0
+
+
+def test_latency_stats_edge_cases():
+    assert latency_stats([]) == {}
+    assert latency_stats([0.5]) == {"count": 1, "median": 0.5, "p95": 0.5, "max": 0.5}
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_recent_latency_stats_skips_unsent_messages():
+    dm = await DiscordMessage.objects.acreate(channel_id="1234", content="sent")
+    dm.sent_at = dm.created_at + timedelta(milliseconds=250)
+    await dm.asave()
+    await DiscordMessage.objects.acreate(channel_id="1234", content="unsent")
+
+    stats = await recent_latency_stats()
+
+    assert stats["count"] == 1
+    assert stats["max"] == 0.25
+
+
+def test_discord_message_delivery_latency():
+    now = timezone.now()
+
+    assert DiscordMessage(created_at=now).delivery_latency() is None
+    assert DiscordMessage(
+        created_at=now, sent_at=now + timedelta(seconds=2)
+    ).delivery_latency() == timedelta(seconds=2)
+
+
+class Concurrency:
+    """Number of sends in progress, and the most of them at the same time"""
+
+    def __init__(self):
+        self.current = 0
+        self.max = 0
+
+    def __enter__(self):
+        self.current += 1
+        self.max = max(self.max, self.current)
+
+    def __exit__(self, *exc_info):
+        self.current -= 1
+
+
+class FakeChannel:
+    """Stand-in for a discord channel, that takes `latency` to send a message"""
+
+    def __init__(self, channel_id: int, latency: float = 0.0):
+        self.id = channel_id
+        self.latency = latency
+        self.sent: list[str] = []
+        self.concurrency = Concurrency()
+        # Sends to all the channels of the bot
+        self.bot_concurrency = Concurrency()
+
+    async def send(self, content, **kwargs):
+        with self.concurrency, self.bot_concurrency:
+            await asyncio.sleep(self.latency)
+        self.sent.append(content)
+
+
+class FakeBot:
+    def __init__(self, channels: list[FakeChannel]):
+        self.channels = {channel.id: channel for channel in channels}
+        self.concurrency = Concurrency()
+        for channel in channels:
+            channel.bot_concurrency = self.concurrency
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_waits_when_limit_is_reached():
+    limiter = RateLimiter(rate=2, per=0.2)
+    start = time.monotonic()
+
+    for _ in range(5):
+        await limiter.acquire()
+
+    # 2 right away, 2 after 0.2s, and the last one after 0.4s
+    assert 0.4 <= time.monotonic() - start < 0.6
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_doesnt_wait_below_the_limit():
+    limiter = RateLimiter(rate=5, per=5.0)
+    start = time.monotonic()
+
+    for _ in range(5):
+        await limiter.acquire()
+
+    assert time.monotonic() - start < 0.1
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_channel_sender_keeps_order_within_channel_and_marks_sent():
+    bot = FakeBot([FakeChannel(1), FakeChannel(2)])
+    messages = [
+        await DiscordMessage.objects.acreate(channel_id=channel_id, content=content)
+        for channel_id, content in [
+            ("1", "a1"),
+            ("2", "b1"),
+            ("1", "a2"),
+            ("2", "b2"),
+            ("1", "a3"),
+        ]
+    ]
+
+    sent = await ChannelSender(bot).send(messages)
+
+    assert len(sent) == 5
+    # Short messages for the same channel are merged into one post
+    assert bot.channels[1].sent == ["a1\na2\na3"]
+    assert bot.channels[2].sent == ["b1\nb2"]
+    assert not await DiscordMessage.objects.filter(sent_at__isnull=True).aexists()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_channel_sender_sends_to_channels_concurrently():
+    bot = FakeBot([FakeChannel(i, latency=0.1) for i in range(1, 6)])
+    messages = [
+        await DiscordMessage.objects.acreate(channel_id=str(i), content="asdf")
+        for i in range(1, 6)
+    ]
+
+    await ChannelSender(bot).send(messages)
+
+    assert bot.concurrency.max == 5
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_channel_sender_skips_channels_that_dont_exist():
+    bot = FakeBot([FakeChannel(1)])
+    dm1 = await DiscordMessage.objects.acreate(channel_id="1", content="asdf")
+    dm2 = await DiscordMessage.objects.acreate(channel_id="2", content="asdf")
+
+    sent = await ChannelSender(bot).send([dm1, dm2])
+
+    assert sent == [dm1]
+    await dm2.arefresh_from_db()
+    assert dm2.sent_at is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_channel_sender_failing_channel_doesnt_affect_other_channels():
+    broken = Mock(id=1, send=AsyncMock(side_effect=Exception("Discord is down")))
+    bot = FakeBot([broken, FakeChannel(2)])
+    dm1 = await DiscordMessage.objects.acreate(channel_id="1", content="asdf")
+    dm2 = await DiscordMessage.objects.acreate(channel_id="2", content="asdf")
+
+    sent = await ChannelSender(bot).send([dm1, dm2])
+
+    assert sent == [dm2]
+    await dm1.arefresh_from_db()
+    await dm2.arefresh_from_db()
+    assert dm1.sent_at is None
+    assert dm2.sent_at is not None
+
+
+def field_change(item, field, from_, to, sender="@user"):
+    template = f"GitHub: {sender} changed **{field}** of **{item}**"
+    template += " from **{from}** to **{to}**"
+    return DiscordMessage(
+        channel_id="1",
+        content=template.format(**{"from": from_, "to": to}),
+        meta={
+            "coalesce_key": f"github:{item}:{field}",
+            "template": template,
+            "from": from_,
+            "to": to,
+        },
+    )
+
+
+def test_coalesce_merges_messages_into_one_post():
+    messages = [DiscordMessage(channel_id="1", content=f"{i}") for i in range(3)]
+
+    posts = coalesce(messages)
+
+    assert len(posts) == 1
+    assert posts[0].content == "0\n1\n2"
+    assert posts[0].messages == messages
+
+
+def test_coalesce_doesnt_change_a_single_message():
+    message = field_change("Issue", "Status", "To Do", "Done")
+
+    posts = coalesce([message])
+
+    assert len(posts) == 1
+    assert posts[0].content == message.content
+    assert posts[0].messages == [message]
+
+
+def test_coalesce_splits_posts_at_discord_message_limit():
+    messages = [
+        DiscordMessage(channel_id="1", content="x" * 900),
+        DiscordMessage(channel_id="1", content="y" * 900),
+        DiscordMessage(channel_id="1", content="z" * 900),
+    ]
+
+    posts = coalesce(messages)
+
+    assert [len(post.content) for post in posts] == [1801, 900]
+    assert all(len(post.content) <= MESSAGE_LENGTH_LIMIT for post in posts)
+    assert [len(post.messages) for post in posts] == [2, 1]
+
+
+def test_coalesce_collapses_successive_changes_of_the_same_field():
+    messages = [
+        field_change("Issue", "Status", "To Do", "In Progress"),
+        field_change("Issue", "Status", "In Progress", "Review", sender="@other"),
+        field_change("Issue", "Status", "Review", "Done"),
+        DiscordMessage(channel_id="1", content="Something else"),
+        field_change("Issue", "Due Date", "None", "2025-07-14"),
+    ]
+
+    posts = coalesce(messages)
+
+    assert len(posts) == 1
+    assert posts[0].content.split("\n") == [
+        "GitHub: @user changed **Status** of **Issue** from **To Do** to **Done**",
+        "Something else",
+        "GitHub: @user changed **Due Date** of **Issue** from **None** to **2025-07-14**",
+    ]
+    # All of them are covered by the post, so all of them get marked as sent
+    assert posts[0].messages == messages
+
+
+def test_coalesce_keeps_order_of_changes():
+    messages = [
+        field_change("Issue", "Status", "To Do", "In Progress"),
+        DiscordMessage(channel_id="1", content="Something else"),
+        field_change("Issue", "Status", "In Progress", "Done"),
+    ]
+
+    posts = coalesce(messages)
+
+    assert posts[0].content.split("\n") == [m.content for m in messages]
+    assert posts[0].messages == messages
+
+
+def test_coalesce_drops_reverted_changes():
+    messages = [
+        DiscordMessage(channel_id="1", content="Something else"),
+        field_change("Issue", "Status", "To Do", "Done"),
+        field_change("Issue", "Status", "Done", "To Do"),
+    ]
+
+    posts = coalesce(messages)
+
+    assert len(posts) == 1
+    assert posts[0].content == "Something else"
+    assert posts[0].messages == messages
+
+
+def test_coalesce_with_only_reverted_changes():
+    messages = [
+        field_change("Issue", "Status", "To Do", "Done"),
+        field_change("Issue", "Status", "Done", "To Do"),
+        DiscordMessage(channel_id="1", content="Something else"),
+    ]
+
+    posts = coalesce(messages)
+
+    assert len(posts) == 1
+    assert posts[0].content == "Something else"
+    assert posts[0].messages == messages
+
+    posts = coalesce(messages[:2])
+
+    assert len(posts) == 1
+    assert posts[0].content == ""
+    assert posts[0].messages == messages[:2]
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_channel_sender_doesnt_send_empty_posts():
+    channel = FakeChannel(1)
+    messages = [
+        field_change("Issue", "Status", "To Do", "Done"),
+        field_change("Issue", "Status", "Done", "To Do"),
+    ]
+    await DiscordMessage.objects.abulk_create(messages)
+
+    sent = await ChannelSender(FakeBot([channel])).send(messages)
+
+    assert sent == messages
+    assert channel.sent == []
+
+
+def test_coalesce_keeps_different_items_separate():
+    messages = [
+        field_change("Issue 1", "Status", "To Do", "Done"),
+        field_change("Issue 2", "Status", "To Do", "Done"),
+    ]
+
+    posts = coalesce(messages)
+
+    assert posts[0].content.split("\n") == [m.content for m in messages]
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_channel_sender_marks_all_merged_messages_as_sent():
+    bot = FakeBot([FakeChannel(1)])
+    messages = [
+        field_change("Issue", "Status", "To Do", "In Progress"),
+        field_change("Issue", "Status", "In Progress", "Done"),
+    ]
+    await DiscordMessage.objects.abulk_create(messages)
+
+    await ChannelSender(bot).send(messages)
+
+    assert bot.channels[1].sent == [
+        "GitHub: @user changed **Status** of **Issue** from **To Do** to **Done**"
+    ]
+    sent_at = {m.sent_at async for m in DiscordMessage.objects.all()}
+    assert len(sent_at) == 1
+    assert None not in sent_at
+
+
+@pytest.mark.django_db
+def test_claim_messages_claims_only_unsent_and_unclaimed_messages():
+    DiscordMessage.objects.create(channel_id="1", sent_at=timezone.now())
+    DiscordMessage.objects.create(
+        channel_id="1", claimed_by="other", claimed_at=timezone.now()
+    )
+    dm = DiscordMessage.objects.create(channel_id="1")
+
+    claimed = claim_messages(DiscordMessage.objects.all(), "worker")
+
+    assert claimed == [dm]
+    dm.refresh_from_db()
+    assert dm.claimed_by == "worker"
+    assert dm.claimed_at is not None
+
+
+@pytest.mark.django_db
+def test_claim_messages_respects_the_limit():
+    for _ in range(3):
+        DiscordMessage.objects.create(channel_id="1")
+
+    first = claim_messages(DiscordMessage.objects.order_by("created_at"), "a", 2)
+    second = claim_messages(DiscordMessage.objects.order_by("created_at"), "b", 2)
+
+    assert len(first) == 2
+    assert len(second) == 1
+    assert not set(first) & set(second)
+
+
+@pytest.mark.django_db
+def test_expired_claims_can_be_claimed_again():
+    dm = DiscordMessage.objects.create(channel_id="1")
+
+    with freeze_time(timezone.now()) as frozen:
+        assert claim_messages(DiscordMessage.objects.all(), "dead") == [dm]
+        assert claim_messages(DiscordMessage.objects.all(), "alive") == []
+
+        frozen.tick(CLAIM_LEASE + timedelta(seconds=1))
+
+        assert claim_messages(DiscordMessage.objects.all(), "alive") == [dm]
+
+
+@pytest.mark.django_db
+def test_release_messages_releases_only_own_unsent_claims():
+    mine = DiscordMessage.objects.create(channel_id="1")
+    claim_messages(DiscordMessage.objects.all(), "mine")
+    other = DiscordMessage.objects.create(channel_id="1")
+    claim_messages(DiscordMessage.objects.filter(pk=other.pk), "other")
+
+    release_messages([mine, other], "mine")
+
+    mine.refresh_from_db()
+    other.refresh_from_db()
+    assert mine.claimed_by == ""
+    assert mine.claimed_at is None
+    assert other.claimed_by == "other"
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_deliver_releases_messages_that_were_not_sent():
+    bot = FakeBot([FakeChannel(1)])
+    dm1 = await DiscordMessage.objects.acreate(channel_id="1", content="asdf")
+    dm2 = await DiscordMessage.objects.acreate(channel_id="2", content="asdf")
+
+    sent = await deliver(ChannelSender(bot), DiscordMessage.objects.all(), "me")
+
+    assert sent == [dm1]
+    await dm2.arefresh_from_db()
+    assert dm2.sent_at is None
+    assert dm2.claimed_at is None
+
+
+def test_backoff_doubles_up_to_the_max():
+    assert backoff(1) == BACKOFF_BASE
+    assert backoff(2) == BACKOFF_BASE * 2
+    assert backoff(3) == BACKOFF_BASE * 4
+    assert backoff(100) == BACKOFF_MAX
+
+
+@freeze_time("2025-01-01 12:00:00")
+def test_record_failure_schedules_the_next_attempt():
+    message = DiscordMessage(channel_id="1", claimed_by="me", claimed_at=timezone.now())
+
+    record_failure(message, "Discord is down")
+
+    assert message.attempts == 1
+    assert message.last_error == "Discord is down"
+    assert message.next_attempt_at == timezone.now() + BACKOFF_BASE
+    assert message.dead_at is None
+    assert message.claimed_by == ""
+    assert message.claimed_at is None
+
+
+@freeze_time("2025-01-01 12:00:00")
+def test_record_failure_marks_message_as_dead_after_max_attempts():
+    message = DiscordMessage(channel_id="1", attempts=MAX_ATTEMPTS - 1)
+
+    record_failure(message, "Discord is down")
+
+    assert message.attempts == MAX_ATTEMPTS
+    assert message.dead_at == timezone.now()
+    assert message.next_attempt_at is None
+
+
+@pytest.mark.django_db
+def test_claim_messages_skips_dead_messages_and_messages_not_due_yet():
+    now = timezone.now()
+    DiscordMessage.objects.create(channel_id="1", dead_at=now)
+    DiscordMessage.objects.create(
+        channel_id="1", next_attempt_at=now + timedelta(minutes=1)
+    )
+    due = DiscordMessage.objects.create(
+        channel_id="1", next_attempt_at=now - timedelta(minutes=1)
+    )
+
+    claimed = claim_messages(DiscordMessage.objects.all(), "worker")
+
+    assert claimed == [due]
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_channel_sender_records_failures():
+    broken = Mock(id=1, send=AsyncMock(side_effect=Exception("Discord is down")))
+    bot = FakeBot([broken])
+    dm1 = await DiscordMessage.objects.acreate(channel_id="1", content="asdf")
+    dm2 = await DiscordMessage.objects.acreate(channel_id="2", content="asdf")
+
+    sent = await ChannelSender(bot).send([dm1, dm2])
+
+    assert sent == []
+    await dm1.arefresh_from_db()
+    await dm2.arefresh_from_db()
+    assert dm1.attempts == 1
+    assert "Discord is down" in dm1.last_error
+    assert dm1.next_attempt_at is not None
+    assert dm2.attempts == 1
+    assert dm2.last_error == "Channel 2 does not exist"
+    assert dm2.next_attempt_at is not None
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_channel_sender_failing_post_doesnt_stop_the_channel():
+    # Long enough that every message is a separate post
+    content = "x" * (MESSAGE_LENGTH_LIMIT // 2 + 1)
+    channel = FakeChannel(1)
+    fail_once = AsyncMock(side_effect=[Exception("Discord is down"), None])
+    channel.send = fail_once
+    bot = FakeBot([channel])
+    dm1 = await DiscordMessage.objects.acreate(channel_id="1", content=content)
+    dm2 = await DiscordMessage.objects.acreate(channel_id="1", content=content)
+
+    sent = await ChannelSender(bot).send([dm1, dm2])
+
+    assert sent == [dm2]
+    await dm1.arefresh_from_db()
+    assert dm1.sent_at is None
+    assert dm1.attempts == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_deliver_doesnt_retry_failed_messages_right_away():
+    bot = FakeBot([])
+    await DiscordMessage.objects.acreate(channel_id="1", content="asdf")
+    sender = ChannelSender(bot)
+
+    # Same loop as in the bot, which would never end without backoff
+    rounds = 0
+    while await deliver(sender, DiscordMessage.objects.all(), "me") or rounds < 3:
+        rounds += 1
+
+    dm = await DiscordMessage.objects.aget()
+    assert dm.attempts == 1
+
+
+def run_in_threads(target, count: int = 2):
+    """Run `target` in `count` threads at once, each with its own connection"""
+    barrier = threading.Barrier(count)
+
+    def run(worker):
+        try:
+            barrier.wait()
+            target(worker)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(f"w{i}",)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_claims_never_overlap():
+    DiscordMessage.objects.bulk_create(
+        [DiscordMessage(channel_id="1", content=f"{i}") for i in range(200)]
+    )
+    claims: dict[str, list[int]] = {}
+
+    def claim_until_empty(worker):
+        claims[worker] = []
+        while claimed := claim_messages(DiscordMessage.objects.all(), worker, 7):
+            claims[worker] += [m.pk for m in claimed]
+            DiscordMessage.objects.filter(pk__in=[m.pk for m in claimed]).update(
+                sent_at=timezone.now()
+            )
+
+    run_in_threads(claim_until_empty)
+
+    assert claims["w0"]
+    assert claims["w1"]
+    assert not set(claims["w0"]) & set(claims["w1"])
+    assert len(claims["w0"]) + len(claims["w1"]) == 200
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_senders_deliver_every_message_exactly_once():
+    channels = [FakeChannel(i, latency=0.001) for i in range(1, 4)]
+    DiscordMessage.objects.bulk_create(
+        [
+            DiscordMessage(channel_id=str(i % 3 + 1), content=f"message-{i}")
+            for i in range(300)
+        ]
+    )
+
+    def send_until_empty(worker):
+        # Separate sender (and event loop) per worker, as if those were two
+        # separate bot processes
+        sender = ChannelSender(FakeBot(channels), rate=10_000, per=1.0)
+        messages = DiscordMessage.objects.order_by("created_at")
+
+        async def run():
+            while await deliver(sender, messages, worker):
+                pass
+
+        # async_to_sync runs the ORM calls from `deliver` back in this thread,
+        # so every worker uses its own database connection.
+        async_to_sync(run)()
+
+    run_in_threads(send_until_empty)
+
+    delivered = Counter(
+        line
+        for channel in channels
+        for post in channel.sent
+        for line in post.split("\n")
+    )
+    assert len(delivered) == 300
+    assert set(delivered.values()) == {1}
+    assert not DiscordMessage.objects.filter(sent_at__isnull=True).exists()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_channel_sender_throughput():
+    """
+    1000 queued messages across 10 channels, with every send taking 5ms - sent
+    to all the channels at the same time, and one by one (in order) to each.
+
+    The rate limit is turned off here, because with the real one (5 messages
+    per 5 seconds per channel) this would take over a minute and a half no
+    matter how we send them.
+
+    Every message is over half of MESSAGE_LENGTH_LIMIT, so that no two of them
+    can be merged into one post, and every one of them is sent on its own.
+    """
+    channels = [FakeChannel(i, latency=0.005) for i in range(10)]
+    bot = FakeBot(channels)
+    padding = "x" * (MESSAGE_LENGTH_LIMIT // 2)
+
+    await DiscordMessage.objects.abulk_create(
+        [
+            DiscordMessage(channel_id=str(i % 10), content=f"Message {i} {padding}")
+            for i in range(1000)
+        ]
+    )
+    messages = [m async for m in DiscordMessage.objects.order_by("created_at")]
+
+    sent = await ChannelSender(bot, rate=10_000, per=1.0).send(messages)
+
+    assert len(sent) == 1000
+    assert bot.concurrency.max == 10
+    for channel in channels:
+        assert channel.concurrency.max == 1
+        assert channel.sent == [
+            m.content for m in messages if m.channel_id == str(channel.id)
+        ]
@@ -1,17 +1,76 @@
-from unittest.mock import AsyncMock, patch
+import asyncio
+import time
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import discord
 import pytest
+from core.bot.inbox import (
+    EMBED_DESCRIPTION_LIMIT,
+    SUMMARY_FIELDS,
+    InboxBuffer,
+    InboxFilters,
+    InboxFlags,
+    InboxView,
+    MessageCache,
+    inbox_page,
+    write_inbox_changes,
+)
 from core.bot.main import (
     INBOX_EMOJI,
+    bot,
     inbox,
+    on_raw_message_edit,
     on_raw_reaction_add,
     on_raw_reaction_remove,
 )
 from core.models import InboxItem
+from discord.ext import commands
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 
+@pytest.fixture(autouse=True)
+def buffer():
+    """Fresh inbox buffer (and message cache) of the bot for every test"""
+    with (
+        patch("core.bot.main.inbox_buffer", InboxBuffer()) as buffer,
+        patch("core.bot.main.message_cache", MessageCache()),
+    ):
+        yield buffer
+
+
+def create_inbox_items(count: int, start: int = 1000, **fields) -> list[InboxItem]:
+    """Inbox items of the user 12345, all saved at the same time"""
+    return InboxItem.objects.bulk_create(
+        [
+            InboxItem(
+                **{
+                    "message_id": str(start + i),
+                    "channel_id": "222222",
+                    "channel_name": "#test-channel",
+                    "server_id": "333333",
+                    "user_id": "12345",
+                    "author": "Test User",
+                    "content": f"Test message {i}",
+                    **fields,
+                }
+            )
+            for i in range(count)
+        ]
+    )
+
+
+def all_pages(user_id: str, filters: InboxFilters = InboxFilters(), **kwargs):
+    page = inbox_page(user_id, filters, **kwargs)
+    pages = [page]
+    while page.has_next:
+        page = inbox_page(user_id, filters, after=page.cursor, **kwargs)
+        pages.append(page)
+    return pages
+
+
 @pytest.mark.asyncio
 @pytest.mark.django_db
 async def test_inbox_command_with_empty_inbox():
@@ -77,7 +136,7 @@ async def test_inbox_command_with_items():
 
 @pytest.mark.asyncio
 @pytest.mark.django_db
-async def test_on_raw_reaction_add_creates_inbox_item():
+async def test_on_raw_reaction_add_creates_inbox_item(buffer):
     """Test that reacting with the inbox emoji creates a new inbox item."""
     # Create mock payload
     payload = AsyncMock()
@@ -103,6 +162,9 @@ async def test_on_raw_reaction_add_creates_inbox_item():
         # Call the event handler
         await on_raw_reaction_add(payload)
 
+    # Save the buffered inbox item
+    await buffer.flush()
+
     # Check that an inbox item was created with the correct data
     items = await InboxItem.objects.filter(
         message_id="111111", user_id="12345"
@@ -113,7 +175,7 @@ async def test_on_raw_reaction_add_creates_inbox_item():
 
 @pytest.mark.asyncio
 @pytest.mark.django_db
-async def test_on_raw_reaction_remove_deletes_inbox_item():
+async def test_on_raw_reaction_remove_deletes_inbox_item(buffer):
     """Test that removing the inbox emoji reaction deletes the inbox item."""
     # Create test inbox item
     await InboxItem.objects.acreate(
@@ -132,8 +194,9 @@ async def test_on_raw_reaction_remove_deletes_inbox_item():
     payload.message_id = "111111"
     payload.user_id = "12345"
 
-    # Call the event handler
+    # Call the event handler, and apply the buffered changes
     await on_raw_reaction_remove(payload)
+    await buffer.flush()
 
     # Check that the inbox item was deleted
     items = await InboxItem.objects.filter(
@@ -145,7 +208,7 @@ async def test_on_raw_reaction_remove_deletes_inbox_item():
 
 @pytest.mark.asyncio
 @pytest.mark.django_db
-async def test_on_raw_reaction_remove_ignores_other_emojis():
+async def test_on_raw_reaction_remove_ignores_other_emojis(buffer):
     """Test that removing a non-inbox emoji doesn't delete the inbox item."""
     # Create test inbox item
     await InboxItem.objects.acreate(
@@ -164,8 +227,9 @@ async def test_on_raw_reaction_remove_ignores_other_emojis():
     payload.message_id = "111111"
     payload.user_id = "12345"
 
-    # Call the event handler
+    # Call the event handler, and apply the buffered changes
     await on_raw_reaction_remove(payload)
+    await buffer.flush()
 
     # Check that the inbox item was not deleted
     items = await InboxItem.objects.filter(
@@ -213,3 +277,399 @@ async def test_inboxitem_summary_method():
     # Get the actual summary and compare
     summary = item.summary()
     assert expected_summary == summary
+
+
+@pytest.mark.django_db
+def test_inbox_page_goes_through_items_saved_at_the_same_time():
+    items = create_inbox_items(25)
+    create_inbox_items(5, user_id="54321")
+
+    pages = all_pages("12345")
+
+    assert [len(page.items) for page in pages] == [10, 10, 5]
+    assert [item.pk for page in pages for item in page.items] == sorted(
+        (item.pk for item in items), reverse=True
+    )
+
+
+@pytest.mark.django_db
+def test_inbox_page_starts_with_most_recently_saved_items():
+    old, new = create_inbox_items(2)
+    InboxItem.objects.filter(pk=new.pk).update(
+        created_at=timezone.now() - timedelta(days=1)
+    )
+
+    page = inbox_page("12345")
+
+    assert [item.pk for item in page.items] == [old.pk, new.pk]
+    assert not page.has_next
+
+
+@pytest.mark.django_db
+def test_inbox_page_filters():
+    create_inbox_items(3)
+    create_inbox_items(2, start=2000, channel_id="999999", channel_name="#general")
+    create_inbox_items(4, start=3000, author="Alice")
+    InboxItem.objects.filter(author="Alice").update(
+        created_at=datetime(2025, 1, 1, 12, tzinfo=timezone.get_current_timezone())
+    )
+
+    def count(**filters) -> int:
+        return len(inbox_page("12345", InboxFilters(**filters)).items)
+
+    assert count() == 9
+    assert count(channel="#general") == 2
+    assert count(channel="general") == 2
+    assert count(channel="<#999999>") == 2
+    assert count(author="alice") == 4
+    assert count(author="@Alice", channel="#general") == 0
+    assert count(since=timezone.now() - timedelta(days=1)) == 5
+
+
+def test_inbox_filters_from_flags():
+    flags = InboxFlags()
+    flags.channel = "#general"
+    flags.author = None
+    flags.since = "2025-01-31"
+
+    filters = InboxFilters.from_flags(flags)
+
+    assert filters.channel == "#general"
+    assert filters.since == datetime(
+        2025, 1, 31, tzinfo=timezone.get_current_timezone()
+    )
+    assert InboxFilters.from_flags(None) == InboxFilters()
+
+    flags.since = "last week"
+    with pytest.raises(ValueError, match="Invalid date last week"):
+        InboxFilters.from_flags(flags)
+
+
+@pytest.mark.django_db
+def test_inbox_page_fits_in_an_embed():
+    create_inbox_items(25, author="A" * 255, channel_name="#" + "c" * 254)
+
+    pages = all_pages("12345")
+
+    assert all(len(page.description()) <= EMBED_DESCRIPTION_LIMIT for page in pages)
+    assert len(pages) > 3
+    assert sum(len(page.items) for page in pages) == 25
+
+
+@pytest.mark.django_db
+def test_inbox_page_query_count_is_constant():
+    """Every page of 10k items is a single query, no matter where it is"""
+    create_inbox_items(10_000)
+
+    queries = []
+    page = None
+    while page is None or page.has_next:
+        with CaptureQueriesContext(connection) as context:
+            page = inbox_page("12345", after=page.cursor if page else None)
+        queries.append(len(context.captured_queries))
+
+    assert len(queries) == 1000
+    assert set(queries) == {1}
+    # Only the fields used by the summary are loaded
+    assert "user_id" not in context.captured_queries[0]["sql"].split("FROM")[0]
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_inbox_command_with_pages():
+    ctx = AsyncMock()
+    ctx.message.author.id = "12345"
+    items = await InboxItem.objects.abulk_create(
+        [
+            InboxItem(
+                message_id=str(i),
+                channel_id="222222",
+                channel_name="#test-channel",
+                server_id="333333",
+                user_id="12345",
+                author="Test User",
+                content=f"Message number {i:02}",
+            )
+            for i in range(15)
+        ]
+    )
+
+    await inbox(ctx)
+
+    _, kwargs = ctx.send.call_args
+    view = kwargs["view"]
+    assert isinstance(view, InboxView)
+    assert "Currently tracking the following messages:" in kwargs["embed"].description
+    assert "Message number 14" in kwargs["embed"].description
+    assert "Message number 04" not in kwargs["embed"].description
+    assert view.previous_page.disabled
+    assert not view.next_page.disabled
+
+    interaction = AsyncMock()
+    interaction.user.id = 12345
+    assert await view.interaction_check(interaction)
+
+    await view.next_page.callback(interaction)
+
+    _, kwargs = interaction.response.edit_message.call_args
+    assert "Message number 04" in kwargs["embed"].description
+    assert "Message number 14" not in kwargs["embed"].description
+    assert kwargs["embed"].footer.text == "Page 2"
+    assert [item.pk for item in view.page.items] == [i.pk for i in items[4::-1]]
+    assert not view.previous_page.disabled
+    assert view.next_page.disabled
+
+    await view.previous_page.callback(interaction)
+
+    _, kwargs = interaction.response.edit_message.call_args
+    assert "Message number 14" in kwargs["embed"].description
+    assert kwargs["embed"].footer.text == "Page 1"
+    assert view.previous_page.disabled
+
+    interaction.user.id = 54321
+    assert not await view.interaction_check(interaction)
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_inbox_command_with_filters():
+    ctx = AsyncMock()
+    ctx.message.author.id = "12345"
+    await InboxItem.objects.acreate(
+        message_id="111111",
+        channel_id="222222",
+        channel_name="#test-channel",
+        server_id="333333",
+        user_id="12345",
+        author="Test User",
+        content="Test message 1",
+    )
+
+    await inbox(ctx, filters=await InboxFlags.convert(ctx, "channel: #other"))
+    ctx.send.assert_called_once_with("Your inbox is empty.")
+
+    ctx.send.reset_mock()
+    await inbox(ctx, filters=await InboxFlags.convert(ctx, "since: yesterday"))
+    ctx.send.assert_called_once_with("Invalid date yesterday, use YYYY-MM-DD")
+
+
+def inbox_item(user_id: str = "12345", message_id: str = "111111") -> InboxItem:
+    return InboxItem(
+        message_id=message_id,
+        channel_id="222222",
+        channel_name="#test-channel",
+        server_id="333333",
+        user_id=user_id,
+        author="Test User",
+        content=f"Test message {message_id}",
+    )
+
+
+def mock_bot(cached_messages=()) -> MagicMock:
+    bot = MagicMock()
+    bot.cached_messages = list(cached_messages)
+    channel = bot.get_channel.return_value = AsyncMock()
+    channel.name = "test-channel"
+    channel.fetch_message.side_effect = lambda message_id: MagicMock(
+        id=message_id, content=f"Message {message_id}"
+    )
+    return bot
+
+
+@pytest.mark.asyncio
+async def test_message_cache_fetches_recently_used_messages_once():
+    bot = mock_bot()
+    cache = MessageCache(size=2)
+
+    for message_id in [1, 1, 2, 3, 2, 1]:
+        message = await cache.get(bot, 222222, message_id)
+        assert message.channel_name == "#test-channel"
+        assert message.content == f"Message {message_id}"
+
+    fetched = [c.args[0] for c in bot.get_channel().fetch_message.await_args_list]
+    # 1 is the least recently used message when 3 is added
+    assert fetched == [1, 2, 3, 1]
+
+
+@pytest.mark.asyncio
+async def test_message_cache_uses_gateway_cache_first():
+    message = MagicMock(id=111111, content="Cached message")
+    message.channel.name = "announcements"
+    message.author.name = "Test User"
+    bot = mock_bot(cached_messages=[message])
+
+    info = await MessageCache().get(bot, 222222, 111111)
+
+    assert info.channel_name == "#announcements"
+    assert info.author == "Test User"
+    assert info.content == "Cached message"
+    bot.get_channel().fetch_message.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_message_cache_fetches_edited_messages_again():
+    mocked_bot = mock_bot()
+    payload = AsyncMock()
+    payload.message_id = 111111
+
+    with patch("core.bot.main.message_cache", MessageCache()) as cache:
+        await cache.get(mocked_bot, 222222, 111111)
+        await cache.get(mocked_bot, 222222, 111111)
+        await on_raw_message_edit(payload)
+        await cache.get(mocked_bot, 222222, 111111)
+
+    assert mocked_bot.get_channel().fetch_message.await_count == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_many_reactions_to_one_message(buffer):
+    bot = mock_bot()
+
+    with patch("core.bot.main.bot", bot):
+        for user_id in range(30):
+            payload = AsyncMock()
+            payload.emoji.name = INBOX_EMOJI
+            payload.channel_id = 222222
+            payload.message_id = 111111
+            payload.guild_id = 333333
+            payload.user_id = user_id
+            await on_raw_reaction_add(payload)
+
+    assert len(buffer) == 30
+    assert await InboxItem.objects.acount() == 0
+
+    await buffer.flush()
+
+    bot.get_channel().fetch_message.assert_awaited_once_with(111111)
+    assert len(buffer) == 0
+    assert await InboxItem.objects.filter(message_id="111111").acount() == 30
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_inbox_buffer_coalesces_changes(buffer):
+    await InboxItem.objects.abulk_create(
+        [inbox_item(message_id="1"), inbox_item(message_id="2")]
+    )
+
+    buffer.add(inbox_item(message_id="3"))
+    buffer.remove("12345", "3")
+    buffer.add(inbox_item(message_id="4"))
+    buffer.add(inbox_item(message_id="4"))
+    buffer.remove("12345", "1")
+    buffer.add(inbox_item(message_id="2"))
+    assert len(buffer) == 4
+
+    await buffer.flush()
+
+    message_ids = InboxItem.objects.order_by("message_id").values_list(
+        "message_id", flat=True
+    )
+    assert [message_id async for message_id in message_ids] == ["2", "4"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_inbox_buffer_flushes_after_delay():
+    buffer = InboxBuffer(delay=0.01)
+
+    buffer.add(inbox_item())
+    while buffer.flushing is None:
+        await asyncio.sleep(0.01)
+    await buffer.flushing
+
+    assert buffer.timer is None
+    assert await InboxItem.objects.acount() == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_closing_the_bot_flushes_buffer(buffer):
+    buffer.add(inbox_item())
+
+    with patch.object(commands.Bot, "close") as close:
+        await bot.close()
+
+    close.assert_awaited_once()
+    assert len(buffer) == 0
+    assert await InboxItem.objects.acount() == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_inbox_command_flushes_buffer(buffer):
+    ctx = AsyncMock()
+    ctx.message.author.id = "12345"
+    buffer.add(inbox_item())
+
+    await inbox(ctx)
+
+    _, kwargs = ctx.send.call_args
+    assert "Test message 111111" in kwargs["embed"].description
+
+
+@pytest.mark.django_db
+def test_write_inbox_changes_with_single_queries():
+    create_inbox_items(20)
+    added = [inbox_item(message_id=str(i)) for i in range(50)]
+    removed = {("12345", str(1000 + i)) for i in range(20)}
+
+    with CaptureQueriesContext(connection) as context:
+        write_inbox_changes(added, removed)
+
+    statements = [query["sql"].split()[0] for query in context.captured_queries]
+    assert statements.count("DELETE") == 1
+    assert statements.count("INSERT") == 1
+    assert InboxItem.objects.count() == 50
+
+
+@pytest.mark.django_db
+def test_inbox_item_is_unique_per_user_and_message():
+    inbox_item().save()
+
+    # Already in the inbox
+    write_inbox_changes([inbox_item(), inbox_item(user_id="54321")], set())
+    assert InboxItem.objects.count() == 2
+
+    with pytest.raises(IntegrityError):
+        inbox_item().save()
+
+
+@pytest.mark.slow
+@pytest.mark.django_db
+def test_benchmark_inbox_pages():
+    """
+    Last page of an inbox with 10k items: with keyset pagination, and with
+    OFFSET (that goes through all the items before the page)
+    """
+    create_inbox_items(10_000)
+    cursor = all_pages("12345")[-2].cursor
+
+    def timed(fetch):
+        # Best of a few runs, to leave out warming up the cache
+        times = []
+        for _ in range(5):
+            start = time.monotonic()
+            result = fetch()
+            times.append(time.monotonic() - start)
+        return result, min(times)
+
+    first, first_time = timed(lambda: inbox_page("12345"))
+    keyset, keyset_time = timed(lambda: inbox_page("12345", after=cursor))
+    offset, offset_time = timed(
+        lambda: list(
+            InboxItem.objects.filter(user_id="12345")
+            .only(*SUMMARY_FIELDS)
+            .order_by("-created_at", "-pk")[9990:10000]
+        )
+    )
+
+    print(
+        f"\nfirst page:          {first_time * 1000:.1f}ms"
+        f"\nlast page, keyset:   {keyset_time * 1000:.1f}ms"
+        f"\nlast page, offset:   {offset_time * 1000:.1f}ms"
+    )
+    assert len(first.items) == 10
+    assert keyset.items == offset
+    assert keyset_time < offset_time
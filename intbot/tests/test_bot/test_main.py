@@ -1,14 +1,22 @@
+import asyncio
+from datetime import timedelta
 from unittest.mock import AsyncMock, patch
 
 import discord
 import polars as pl
 import pytest
 from asgiref.sync import sync_to_async
+from core.bot import main
 from core.bot.main import (
     close,
+    latency,
+    listen_to_database,
+    on_ready,
     ping,
     poll_database,
     qlen,
+    retry_failed_messages,
+    send_new_messages,
     source,
     submissions_status,
     submissions_status_pie_chart,
@@ -204,6 +212,64 @@ async def test_polling_messages_sends_message_if_not_sent_and_sets_sent_at():
     assert start < dm.sent_at < end
 
 
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_send_new_messages_sends_only_the_notified_messages():
+    dm1 = await DiscordMessage.objects.acreate(channel_id="1234", content="first")
+    dm2 = await DiscordMessage.objects.acreate(channel_id="1234", content="second")
+    mock_channel = AsyncMock()
+    mock_channel.send = AsyncMock()
+
+    with patch("core.bot.main.bot.get_channel", return_value=mock_channel):
+        await send_new_messages([dm2.pk])
+
+    mock_channel.send.assert_called_once_with("second", suppress_embeds=True)
+    await sync_to_async(dm1.refresh_from_db)()
+    await sync_to_async(dm2.refresh_from_db)()
+    assert dm1.sent_at is None
+    assert dm2.sent_at is not None
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_send_new_messages_skips_already_sent_messages():
+    dm = await DiscordMessage.objects.acreate(
+        channel_id="1234", content="asdf", sent_at=timezone.now()
+    )
+    mock_channel = AsyncMock()
+    mock_channel.send = AsyncMock()
+
+    with patch("core.bot.main.bot.get_channel", return_value=mock_channel):
+        await send_new_messages([dm.pk])
+
+    mock_channel.send.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_latency_command_without_messages():
+    ctx = AsyncMock()
+
+    await latency(ctx)
+
+    ctx.send.assert_called_once_with("No messages were sent yet")
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_latency_command_with_sent_messages():
+    ctx = AsyncMock()
+    dm = await DiscordMessage.objects.acreate(channel_id="1234", content="asdf")
+    dm.sent_at = dm.created_at + timedelta(milliseconds=500)
+    await dm.asave()
+
+    await latency(ctx)
+
+    ctx.send.assert_called_once_with(
+        "Last 1 messages: median 0.500s, p95 0.500s, max 0.500s"
+    )
+
+
 @pytest.mark.asyncio
 @freeze_time("2025-04-05")
 async def test_until():
@@ -333,7 +399,9 @@ async def test_submissions_status_pie_chart():
 
     expected = FakeFig()
 
-    with patch("core.bot.main.piechart_submissions_by_state", return_value=expected):
+    with patch(
+        "core.analysis.charts.piechart_submissions_by_state", return_value=expected
+    ):
         await submissions_status_pie_chart(ctx)
 
     ctx.send.assert_called_once()
@@ -343,3 +411,73 @@ async def test_submissions_status_pie_chart():
     assert sent_file.filename == "submissions_by_state.png"
     sent_file.fp.seek(0)
     assert sent_file.fp.read() == b"PNG GOES HERE"
+
+
+@pytest.mark.asyncio
+async def test_on_ready_after_reconnect_keeps_loops_running():
+    with (
+        patch.object(poll_database, "start") as poll_start,
+        patch.object(listen_to_database, "start") as listen_start,
+        patch.object(retry_failed_messages, "start"),
+        patch("core.bot.main.warm_up_chart_renderer") as warm_up,
+        patch("core.bot.main.warm_up_task", None),
+    ):
+        await on_ready()
+        assert poll_start.call_count == listen_start.call_count == 1
+
+        with (
+            patch.object(poll_database, "is_running", return_value=True),
+            patch.object(listen_to_database, "is_running", return_value=True),
+        ):
+            await on_ready()
+
+        await main.warm_up_task
+
+    assert poll_start.call_count == listen_start.call_count == 1
+    warm_up.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_on_ready_logs_failed_warm_up(caplog):
+    with (
+        patch.object(poll_database, "start"),
+        patch.object(listen_to_database, "start"),
+        patch.object(retry_failed_messages, "start"),
+        patch(
+            "core.bot.main.warm_up_chart_renderer",
+            side_effect=RuntimeError("No Chrome"),
+        ),
+        patch("core.bot.main.warm_up_task", None),
+    ):
+        await on_ready()
+        with pytest.raises(RuntimeError):
+            await main.warm_up_task
+        # Done callbacks are called soon after the task is done
+        await asyncio.sleep(0)
+
+    assert "Failed to warm up the chart renderer" in caplog.text
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_retry_failed_messages_sends_only_due_retries():
+    now = timezone.now()
+    await DiscordMessage.objects.acreate(channel_id="1234", content="new")
+    await DiscordMessage.objects.acreate(
+        channel_id="1234",
+        content="due",
+        attempts=1,
+        next_attempt_at=now - timedelta(seconds=1),
+    )
+    await DiscordMessage.objects.acreate(
+        channel_id="1234",
+        content="not yet",
+        attempts=2,
+        next_attempt_at=now + timedelta(minutes=1),
+    )
+    mock_channel = AsyncMock()
+
+    with patch("core.bot.main.bot.get_channel", return_value=mock_channel):
+        await retry_failed_messages()
+
+    mock_channel.send.assert_called_once_with("due", suppress_embeds=True)
@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from core.integrations import pretix
+
+
+class PaginatedOrders(BaseHTTPRequestHandler):
+    """
+    Stub of Pretix's paginated orders endpoint, that counts connections, and
+    can simulate network latency.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are sent separately, which without this adds a delay
+    # (of a delayed ACK) to every response on a kept alive connection
+    disable_nagle_algorithm = True
+    pages = 50
+    page_size = 50
+    latency = 0.0
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        type(self).connections += 1
+
+    def do_GET(self):
+        time.sleep(self.latency)
+
+        page = int(self.path.split("page=")[-1]) if "page=" in self.path else 1
+        host = f"http://{self.headers['Host']}"
+        body = json.dumps(
+            {
+                "count": self.pages * self.page_size,
+                "results": [
+                    {"code": f"{page}-{i}", "status": "p"}
+                    for i in range(self.page_size)
+                ],
+                "next": (
+                    f"{host}/orders/?page={page + 1}" if page < self.pages else None
+                ),
+            }
+        ).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def pretix_stub(monkeypatch, settings):
+    """
+    Serves the stub on localhost, and points the Pretix integration at it.
+
+    Yields the stub (handler) class, so tests can change its settings, and
+    check the number of connections. Tests using it need the `enable_socket`
+    mark.
+    """
+    settings.PRETIX_API_TOKEN = "Test-Pretix-API-token"
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PaginatedOrders)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    url = f"http://127.0.0.1:{server.server_port}/"
+    monkeypatch.setattr(pretix, "get_event_url", lambda event: url)
+    # Class attributes are restored after the test
+    monkeypatch.setattr(PaginatedOrders, "url", url, raising=False)
+    monkeypatch.setattr(PaginatedOrders, "connections", 0)
+    monkeypatch.setattr(PaginatedOrders, "latency", 0.0)
+    monkeypatch.setattr(PaginatedOrders, "pages", 50)
+
+    yield PaginatedOrders
+
+    server.shutdown()
+    server.server_close()
@@ -1,3 +1,5 @@
+import json
+
 import pytest
 import respx
 from core.integrations.github import (
@@ -5,8 +7,14 @@ from core.integrations.github import (
     GithubProjectV2Item,
     GithubAPIError,
     GithubSender,
+    fetch_github_project_items,
+    get_github_project_item,
+    get_github_project_items,
     parse_github_webhook,
+    prefetch_github_project_items,
     prep_github_webhook,
+    project_item_cache_stats,
+    project_item_changed,
 )
 from core.models import Webhook
 from httpx import Response
@@ -151,6 +159,62 @@ def test_github_project_item_draft_issue_created():
     assert message == "[@testuser](https://github.com/testuser) created Draft Title"
 
 
+def test_github_project_edited_event_meta_for_collapsing_changes():
+    parser = GithubProjectV2Item(
+        action="projects_v2_item.edited",
+        headers={},
+        content={
+            "sender": {"login": "testuser", "html_url": "https://github.com/testuser"},
+            "projects_v2_item": {
+                "content_type": "Issue",
+                "node_id": "test_node_id",
+            },
+            "action": "edited",
+            "changes": {
+                "field_value": {
+                    "field_name": "Status",
+                    "field_type": "single_select",
+                    "from": {"name": "To Do"},
+                    "to": {"name": "In Progress"},
+                }
+            },
+        },
+        extra={
+            "content": {
+                "__typename": "DraftIssue",
+                "id": "DI_randomDraftIssueID",
+                "title": "Draft with {braces}",
+            }
+        },
+    )
+
+    meta = parser.as_discord_message_meta(prefix="GitHub: ")
+
+    assert meta["coalesce_key"] == "github:test_node_id:Status"
+    assert meta["from"] == "To Do"
+    assert meta["to"] == "In Progress"
+    assert meta["template"].format(**{"from": "A", "to": "B"}) == (
+        "GitHub: [@testuser](https://github.com/testuser) changed **Status** of "
+        "**Draft with {braces}** from **A** to **B**"
+    )
+    assert "GitHub: " + parser.as_discord_message() == meta["template"].format(**meta)
+
+
+def test_github_project_created_event_has_no_meta():
+    parser = GithubProjectV2Item(
+        action="projects_v2_item.created",
+        headers={},
+        content={
+            "sender": {"login": "testuser", "html_url": "https://github.com/testuser"},
+            "projects_v2_item": {"node_id": "test_node_id"},
+            "action": "created",
+        },
+        extra={},
+    )
+
+    assert parser.as_discord_message_meta() == {}
+
+
 def test_github_project_item_edited_event_no_changes():
     parser = GithubProjectV2Item(
         action="projects_v2_item.edited",
@@ -366,3 +430,212 @@ def test_parse_github_webhook_raises_exception_for_unsupported_events():
 
     with pytest.raises(ValueError, match="Event not supported `long_form_content`"):
         parse_github_webhook(wh)
+
+
+def project_item_node(item_id):
+    return {
+        "id": item_id,
+        "project": {
+            "id": "PVT_Random_Project",
+            "title": "Random Project",
+            "url": "https://github.com/europython",
+        },
+        "content": {
+            "__typename": "Issue",
+            "id": f"I_{item_id}",
+            "title": f"Issue {item_id}",
+            "url": f"https://github.com/test-issue/{item_id}",
+        },
+    }
+
+
+def mock_nodes_query(missing=()):
+    """Mock GitHub's nodes(ids: ...) query, resolving every id but `missing`"""
+
+    def respond(request):
+        item_ids = json.loads(request.content)["variables"]["itemIds"]
+        nodes = [
+            None if item_id in missing else project_item_node(item_id)
+            for item_id in item_ids
+        ]
+        return Response(200, json={"data": {"nodes": nodes}})
+
+    return respx.post(GITHUB_API_URL).mock(side_effect=respond)
+
+
+@respx.mock
+def test_fetch_github_project_items_fetches_in_batches_of_100():
+    route = mock_nodes_query()
+    item_ids = [f"PVTI_{i}" for i in range(250)]
+
+    project_items = fetch_github_project_items(item_ids + item_ids[:10])
+
+    assert route.call_count == 3
+    assert [
+        len(json.loads(call.request.content)["variables"]["itemIds"])
+        for call in route.calls
+    ] == [100, 100, 50]
+    assert list(project_items) == item_ids
+    assert project_items["PVTI_7"] == project_item_node("PVTI_7")
+
+
+@respx.mock
+def test_fetch_github_project_items_skips_items_that_dont_exist():
+    mock_nodes_query(missing={"PVTI_deleted"})
+
+    project_items = fetch_github_project_items(["PVTI_1", "PVTI_deleted"])
+
+    assert list(project_items) == ["PVTI_1"]
+
+
+@respx.mock
+def test_fetch_github_project_items_raises_exception_in_case_of_API_error():
+    respx.post(GITHUB_API_URL).mock(return_value=Response(500, json={"lol": "failed"}))
+
+    with pytest.raises(GithubAPIError, match="GitHub API error: 500"):
+        fetch_github_project_items(["PVTI_1"])
+
+
+def project_item_webhook(item_id):
+    return Webhook(
+        meta={"X-Github-Event": "projects_v2_item"},
+        content={"action": "edited", "projects_v2_item": {"node_id": item_id}},
+        extra={},
+    )
+
+
+@respx.mock
+def test_prefetch_github_project_items_prefetches_all_webhooks_at_once():
+    route = mock_nodes_query(missing={"PVTI_deleted"})
+    webhooks = [project_item_webhook(f"PVTI_{i}") for i in range(3)]
+    deleted = project_item_webhook("PVTI_deleted")
+    unsupported = Webhook(meta={"X-Github-Event": "issues"}, content={}, extra={})
+
+    prefetch_github_project_items(webhooks + [deleted, unsupported])
+
+    assert route.call_count == 1
+    assert [wh.extra for wh in webhooks] == [
+        project_item_node(f"PVTI_{i}") for i in range(3)
+    ]
+    assert deleted.extra == {}
+    assert unsupported.extra == {}
+
+
+@respx.mock
+def test_prefetch_github_project_items_leaves_webhooks_as_they_are_on_error():
+    respx.post(GITHUB_API_URL).mock(return_value=Response(500, json={"lol": "failed"}))
+    wh = project_item_webhook("PVTI_1")
+
+    prefetch_github_project_items([wh])
+
+    assert wh.extra == {}
+
+
+@respx.mock
+def test_prep_github_webhook_doesnt_fetch_prefetched_data():
+    # No routes are mocked, so any request would fail
+    wh = project_item_webhook("PVTI_1")
+    wh.extra = project_item_node("PVTI_1")
+
+    wh = prep_github_webhook(wh)
+
+    assert wh.event == "projects_v2_item.edited"
+    assert wh.extra == project_item_node("PVTI_1")
+
+
+def mock_node_query():
+    """Mock GitHub's node(id: ...) query"""
+
+    def respond(request):
+        item_id = json.loads(request.content)["variables"]["itemId"]
+        return Response(200, json={"data": {"node": project_item_node(item_id)}})
+
+    return respx.post(GITHUB_API_URL).mock(side_effect=respond)
+
+
+@respx.mock
+def test_get_github_project_item_is_cached():
+    route = mock_node_query()
+
+    first = get_github_project_item("PVTI_1")
+    second = get_github_project_item("PVTI_1")
+
+    assert first == second == project_item_node("PVTI_1")
+    assert route.call_count == 1
+    assert project_item_cache_stats() == {
+        "hits": 1,
+        "misses": 1,
+        "saved_requests": 0,
+    }
+
+
+@respx.mock
+def test_get_github_project_items_fetches_only_items_that_are_not_cached():
+    route = mock_nodes_query()
+    get_github_project_items(["PVTI_1"])
+
+    project_items = get_github_project_items(["PVTI_1", "PVTI_2", "PVTI_3"])
+
+    assert project_items == {
+        item_id: project_item_node(item_id)
+        for item_id in ["PVTI_1", "PVTI_2", "PVTI_3"]
+    }
+    assert json.loads(route.calls.last.request.content)["variables"]["itemIds"] == [
+        "PVTI_2",
+        "PVTI_3",
+    ]
+    # PVTI_2 and PVTI_3 were fetched with a single request
+    assert project_item_cache_stats() == {
+        "hits": 1,
+        "misses": 3,
+        "saved_requests": 1,
+    }
+
+
+@respx.mock
+def test_prep_github_webhook_uses_cached_project_items():
+    route = mock_node_query()
+
+    for _ in range(3):
+        prep_github_webhook(project_item_webhook("PVTI_1"))
+
+    assert route.call_count == 1
+
+
+@respx.mock
+def test_prep_github_webhook_refetches_project_item_after_title_change():
+    route = mock_node_query()
+    prep_github_webhook(project_item_webhook("PVTI_1"))
+    wh = project_item_webhook("PVTI_1")
+    wh.content["changes"] = {"field_value": {"field_name": "Title"}}
+
+    prep_github_webhook(wh)
+
+    assert route.call_count == 2
+
+
+@pytest.mark.parametrize(
+    "content,changed",
+    [
+        ({"action": "edited"}, False),
+        (
+            {
+                "action": "edited",
+                "changes": {"field_value": {"field_name": "Status"}},
+            },
+            False,
+        ),
+        (
+            {
+                "action": "edited",
+                "changes": {"field_value": {"field_name": "Title"}},
+            },
+            True,
+        ),
+        ({"action": "converted"}, True),
+        ({"action": "deleted"}, True),
+        ({"action": "restored"}, True),
+    ],
+)
+def test_project_item_changed(content, changed):
+    assert project_item_changed(content) == changed
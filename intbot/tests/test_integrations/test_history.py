@@ -0,0 +1,232 @@
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from core.integrations.history import (
+    backfill_orders_history,
+    iter_order_changes,
+    prune_orders_history,
+    reconstruct_orders,
+    record_orders_history,
+)
+from core.models import PretixData, PretixOrderChange, PretixOrderHistory
+from django.db import connection
+from django.db.models import ProtectedError
+from django.test.utils import CaptureQueriesContext
+
+START = datetime(2025, 3, 1, 6, tzinfo=timezone.utc)
+
+
+def order(code: str, status: str = "p") -> dict:
+    return {"code": code, "status": status, "total": "100.00"}
+
+
+def on_day(day: int) -> datetime:
+    return START + timedelta(days=day)
+
+
+@pytest.mark.django_db
+def test_record_orders_history_and_reconstruct_orders(create_orders):
+    day0 = [order("A"), order("B", "n")]
+    day1 = [order("A", "c"), order("C")]
+    record_orders_history(create_orders(day0, on_day(0)))
+    history = record_orders_history(create_orders(day1, on_day(1)))
+
+    assert (history.added, history.changed, history.removed) == (1, 1, 1)
+    assert not history.keyframe
+    assert [(c.code, c.kind) for c in history.changes.order_by("code")] == [
+        ("A", PretixOrderChange.Kind.changed),
+        ("B", PretixOrderChange.Kind.removed),
+        ("C", PretixOrderChange.Kind.added),
+    ]
+
+    assert reconstruct_orders("ep2025", START - timedelta(hours=1)) == {}
+    assert reconstruct_orders("ep2025", START) == {"A": day0[0], "B": day0[1]}
+    assert reconstruct_orders("ep2025", START + timedelta(hours=12)) == {
+        "A": day0[0],
+        "B": day0[1],
+    }
+    assert reconstruct_orders("ep2025", on_day(5)) == {
+        "A": day1[0],
+        "C": day1[1],
+    }
+
+
+@pytest.mark.django_db
+def test_record_orders_history_skips_downloads_that_are_not_newer(create_orders):
+    latest = create_orders([order("A")], on_day(1))
+    record_orders_history(latest)
+
+    assert record_orders_history(latest) is None
+    assert record_orders_history(create_orders([order("B")], on_day(0))) is None
+    assert PretixOrderHistory.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_record_orders_history_does_not_load_the_orders(create_orders):
+    first = create_orders([order("A"), order("B")], on_day(0))
+    record_orders_history(first)
+    record_orders_history(create_orders([order("A", "c")], on_day(1)))
+    # Unchanged download, stored as a marker pointing at the first one
+    marker = create_orders(None, on_day(2))
+    PretixData.objects.filter(pk=marker.pk).update(same_as=first)
+    marker.refresh_from_db()
+
+    with CaptureQueriesContext(connection) as queries:
+        history = record_orders_history(marker)
+
+    assert not any('"core_pretixdata"."content"' in q["sql"] for q in queries)
+    assert (history.added, history.changed, history.removed) == (1, 1, 0)
+    assert reconstruct_orders("ep2025", on_day(2)) == {
+        "A": order("A"),
+        "B": order("B"),
+    }
+
+
+@pytest.mark.django_db
+def test_downloads_of_keyframes_cannot_be_removed(create_orders):
+    download = create_orders([order("A")], on_day(0))
+    record_orders_history(download)
+
+    with pytest.raises(ProtectedError):
+        download.delete()
+
+
+@pytest.mark.django_db
+def test_iter_order_changes_in_a_time_range(create_orders):
+    for day in range(4):
+        record_orders_history(
+            create_orders([order(f"D{d}") for d in range(day + 1)], on_day(day))
+        )
+
+    changes = iter_order_changes(
+        "ep2025",
+        since=START,
+        until=on_day(2),
+    )
+
+    assert [(c.code, c.kind) for c in changes] == [
+        ("D1", PretixOrderChange.Kind.added),
+        ("D2", PretixOrderChange.Kind.added),
+    ]
+    assert len(list(iter_order_changes("other-event"))) == 0
+
+
+@pytest.mark.django_db
+def test_keyframes_and_pruning(create_orders):
+    contents = [[order(f"D{d}") for d in range(day + 1)] for day in range(10)]
+    downloads = [
+        create_orders(content, on_day(day)) for day, content in enumerate(contents)
+    ]
+
+    assert backfill_orders_history("ep2025") == 10
+    keyframes = PretixOrderHistory.objects.filter(keyframe=True)
+    assert [h.download for h in keyframes.order_by("downloaded_at")] == [
+        downloads[0],
+        downloads[7],
+    ]
+
+    # Everything except the keyframes and the latest download
+    assert prune_orders_history("ep2025") == 7
+    assert set(PretixData.objects.all()) == {downloads[0], downloads[7], downloads[9]}
+
+    for day, content in enumerate(contents):
+        at = on_day(day)
+        assert reconstruct_orders("ep2025", at) == {o["code"]: o for o in content}
+
+    # Backfill continues where the history ends
+    create_orders([order("D0")], on_day(10))
+    assert backfill_orders_history("ep2025") == 1
+    assert reconstruct_orders("ep2025", on_day(10)) == {"D0": order("D0")}
+
+
+@pytest.mark.django_db
+def test_prune_orders_history_keeps_what_keyframes_point_at(create_orders):
+    original = create_orders([order("A")], on_day(0))
+    record_orders_history(original)
+    record_orders_history(create_orders([order("A"), order("B")], on_day(1)))
+    # Unchanged download, stored as a marker pointing at the original one
+    marker = create_orders(None, on_day(2))
+    PretixData.objects.filter(pk=marker.pk).update(same_as=original)
+
+    assert prune_orders_history("ep2025") == 1
+    assert set(PretixData.objects.all()) == {original, marker}
+    assert reconstruct_orders("ep2025", on_day(1)) == {
+        "A": order("A"),
+        "B": order("B"),
+    }
+
+
+@pytest.mark.slow
+@pytest.mark.django_db
+def test_benchmark_orders_over_30_days(create_orders):
+    """
+    Number of orders in every status, for each of the last 30 days (of 5k
+    orders, with 50 new and 50 changed ones every day): from 30 full
+    downloads, and from a single pass over the history.
+    """
+
+    def full_order(code: str) -> dict:
+        return {
+            **order(code, "n"),
+            "email": f"{code}@example.com",
+            "datetime": "2025-03-01T06:00:00+00:00",
+            "invoice_address": {"name": f"Attendee {code}", "country": "CZ"},
+            "positions": [
+                {
+                    "id": i,
+                    "item": 100 + i,
+                    "variation": None,
+                    "price": "100.00",
+                    "attendee_name": f"Attendee {code}",
+                    "answers": [{"question": 1, "answer": "Vegetarian"}],
+                }
+                for i in range(2)
+            ],
+        }
+
+    orders = {f"O{i:05}": full_order(f"O{i:05}") for i in range(5000)}
+    for day in range(30):
+        for i in range(50):
+            code = f"O{(day * 50 + i) * 7 % 5000:05}"
+            orders[code] = {**orders[code], "status": "p"}
+            code = f"N{day:02}{i:02}"
+            orders[code] = full_order(code)
+        record_orders_history(create_orders(list(orders.values()), on_day(day)))
+    days = [on_day(day) for day in range(30)]
+
+    start = time.monotonic()
+    from_downloads = []
+    for at in days:
+        pretix_data = (
+            PretixData.objects.filter(created_at__lte=at)
+            .order_by("-created_at")
+            .first()
+        )
+        from_downloads.append(Counter(o["status"] for o in pretix_data.content))
+    downloads_time = time.monotonic() - start
+
+    start = time.monotonic()
+    from_history = []
+    statuses = {
+        code: o["status"] for code, o in reconstruct_orders("ep2025", days[0]).items()
+    }
+    changes = iter(iter_order_changes("ep2025", since=days[0], until=days[-1]))
+    change = next(changes, None)
+    for at in days:
+        while change is not None and change.downloaded_at <= at:
+            if change.kind == PretixOrderChange.Kind.removed:
+                statuses.pop(change.code, None)
+            else:
+                statuses[change.code] = change.order["status"]
+            change = next(changes, None)
+        from_history.append(Counter(statuses.values()))
+    history_time = time.monotonic() - start
+
+    print(
+        f"\n30 downloads:     {downloads_time * 1000:.1f}ms"
+        f"\nhistory, 1 pass:  {history_time * 1000:.1f}ms"
+    )
+    assert from_history == from_downloads
+    assert history_time < downloads_time / 2
@@ -0,0 +1,84 @@
+import asyncio
+
+import httpx
+import pytest
+from core.integrations import pretix
+from core.integrations.http import (
+    aclose_async_clients,
+    close_clients,
+    get_async_client,
+    get_client,
+    get_host,
+)
+from core.models import PretixData
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients():
+    close_clients()
+    yield
+    close_clients()
+
+
+def test_get_host():
+    assert get_host("https://pretalx.com/api/events/?page=2") == "https://pretalx.com"
+    assert get_host("http://localhost:4672/webhook/") == "http://localhost:4672"
+
+
+def test_get_client_returns_one_client_per_host():
+    pretalx = get_client("https://pretalx.com/api/events/ep2025/submissions/")
+
+    assert get_client("https://pretalx.com/api/events/ep2025/speakers/") is pretalx
+    assert get_client("https://tickets.europython.eu/api/v1/") is not pretalx
+
+
+def test_get_client_uses_timeouts_and_limits_from_settings(settings):
+    settings.HTTP_CLIENT_TIMEOUT = 12.0
+    settings.HTTP_CLIENT_CONNECT_TIMEOUT = 3.0
+
+    client = get_client("https://pretalx.com/")
+
+    assert client.timeout == httpx.Timeout(12.0, connect=3.0)
+
+
+def test_close_clients_closes_and_forgets_clients():
+    client = get_client("https://pretalx.com/")
+
+    close_clients()
+
+    assert client.is_closed
+    assert get_client("https://pretalx.com/") is not client
+
+
+def test_get_async_client_returns_one_client_per_host_and_loop():
+    async def clients():
+        first = get_async_client("https://pretalx.com/api/")
+        second = get_async_client("https://pretalx.com/api/events/")
+        await aclose_async_clients()
+        return first, second
+
+    first, second = asyncio.run(clients())
+    other_loop, _ = asyncio.run(clients())
+
+    assert first is second
+    assert first.is_closed
+    assert other_loop is not first
+
+
+@pytest.mark.enable_socket
+def test_pretix_download_with_shared_client_uses_one_connection(pretix_stub):
+    """
+    Downloading 50 pages of orders, with a new connection for every page (like
+    module level httpx.get does), and with the shared client.
+    """
+    url = f"{pretix_stub.url}orders/"
+    while url:
+        url = httpx.get(url).json()["next"]
+    before_connections = pretix_stub.connections
+
+    pretix_stub.connections = 0
+    orders = pretix.fetch_pretix_data("ep2025", PretixData.PretixResources.orders)
+
+    assert len(orders) == 50 * 50
+    assert before_connections == 50
+    assert pretix_stub.connections == 1
@@ -0,0 +1,154 @@
+import asyncio
+import time
+
+import pytest
+import respx
+from core.integrations import pretalx, pretix
+from core.integrations.pagination import fetch_all_pages, page_urls
+from core.models import PretalxData, PretixData
+from httpx import Response
+
+
+def test_page_urls_for_page_numbers():
+    url = "https://pretalx.com/api/events/europython-2025/submissions/?questions=all"
+    first_page = {
+        "count": 7,
+        "results": [{}, {}, {}],
+        "next": f"{url}&page=2",
+    }
+
+    assert page_urls(url, first_page) == [
+        f"{url}&page=2",
+        f"{url}&page=3",
+    ]
+
+
+def test_page_urls_for_offsets():
+    url = "https://pretalx.com/api/events/europython-2025/speakers/"
+    first_page = {
+        "count": 7,
+        "results": [{}, {}, {}],
+        "next": f"{url}?limit=3&offset=3",
+    }
+
+    assert page_urls(url, first_page) == [
+        f"{url}?limit=3&offset=3",
+        f"{url}?limit=3&offset=6",
+    ]
+
+
+def test_page_urls_for_a_single_page():
+    first_page = {"count": 1, "results": [{}], "next": None}
+
+    assert page_urls("https://pretalx.com/api/", first_page) == []
+
+
+def pretix_page(page, pages, url):
+    return {
+        "count": pages * 2,
+        "results": [{"code": f"{page}-1"}, {"code": f"{page}-2"}],
+        "next": f"{url}?page={page + 1}" if page < pages else None,
+    }
+
+
+@respx.mock
+def test_fetch_pretix_data_concurrently_keeps_the_order_of_pages():
+    url = "https://tickets.europython.eu/api/v1/organizers/europython/events/ep2025/orders/"
+    in_flight = 0
+    max_in_flight = 0
+
+    async def respond(request):
+        nonlocal in_flight, max_in_flight
+        page = int(request.url.params.get("page", 1))
+
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        # Later pages come back first
+        await asyncio.sleep(0.01 * (10 - page))
+        in_flight -= 1
+
+        return Response(200, json=pretix_page(page, 5, url))
+
+    route = respx.get(url__startswith=url).mock(side_effect=respond)
+
+    orders = pretix.fetch_pretix_data(
+        "ep2025",
+        PretixData.PretixResources.orders,
+        max_concurrency=2,
+    )
+
+    assert [order["code"] for order in orders] == [
+        f"{page}-{i}" for page in range(1, 6) for i in (1, 2)
+    ]
+    assert route.call_count == 5
+    assert max_in_flight == 2
+
+
+@respx.mock
+def test_fetch_pretalx_data_concurrently_keeps_query_parameters():
+    url = "https://pretalx.com/api/events/europython-2025/submissions/?questions=all"
+    respx.get(url).mock(
+        return_value=Response(
+            200,
+            json={"count": 2, "results": [{"code": "A"}], "next": f"{url}&page=2"},
+        )
+    )
+    respx.get(f"{url}&page=2").mock(
+        return_value=Response(
+            200,
+            json={"count": 2, "results": [{"code": "B"}], "next": None},
+        )
+    )
+
+    submissions = pretalx.fetch_pretalx_data(
+        "europython-2025",
+        PretalxData.PretalxResources.submissions,
+        max_concurrency=4,
+    )
+
+    assert submissions == [{"code": "A"}, {"code": "B"}]
+
+
+@respx.mock
+def test_fetch_all_pages_raises_exception_on_errors():
+    url = "https://pretalx.com/api/events/europython-2025/speakers/"
+    # Without query parameters the first route would match any page
+    respx.get(f"{url}?page=2").mock(return_value=Response(500, text="Oops"))
+    respx.get(url).mock(
+        return_value=Response(
+            200,
+            json={"count": 2, "results": [{}], "next": f"{url}?page=2"},
+        )
+    )
+
+    with pytest.raises(Exception, match="Error 500: Oops"):
+        fetch_all_pages(url, headers={})
+
+
+@pytest.mark.slow
+@pytest.mark.enable_socket
+def test_benchmark_concurrent_pretix_download(pretix_stub):
+    """
+    Downloading 50 pages of orders, from a stub that takes 20ms to respond,
+    one page at a time, and 8 pages at a time.
+    """
+    pretix_stub.latency = 0.02
+
+    start = time.monotonic()
+    sequential = pretix.fetch_pretix_data("ep2025", PretixData.PretixResources.orders)
+    sequential_time = time.monotonic() - start
+
+    start = time.monotonic()
+    concurrent = pretix.fetch_pretix_data(
+        "ep2025",
+        PretixData.PretixResources.orders,
+        max_concurrency=8,
+    )
+    concurrent_time = time.monotonic() - start
+
+    print(
+        f"\nsequential:   {sequential_time * 1000:.1f}ms"
+        f"\nconcurrent 8: {concurrent_time * 1000:.1f}ms"
+    )
+    assert concurrent == sequential
+    assert concurrent_time < sequential_time / 3
@@ -1,7 +1,17 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
 import pytest
 import respx
 from core.integrations import pretix
-from core.models import PretixData
+from core.models import (
+    PretixData,
+    PretixOrder,
+    PretixOrderPosition,
+    PretixProduct,
+    PretixSyncState,
+    PretixVoucher,
+)
 from httpx import Response
 
 
@@ -198,3 +208,259 @@ def test_download_latest_vouchers():
         {"hello": "world"},
         {"foo": "bar"},
     ]
+
+
+def pretix_order(
+    code,
+    status="n",
+    last_modified="2025-03-01T10:00:00+00:00",
+    positions=(),
+):
+    return {
+        "code": code,
+        "status": status,
+        "email": f"{code.lower()}@example.com",
+        "total": "100.00",
+        "datetime": "2025-03-01T09:00:00+00:00",
+        "last_modified": last_modified,
+        "positions": [
+            {
+                "id": position_id,
+                "order": code,
+                "item": 100,
+                "variation": 5,
+                "price": "50.00",
+                "attendee_name": f"Attendee {position_id}",
+                "attendee_email": None,
+                "canceled": False,
+            }
+            for position_id in positions
+        ],
+    }
+
+
+@respx.mock
+@pytest.mark.django_db
+def test_sync_orders_downloads_all_orders_the_first_time():
+    url = "https://tickets.europython.eu/api/v1/organizers/europython/events/ep2025/orders/"
+    route = respx.get(url).mock(
+        return_value=Response(
+            200,
+            json={
+                "results": [
+                    pretix_order("ABC01"),
+                    pretix_order("ABC02", last_modified="2025-03-02T10:00:00+00:00"),
+                ],
+                "next": None,
+            },
+        )
+    )
+
+    count = pretix.sync_orders("ep2025")
+
+    assert count == 2
+    assert "modified_since" not in route.calls.last.request.url.params
+    assert PretixOrder.objects.filter(event="ep2025").count() == 2
+    state = PretixSyncState.objects.get(event="ep2025", resource="orders")
+    assert state.last_modified == datetime(2025, 3, 2, 10, tzinfo=timezone.utc)
+    assert state.synced_at is not None
+
+
+@respx.mock
+@pytest.mark.django_db
+def test_sync_orders_downloads_only_modified_orders_and_updates_them():
+    url = "https://tickets.europython.eu/api/v1/organizers/europython/events/ep2025/orders/"
+    PretixOrder.objects.create(
+        event="ep2025",
+        code="ABC01",
+        status="n",
+        content=pretix_order("ABC01"),
+    )
+    PretixSyncState.objects.create(
+        event="ep2025",
+        resource="orders",
+        last_modified=datetime(2025, 3, 1, 10, tzinfo=timezone.utc),
+    )
+    route = respx.get(url__startswith=url).mock(
+        return_value=Response(
+            200,
+            json={
+                "results": [
+                    pretix_order("ABC01", "p", "2025-03-03T10:00:00+00:00"),
+                    pretix_order("ABC03", "n", "2025-03-03T11:00:00+00:00"),
+                ],
+                "next": None,
+            },
+        )
+    )
+
+    pretix.sync_orders("ep2025")
+
+    params = route.calls.last.request.url.params
+    assert params["modified_since"] == "2025-03-01T10:00:00+00:00"
+    assert dict(PretixOrder.objects.values_list("code", "status")) == {
+        "ABC01": "p",
+        "ABC03": "n",
+    }
+    state = PretixSyncState.objects.get(event="ep2025", resource="orders")
+    assert state.last_modified == datetime(2025, 3, 3, 11, tzinfo=timezone.utc)
+
+
+@respx.mock
+@pytest.mark.django_db
+def test_sync_orders_keeps_the_watermark_if_nothing_changed():
+    url = "https://tickets.europython.eu/api/v1/organizers/europython/events/ep2025/orders/"
+    watermark = datetime(2025, 3, 1, 10, tzinfo=timezone.utc)
+    PretixSyncState.objects.create(
+        event="ep2025", resource="orders", last_modified=watermark
+    )
+    respx.get(url__startswith=url).mock(
+        return_value=Response(200, json={"results": [], "next": None})
+    )
+
+    assert pretix.sync_orders("ep2025") == 0
+
+    state = PretixSyncState.objects.get(event="ep2025", resource="orders")
+    assert state.last_modified == watermark
+
+
+@pytest.mark.django_db
+def test_upsert_orders_creates_orders_and_positions():
+    pretix.upsert_orders("ep2025", [pretix_order("ABC01", "p", positions=[1, 2])])
+
+    order = PretixOrder.objects.get(event="ep2025", code="ABC01")
+    assert order.status == PretixOrder.Status.paid
+    assert order.email == "abc01@example.com"
+    assert order.total == Decimal("100.00")
+    assert order.datetime == datetime(2025, 3, 1, 9, tzinfo=timezone.utc)
+    assert list(
+        order.positions.order_by("pretix_id").values_list(
+            "pretix_id", "item_id", "variation_id", "price", "attendee_name"
+        )
+    ) == [
+        (1, 100, 5, Decimal("50.00"), "Attendee 1"),
+        (2, 100, 5, Decimal("50.00"), "Attendee 2"),
+    ]
+
+
+@pytest.mark.django_db
+def test_upsert_orders_updates_orders_and_removes_positions():
+    pretix.upsert_orders("ep2025", [pretix_order("ABC01", "n", positions=[1, 2])])
+
+    pretix.upsert_orders("ep2025", [pretix_order("ABC01", "c", positions=[2])])
+
+    order = PretixOrder.objects.get(event="ep2025", code="ABC01")
+    assert order.status == PretixOrder.Status.canceled
+    assert list(order.positions.values_list("pretix_id", flat=True)) == [2]
+    assert PretixOrder.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_update_pretix_tables_loads_the_latest_downloads():
+    PretixData.objects.create(
+        event="ep2025",
+        resource=PretixData.PretixResources.orders,
+        content=[pretix_order("ABC01", "p", positions=[1]), pretix_order("ABC02")],
+    )
+    PretixData.objects.create(
+        event="ep2025",
+        resource=PretixData.PretixResources.products,
+        content=[
+            {
+                "id": 100,
+                "name": {"en": "Conference Ticket", "de": "Konferenzticket"},
+                "active": True,
+                "default_price": "300.00",
+            },
+        ],
+    )
+    PretixData.objects.create(
+        event="ep2025",
+        resource=PretixData.PretixResources.vouchers,
+        content=[
+            {
+                "id": 7,
+                "code": "SPEAKER",
+                "tag": "speakers",
+                "item": 100,
+                "max_usages": 10,
+                "redeemed": 3,
+                "valid_until": None,
+            },
+        ],
+    )
+    # Removed from pretix since the last download
+    PretixProduct.objects.create(event="ep2025", pretix_id=99, name="Old", content={})
+
+    counts = pretix.update_pretix_tables("ep2025")
+
+    assert counts == {"orders": 2, "products": 1, "vouchers": 1}
+    assert PretixOrder.objects.filter(status="p").count() == 1
+    assert PretixOrderPosition.objects.get().order.code == "ABC01"
+    assert list(PretixProduct.objects.values_list("name", flat=True)) == [
+        "Conference Ticket"
+    ]
+    voucher = PretixVoucher.objects.get()
+    assert (voucher.code, voucher.item_id, voucher.redeemed) == ("SPEAKER", 100, 3)
+    assert not PretixData.objects.filter(processed_at__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_update_pretix_tables_skips_already_loaded_downloads():
+    PretixData.objects.create(
+        event="ep2025",
+        resource=PretixData.PretixResources.orders,
+        content=[pretix_order("ABC01")],
+    )
+    pretix.update_pretix_tables("ep2025")
+    PretixOrder.objects.all().delete()
+
+    counts = pretix.update_pretix_tables("ep2025")
+
+    assert counts["orders"] == 0
+    assert not PretixOrder.objects.exists()
+
+
+@pytest.mark.django_db
+def test_update_pretix_tables_loads_only_downloads_of_the_event():
+    PretixData.objects.create(
+        event="ep2025",
+        resource=PretixData.PretixResources.orders,
+        content=[pretix_order("ABC01")],
+    )
+    # Newer, but of another event
+    PretixData.objects.create(
+        event="ep2026",
+        resource=PretixData.PretixResources.orders,
+        content=[pretix_order("XYZ01")],
+    )
+
+    counts = pretix.update_pretix_tables("ep2025")
+
+    assert counts["orders"] == 1
+    assert list(PretixOrder.objects.values_list("event", "code")) == [
+        ("ep2025", "ABC01")
+    ]
+
+
+@pytest.mark.django_db
+def test_update_pretix_tables_loads_orders_in_batches(monkeypatch):
+    PretixData.objects.create(
+        event="ep2025",
+        resource=PretixData.PretixResources.orders,
+        content=[pretix_order(f"ABC0{i}", positions=[i]) for i in range(5)],
+    )
+    monkeypatch.setattr(pretix, "SYNC_BATCH_SIZE", 2)
+    batches = []
+    upsert_orders = pretix.upsert_orders
+    monkeypatch.setitem(
+        pretix.UPSERTS,
+        PretixData.PretixResources.orders,
+        lambda event, data: batches.append(len(data)) or upsert_orders(event, data),
+    )
+
+    counts = pretix.update_pretix_tables("ep2025")
+
+    assert counts["orders"] == 5
+    assert batches == [2, 2, 1]
+    assert PretixOrderPosition.objects.count() == 5
@@ -0,0 +1,131 @@
+import pytest
+import respx
+from core.analysis.products import get_latest_products_data
+from core.analysis.submissions import get_latest_submissions_data
+from core.integrations import pretix
+from core.integrations.storage import compact_downloads, deduplicate
+from core.models import PretalxData, PretixData
+from httpx import Response
+
+PRODUCTS_URL = (
+    "https://tickets.europython.eu/api/v1/organizers/europython/events/ep2025/items/"
+)
+
+
+def mock_products(products: list[dict]):
+    respx.get(PRODUCTS_URL).mock(
+        return_value=Response(200, json={"results": products, "next": None})
+    )
+
+
+@respx.mock
+@pytest.mark.django_db
+def test_unchanged_download_is_stored_as_a_marker():
+    mock_products([{"id": 1, "name": "Business"}])
+    first = pretix.download_latest_products("ep2025")
+    second = pretix.download_latest_products("ep2025")
+
+    assert second.pk == first.pk
+    marker = PretixData.objects.latest("created_at")
+    assert marker.pk != first.pk
+    assert marker.content is None
+    assert marker.same_as == first
+    assert marker.content_hash == first.content_hash != ""
+    assert get_latest_products_data().pk == first.pk
+    assert get_latest_products_data().content == [{"id": 1, "name": "Business"}]
+
+
+@respx.mock
+@pytest.mark.django_db
+def test_changed_download_is_stored_with_the_content():
+    mock_products([{"id": 1, "name": "Business"}])
+    first = pretix.download_latest_products("ep2025")
+    mock_products([{"id": 1, "name": "Business"}, {"id": 2, "name": "Personal"}])
+    second = pretix.download_latest_products("ep2025")
+
+    assert second.pk != first.pk
+    assert second.same_as is None
+    assert second.content_hash != first.content_hash
+    assert len(get_latest_products_data().content) == 2
+
+
+@respx.mock
+@pytest.mark.django_db
+def test_streamed_download_is_deduplicated_with_the_regular_one():
+    mock_products([{"id": 1, "name": "Business", "active": True}])
+    regular = pretix.download_latest_products("ep2025")
+    # Same data, different order of keys
+    mock_products([{"active": True, "name": "Business", "id": 1}])
+    streamed = pretix.download_latest_products("ep2025", stream=True)
+
+    assert streamed.pk == regular.pk
+    assert PretixData.objects.filter(same_as=regular).count() == 1
+
+
+@pytest.mark.django_db
+def test_deduplicate_only_within_the_same_event(create_products):
+    ep2024 = deduplicate(create_products([], event="ep2024"))
+    ep2025 = deduplicate(create_products([], event="ep2025"))
+
+    assert ep2025.pk != ep2024.pk
+    assert ep2025.content == []
+
+
+@pytest.mark.django_db
+def test_latest_submissions_data_of_an_unchanged_download():
+    content = [{"code": "ABCDEF"}]
+    first = deduplicate(
+        PretalxData.objects.create(
+            resource=PretalxData.PretalxResources.submissions,
+            content=content,
+        )
+    )
+    deduplicate(
+        PretalxData.objects.create(
+            resource=PretalxData.PretalxResources.submissions,
+            content=content,
+        )
+    )
+
+    latest = get_latest_submissions_data()
+
+    assert latest.pk == first.pk
+    assert latest.content == content
+
+
+@respx.mock
+@pytest.mark.django_db
+def test_update_pretix_tables_skips_unchanged_downloads():
+    mock_products([{"id": 1, "name": {"en": "Business"}, "active": True}])
+    pretix.download_latest_products("ep2025")
+    assert pretix.update_pretix_tables("ep2025")["products"] == 1
+
+    pretix.download_latest_products("ep2025")
+
+    assert pretix.update_pretix_tables("ep2025")["products"] == 0
+
+
+@pytest.mark.django_db
+def test_compact_downloads(create_products):
+    a1 = create_products([{"id": 1}])
+    a2 = create_products([{"id": 1}])
+    b = create_products([{"id": 2}])
+    a3 = create_products([{"id": 1}])
+    # Marker pointing at a download that becomes a marker itself
+    a4 = create_products(None)
+    PretixData.objects.filter(pk=a4.pk).update(same_as=a2)
+
+    assert compact_downloads(PretixData) == 2
+
+    for download in [a1, a2, b, a3, a4]:
+        download.refresh_from_db()
+    assert a1.same_as is None
+    assert a1.content == [{"id": 1}]
+    assert b.same_as is None
+    assert b.content == [{"id": 2}]
+    assert [a2.same_as, a3.same_as, a4.same_as] == [a1, a1, a1]
+    assert [a2.content, a3.content, a4.content] == [None, None, None]
+    assert get_latest_products_data().pk == a1.pk
+
+    # Nothing left to do
+    assert compact_downloads(PretixData) == 0
@@ -0,0 +1,143 @@
+import time
+import tracemalloc
+
+import pytest
+import respx
+from core.integrations import pretalx, pretix
+from core.integrations.streaming import iter_content, save_pages
+from core.models import DownloadPage, PretalxData, PretixData, PretixOrder
+from django.db import transaction
+from httpx import Response
+
+
+@pytest.mark.django_db
+def test_save_pages_puts_the_pages_together_in_order():
+    pages = [[{"code": "A"}, {"code": "B"}], [], [{"code": "C"}], [{"code": "D"}]]
+
+    pretix_data = save_pages(
+        PretixData(event="ep2025", resource=PretixData.PretixResources.orders),
+        iter(pages),
+    )
+
+    assert pretix_data.get_deferred_fields() == {"content"}
+    assert pretix_data.content == [
+        {"code": "A"},
+        {"code": "B"},
+        {"code": "C"},
+        {"code": "D"},
+    ]
+    assert pretix_data.event == "ep2025"
+    # Pages are only needed until the download is saved
+    assert not DownloadPage.objects.exists()
+
+
+@pytest.mark.django_db
+def test_iter_content_in_batches():
+    pretix_data = PretixData.objects.create(
+        event="ep2025",
+        resource=PretixData.PretixResources.orders,
+        content=[{"code": code} for code in "ABCDE"],
+    )
+
+    with transaction.atomic():
+        batches = list(iter_content(pretix_data, 2))
+
+    assert batches == [
+        [{"code": "A"}, {"code": "B"}],
+        [{"code": "C"}, {"code": "D"}],
+        [{"code": "E"}],
+    ]
+
+
+@pytest.mark.django_db
+def test_save_pages_without_results():
+    pretalx_data = save_pages(
+        PretalxData(resource=PretalxData.PretalxResources.submissions),
+        iter([[]]),
+    )
+
+    assert pretalx_data.content == []
+
+
+@pytest.mark.django_db
+def test_save_pages_doesnt_save_anything_if_the_download_fails():
+    def pages():
+        yield [{"code": "A"}]
+        raise Exception("Error 500: Oops")
+
+    with pytest.raises(Exception, match="Oops"):
+        save_pages(PretixData(resource=PretixData.PretixResources.orders), pages())
+
+    assert not PretixData.objects.exists()
+    assert not DownloadPage.objects.exists()
+
+
+@respx.mock
+@pytest.mark.django_db
+def test_streamed_download_is_the_same_as_the_regular_one():
+    url = "https://pretalx.com/api/events/europython-2025/submissions/?questions=all"
+    respx.get(url + "&page=2").mock(
+        return_value=Response(200, json={"results": [{"page": 2}], "next": None})
+    )
+    respx.get(url).mock(
+        return_value=Response(
+            200,
+            json={"results": [{"page": 1}, {"page": 1}], "next": url + "&page=2"},
+        )
+    )
+
+    regular = pretalx.download_latest_submissions("europython-2025")
+    streamed = pretalx.download_latest_submissions("europython-2025", stream=True)
+
+    # Both have the same content, so it's stored only once
+    assert streamed.pk == regular.pk
+    assert PretalxData.objects.filter(same_as=regular).count() == 1
+    assert streamed.event == "europython-2025"
+    assert streamed.resource == PretalxData.PretalxResources.submissions
+    assert (
+        streamed.content == regular.content == [{"page": 1}, {"page": 1}, {"page": 2}]
+    )
+
+
+@pytest.mark.slow
+@pytest.mark.enable_socket
+@pytest.mark.django_db
+def test_benchmark_streamed_pretix_download(monkeypatch, pretix_stub):
+    """
+    Peak memory (of python objects, as seen by tracemalloc) of downloading
+    100k orders from a stub, at once and page by page, and of loading them
+    into the tables after that.
+    """
+    monkeypatch.setattr(pretix_stub, "pages", 2000)
+
+    tracemalloc.start()
+    start = time.monotonic()
+    regular = pretix.download_latest_orders("ep2025")
+    regular_time = time.monotonic() - start
+    _, regular_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    start = time.monotonic()
+    streamed = pretix.download_latest_orders("ep2025", stream=True)
+    streamed_time = time.monotonic() - start
+    _, streamed_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    start = time.monotonic()
+    counts = pretix.update_pretix_tables("ep2025")
+    tables_time = time.monotonic() - start
+    _, tables_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"\nat once:      {regular_peak / 2**20:.1f}MiB in {regular_time:.1f}s"
+        f"\npage by page: {streamed_peak / 2**20:.1f}MiB in {streamed_time:.1f}s"
+        f"\ntables:       {tables_peak / 2**20:.1f}MiB in {tables_time:.1f}s"
+    )
+    assert len(streamed.content) == 100_000
+    assert streamed.content == regular.content
+    assert streamed_peak < regular_peak / 10
+    assert counts["orders"] == PretixOrder.objects.count() == 100_000
+    assert tables_peak < regular_peak / 10
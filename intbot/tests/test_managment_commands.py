@@ -1,7 +1,19 @@
+from unittest.mock import patch
+
 import pytest
 import respx
-from core.models import PretalxData, PretixData
+from core.analysis.snapshots import scan_snapshot
+from core.models import (
+    DiscordMessage,
+    DownloadPage,
+    PretalxData,
+    PretixData,
+    PretixOrder,
+    Webhook,
+)
+from core.tasks import PENDING_MIN_AGE
 from django.core.management import call_command
+from django.utils import timezone
 from httpx import Response
 
 
@@ -34,6 +46,48 @@ def test_download_pretalx_data_command(capsys):
     )
 
 
+@respx.mock
+@pytest.mark.django_db
+def test_download_pretalx_data_command_writes_a_snapshot(capsys):
+    base_url = "https://pretalx.com/api/events/europython-2025/"
+    respx.get(f"{base_url}submissions/?questions=all").mock(
+        return_value=Response(
+            200,
+            json={
+                "results": [
+                    {
+                        "code": "ABCDEF",
+                        "state": "submitted",
+                        "title": "Title",
+                        "track": None,
+                        "created": "2025-01-14T01:24:36",
+                        "abstract": "Abstract",
+                        "duration": 30,
+                        "submission_type": "Talk",
+                    },
+                ],
+                "next": None,
+            },
+        )
+    )
+    respx.get(f"{base_url}speakers/?questions=all").mock(
+        return_value=Response(200, json={"results": [], "next": None})
+    )
+
+    with patch("core.analysis.charts.render_figure", return_value=b"PNG") as render:
+        call_command("download_pretalx_data", event="europython-2025")
+
+    stdout, stderr = capsys.readouterr()
+    assert "Saved submissions snapshot" in stdout
+    # Charts are pre-rendered in the background
+    assert render.call_count == 2
+    submissions = PretalxData.objects.get(
+        resource=PretalxData.PretalxResources.submissions
+    )
+    assert submissions.event == "europython-2025"
+    assert scan_snapshot(submissions).collect()["code"].to_list() == ["ABCDEF"]
+
+
 @respx.mock
 @pytest.mark.django_db
 def test_download_pretix_data_command(capsys):
@@ -53,6 +107,7 @@ def test_download_pretix_data_command(capsys):
     assert "Downloading latest products" in stdout
     assert "Downloading latest vouchers" in stdout
     assert "Downloading latest orders" in stdout
+    assert "Recorded 0 added, 0 changed and 0 removed orders" in stdout
     assert (
         PretixData.objects.get(resource=PretixData.PretixResources.orders).content == []
     )
@@ -64,3 +119,154 @@ def test_download_pretix_data_command(capsys):
         PretixData.objects.get(resource=PretixData.PretixResources.products).content
         == []
     )
+
+
+@respx.mock
+@pytest.mark.django_db
+def test_download_pretix_data_command_concurrently():
+    base_url = (
+        "https://tickets.europython.eu/api/v1/organizers/europython/events/ep2025/"
+    )
+    for endpoint in ["orders/", "items/", "vouchers/"]:
+        url = f"{base_url}{endpoint}"
+        respx.get(f"{url}?page=2").mock(
+            return_value=Response(
+                200,
+                json={"count": 2, "results": [{"code": "P2", "page": 2}], "next": None},
+            )
+        )
+        respx.get(url).mock(
+            return_value=Response(
+                200,
+                json={
+                    "count": 2,
+                    "results": [{"code": "P1", "page": 1}],
+                    "next": f"{url}?page=2",
+                },
+            )
+        )
+
+    call_command(
+        "download_pretix_data",
+        event="ep2025",
+        concurrent=True,
+        max_concurrency=2,
+    )
+
+    assert PretixData.objects.get(
+        resource=PretixData.PretixResources.orders
+    ).content == [{"code": "P1", "page": 1}, {"code": "P2", "page": 2}]
+
+
+@respx.mock
+@pytest.mark.django_db
+def test_download_pretix_data_command_streamed():
+    base_url = (
+        "https://tickets.europython.eu/api/v1/organizers/europython/events/ep2025/"
+    )
+    for endpoint in ["orders/", "items/", "vouchers/"]:
+        url = f"{base_url}{endpoint}"
+        respx.get(f"{url}?page=2").mock(
+            return_value=Response(
+                200, json={"results": [{"code": "P2", "page": 2}], "next": None}
+            )
+        )
+        respx.get(url).mock(
+            return_value=Response(
+                200,
+                json={"results": [{"code": "P1", "page": 1}], "next": f"{url}?page=2"},
+            )
+        )
+
+    call_command("download_pretix_data", event="ep2025", stream=True)
+
+    assert PretixData.objects.get(
+        resource=PretixData.PretixResources.orders
+    ).content == [{"code": "P1", "page": 1}, {"code": "P2", "page": 2}]
+    assert not DownloadPage.objects.exists()
+
+
+@respx.mock
+@pytest.mark.django_db
+def test_download_pretix_data_command_incremental(capsys):
+    url = "https://tickets.europython.eu/api/v1/organizers/europython/events/ep2025/orders/"
+    order = {
+        "code": "ABC01",
+        "status": "p",
+        "datetime": "2025-03-01T09:00:00+00:00",
+        "last_modified": "2025-03-01T10:00:00+00:00",
+    }
+    respx.get(url).mock(
+        return_value=Response(200, json={"results": [order], "next": None})
+    )
+
+    call_command("download_pretix_data", event="ep2025", incremental=True)
+
+    stdout, stderr = capsys.readouterr()
+    assert "Syncing modified orders" in stdout
+    assert "Synced 1 orders" in stdout
+    assert PretixOrder.objects.get(code="ABC01").status == "p"
+    # Only orders are synced, no full snapshots
+    assert not PretixData.objects.exists()
+
+
+@pytest.mark.django_db
+def test_update_pretix_tables_command(capsys):
+    PretixData.objects.create(
+        event="ep2025",
+        resource=PretixData.PretixResources.orders,
+        content=[{"code": "ABC01", "status": "p", "positions": []}],
+    )
+
+    call_command("update_pretix_tables", event="ep2025")
+
+    stdout, stderr = capsys.readouterr()
+    assert "Loaded 1 orders" in stdout
+    assert "Loaded 0 products" in stdout
+    assert PretixOrder.objects.get(code="ABC01").status == "p"
+
+
+@pytest.mark.django_db
+def test_process_pending_webhooks_command(capsys):
+    Webhook.objects.create(source="internal", content={}, extra={})
+    Webhook.objects.update(created_at=timezone.now() - PENDING_MIN_AGE)
+
+    call_command("process_pending_webhooks", source="internal")
+
+    stdout, stderr = capsys.readouterr()
+    assert "Processed pending internal webhooks, created 1 messages" in stdout
+    assert DiscordMessage.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_compact_downloads_command(capsys):
+    for _ in range(3):
+        PretixData.objects.create(
+            resource=PretixData.PretixResources.products,
+            content=[{"id": 1}],
+        )
+
+    call_command("compact_downloads")
+
+    stdout, stderr = capsys.readouterr()
+    assert "Deduplicated 0 downloads of pretalx data" in stdout
+    assert "Deduplicated 2 downloads of pretix data" in stdout
+    assert PretixData.objects.filter(content__isnull=True).count() == 2
+
+
+@pytest.mark.django_db
+def test_backfill_orders_history_command(capsys):
+    for codes in [["A"], ["A", "B"], ["B"]]:
+        PretixData.objects.create(
+            event="ep2025",
+            resource=PretixData.PretixResources.orders,
+            content=[{"code": code} for code in codes],
+        )
+
+    call_command("backfill_orders_history", event="ep2025", prune=True)
+
+    stdout, stderr = capsys.readouterr()
+    assert "Recorded 3 downloads of orders of ep2025" in stdout
+    # Only the keyframe and the latest download are kept
+    assert "Removed 1 recorded downloads of orders" in stdout
+    assert PretixData.objects.count() == 2
@@ -0,0 +1,86 @@
+"""
+Checks that the hot queries can be served from an index.
+
+Tables in tests are (almost) empty, so Postgres would happily pick a
+sequential scan for every query. We turn those off for the duration of the
+test, and if there is no matching index the planner falls back to a
+sequential scan anyway, which is what we check for.
+"""
+
+import uuid
+
+import pytest
+from core.bot.main import get_messages
+from core.models import DiscordMessage, InboxItem, PretalxData, PretixData, Webhook
+from django.db import connection
+
+
+@pytest.fixture
+def no_seqscan(db):
+    with connection.cursor() as cursor:
+        cursor.execute("SET enable_seqscan = off")
+    yield
+    with connection.cursor() as cursor:
+        cursor.execute("SET enable_seqscan = on")
+
+
+def assert_uses_index(queryset, index_name: str = ""):
+    plan = queryset.explain()
+
+    assert "Seq Scan" not in plan
+    assert "Index" in plan
+    assert index_name in plan
+
+
+def test_unsent_discord_messages_use_partial_index(no_seqscan):
+    assert_uses_index(get_messages(), "discordmessage_unsent_idx")
+
+
+def test_inbox_of_a_user_uses_index(no_seqscan):
+    qs = InboxItem.objects.filter(user_id="1234").order_by("-created_at")
+
+    assert_uses_index(qs, "inboxitem_user_idx")
+
+
+def test_removing_message_from_inbox_uses_index(no_seqscan):
+    # Without statistics both indexes look the same to the planner, with them
+    # the user's inbox is clearly less selective than a single message in it
+    InboxItem.objects.bulk_create(
+        InboxItem(message_id=str(i), user_id="1234", content="Hello")
+        for i in range(1000)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {InboxItem._meta.db_table}")
+
+    qs = InboxItem.objects.filter(message_id="1234", user_id="1234")
+
+    assert_uses_index(qs, "inboxitem_message_user_uniq")
+
+
+def test_webhook_by_uuid_uses_index(no_seqscan):
+    qs = Webhook.objects.filter(uuid=uuid.uuid4())
+
+    assert_uses_index(qs)
+
+
+def test_latest_pretalx_data_uses_index(no_seqscan):
+    qs = PretalxData.objects.filter(
+        resource=PretalxData.PretalxResources.submissions
+    ).order_by("-created_at")[:1]
+
+    assert_uses_index(qs, "pretalxdata_latest_idx")
+
+
+def test_latest_pretix_data_uses_index(no_seqscan):
+    qs = PretixData.objects.filter(
+        resource=PretixData.PretixResources.products
+    ).order_by("-created_at")[:1]
+
+    assert_uses_index(qs, "pretixdata_latest_idx")
+
+
+@pytest.mark.parametrize(
+    "model", [DiscordMessage, InboxItem, PretalxData, PretixData, Webhook]
+)
+def test_uuid_is_unique(model):
+    assert model._meta.get_field("uuid").unique
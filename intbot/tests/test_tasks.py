@@ -1,21 +1,42 @@
+import contextlib
+import copy
+import json
 import logging
+import time
+from datetime import timedelta
 from django.conf import settings
 
 import pytest
 import respx
-from core.integrations.github import GITHUB_API_URL
+from core.integrations.github import GITHUB_API_URL, project_item_cache_stats
 from core.models import DiscordMessage, Webhook
 from core.tasks import (
+    PENDING_MAX_AGE,
+    PENDING_MIN_AGE,
+    WEBHOOK_CLAIM_LEASE,
+    claim_webhooks,
+    enqueue_github_webhook,
+    process_github_webhooks,
     process_github_webhook,
     process_internal_webhook,
+    process_pending_webhooks,
     process_webhook,
+    process_webhook_batch,
     process_zammad_webhook,
 )
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils import timezone
 from django_tasks.task import ResultStatus
+from freezegun import freeze_time
 from httpx import Response
 
 
+def after_grace_period():
+    """Time when the webhooks created just now are picked up as pending"""
+    return freeze_time(timezone.now() + PENDING_MIN_AGE, tick=True)
+
+
 @pytest.mark.django_db
 def test_process_internal_webhook_handles_internal_webhook_correctly():
     wh = Webhook.objects.create(
@@ -81,6 +102,26 @@ def test_process_github_webhook_logs_unsupported_event(caplog):
     )
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize("batch", [False, True])
+def test_unsupported_github_event_is_processed_without_a_message(batch):
+    wh = Webhook.objects.create(
+        source="github",
+        meta={"X-Github-Event": "testrandom"},
+        content={},
+        extra={},
+    )
+
+    if batch:
+        process_webhook_batch([wh])
+    else:
+        process_webhook.enqueue(str(wh.uuid))
+
+    wh.refresh_from_db()
+    assert wh.processed_at is not None
+    assert not DiscordMessage.objects.exists()
+
+
 @pytest.mark.django_db
 @respx.mock
 def test_process_github_webhook_skips_a_message_when_unsupported_project(
@@ -171,6 +212,8 @@ def test_process_github_webhook_creates_a_message_from_supported(
         "**[Test Issue](https://github.com/test-issue)**"
         " from **Done** to **In progress**"
     )
+    assert dm.meta["coalesce_key"] == "github:PVTI_random_projectItemV2ID:Status"
+    assert dm.meta["template"].format(**dm.meta) == dm.content
     assert dm.sent_at is None
 
 
@@ -221,3 +264,298 @@ def test_process_zammad_webhook_creates_a_message_from_supported_queue():
         "https://servicedesk.europython.eu/#ticket/zoom/123"
     )
     assert dm.sent_at is None
+
+
+def internal_webhooks(count: int) -> list[Webhook]:
+    return Webhook.objects.bulk_create(
+        [
+            Webhook(source="internal", content={"event": f"test{i}"}, extra={})
+            for i in range(count)
+        ]
+    )
+
+
+@pytest.mark.django_db
+def test_process_pending_webhooks_processes_all_pending_webhooks():
+    internal_webhooks(3)
+    Webhook.objects.create(
+        source="internal",
+        content={"event": "already processed"},
+        extra={},
+        processed_at=timezone.now(),
+    )
+    Webhook.objects.create(source="zammad", content={}, extra={})
+
+    with after_grace_period():
+        created = process_pending_webhooks.call("internal")
+
+    assert created == 3
+    assert [dm.content for dm in DiscordMessage.objects.order_by("id")] == [
+        "Webhook content: {'event': 'test0'}",
+        "Webhook content: {'event': 'test1'}",
+        "Webhook content: {'event': 'test2'}",
+    ]
+    assert not Webhook.objects.filter(source="internal", processed_at=None)
+    assert Webhook.objects.get(source="zammad").processed_at is None
+
+
+@pytest.mark.django_db
+def test_process_pending_webhooks_uses_constant_number_of_queries():
+    def queries_for(count):
+        internal_webhooks(count)
+        with after_grace_period(), CaptureQueriesContext(connection) as queries:
+            process_pending_webhooks.call("internal")
+        return len(queries)
+
+    assert queries_for(1) == queries_for(100)
+
+
+@pytest.mark.django_db
+def test_process_pending_webhooks_picks_up_only_recent_webhooks():
+    new, old, ancient = internal_webhooks(3)
+    Webhook.objects.filter(pk=old.pk).update(
+        created_at=timezone.now() - PENDING_MIN_AGE
+    )
+    Webhook.objects.filter(pk=ancient.pk).update(
+        created_at=timezone.now() - PENDING_MAX_AGE - timedelta(minutes=1)
+    )
+
+    created = process_pending_webhooks.call("internal")
+
+    assert created == 1
+    assert list(Webhook.objects.exclude(processed_at=None)) == [old]
+
+
+@pytest.mark.django_db
+def test_process_pending_webhooks_skips_claimed_webhooks():
+    claimed, expired, pending = internal_webhooks(3)
+    claim_webhooks(Webhook.objects.filter(pk__in=[claimed.pk, expired.pk]))
+    Webhook.objects.filter(pk=expired.pk).update(
+        claimed_at=timezone.now() - WEBHOOK_CLAIM_LEASE - timedelta(seconds=1)
+    )
+
+    with after_grace_period():
+        created = process_pending_webhooks.call("internal")
+
+    assert created == 2
+    assert Webhook.objects.get(pk=claimed.pk).processed_at is None
+
+
+@pytest.mark.django_db
+def test_claim_webhooks_skips_processed_and_claimed_webhooks():
+    first, second, third = internal_webhooks(3)
+    Webhook.objects.filter(pk=third.pk).update(processed_at=timezone.now())
+
+    assert claim_webhooks(Webhook.objects.all(), limit=1) == [first]
+    assert claim_webhooks(Webhook.objects.all()) == [second]
+    assert claim_webhooks(Webhook.objects.all()) == []
+
+
+@pytest.mark.django_db
+def test_process_webhook_doesnt_process_webhook_twice():
+    [wh] = internal_webhooks(1)
+
+    process_webhook.call(str(wh.uuid))
+    process_webhook.call(str(wh.uuid))
+
+    assert DiscordMessage.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_process_webhook_skips_webhook_claimed_by_batch_mode():
+    [wh] = internal_webhooks(1)
+    claim_webhooks(Webhook.objects.all())
+
+    process_webhook.call(str(wh.uuid))
+
+    wh.refresh_from_db()
+    assert wh.processed_at is None
+    assert DiscordMessage.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_process_pending_webhooks_fails_if_unsupported_source():
+    with pytest.raises(ValueError, match="Unsupported source asdf"):
+        process_pending_webhooks.call("asdf")
+
+
+@pytest.mark.django_db
+def test_process_webhook_batch_marks_unsupported_webhooks_as_processed():
+    wh = Webhook.objects.create(
+        source="github",
+        meta={"X-Github-Event": "testrandom"},
+        content={},
+        extra={},
+    )
+
+    messages = process_webhook_batch([wh])
+
+    wh.refresh_from_db()
+    assert messages == []
+    assert wh.processed_at is not None
+
+
+@pytest.mark.django_db
+@respx.mock
+def test_process_webhook_batch_leaves_failed_webhooks_for_later(github_data):
+    [internal] = internal_webhooks(1)
+    github = Webhook.objects.create(
+        source="github",
+        meta={"X-Github-Event": "projects_v2_item"},
+        content=github_data["project_v2_item.edited"],
+        extra={},
+    )
+    respx.post(GITHUB_API_URL).mock(return_value=Response(500, text="Oops"))
+
+    messages = process_webhook_batch([github, internal])
+
+    internal.refresh_from_db()
+    github.refresh_from_db()
+    assert len(messages) == 1
+    assert internal.processed_at is not None
+    assert github.processed_at is None
+
+
+def mock_nodes_query():
+    """Mock GitHub's nodes(ids: ...) query, with an issue for every item"""
+
+    def respond(request):
+        item_ids = json.loads(request.content)["variables"]["itemIds"]
+        nodes = [
+            {
+                "project": {
+                    "id": "PVT_Test_Board_Project",
+                    "title": "Test Board Project",
+                    "url": "https://github.com/europython",
+                },
+                "content": {
+                    "__typename": "Issue",
+                    "id": f"I_{item_id}",
+                    "title": f"Issue {item_id}",
+                    "url": f"https://github.com/test-issue/{item_id}",
+                },
+            }
+            for item_id in item_ids
+        ]
+        return Response(200, json={"data": {"nodes": nodes}})
+
+    return respx.post(GITHUB_API_URL).mock(side_effect=respond)
+
+
+@pytest.mark.django_db
+@respx.mock
+def test_process_webhook_batch_fetches_github_project_items_in_batches(
+    github_data,
+):
+    """
+    When a project board is bulk-edited, all the webhooks need just a couple
+    of requests to GitHub, instead of one request each.
+    """
+    webhooks = []
+    for i in range(150):
+        content = copy.deepcopy(github_data["project_v2_item.edited"])
+        content["projects_v2_item"]["node_id"] = f"PVTI_{i}"
+        webhooks.append(
+            Webhook.objects.create(
+                source="github",
+                meta={"X-Github-Event": "projects_v2_item"},
+                content=content,
+                extra={},
+            )
+        )
+
+    route = mock_nodes_query()
+
+    messages = process_webhook_batch(webhooks)
+
+    assert route.call_count == 2
+    assert project_item_cache_stats()["saved_requests"] == 148
+    assert len(messages) == 150
+    assert "[Issue PVTI_42](https://github.com/test-issue/PVTI_42)" in (
+        messages[42].content
+    )
+
+
+@contextlib.contextmanager
+def count_queries():
+    """
+    Like CaptureQueriesContext, but without its limit of 9000 queries
+    """
+    queries = []
+
+    def count(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        yield queries
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("count", [1, 100, 10_000])
+@pytest.mark.django_db
+def test_benchmark_process_pending_webhooks(count):
+    """
+    Per-event cost of processing webhooks one by one (task per webhook), and
+    all at once in the batch mode.
+    """
+    webhooks = internal_webhooks(count)
+    with count_queries() as single_queries:
+        start = time.monotonic()
+        for wh in webhooks:
+            process_webhook.call(str(wh.uuid))
+        single = time.monotonic() - start
+
+    internal_webhooks(count)
+    with count_queries() as batch_queries:
+        with after_grace_period():
+            start = time.monotonic()
+            process_pending_webhooks.call("internal")
+            batch = time.monotonic() - start
+
+    print(
+        f"\n{count} webhooks"
+        f"\none by one: {single / count * 1000:.3f}ms/event, "
+        f"{len(single_queries) / count:.2f} queries/event"
+        f"\nbatch:      {batch / count * 1000:.3f}ms/event, "
+        f"{len(batch_queries) / count:.2f} queries/event"
+    )
+    assert DiscordMessage.objects.count() == 2 * count
+    if count > 1:
+        assert len(batch_queries) < len(single_queries)
+
+
+@pytest.mark.django_db
+@respx.mock
+def test_process_github_webhooks_processes_recent_webhooks_together(github_data):
+    for i in range(3):
+        content = copy.deepcopy(github_data["project_v2_item.edited"])
+        content["projects_v2_item"]["node_id"] = f"PVTI_{i}"
+        Webhook.objects.create(
+            source="github",
+            meta={"X-Github-Event": "projects_v2_item"},
+            content=content,
+            extra={},
+        )
+    route = mock_nodes_query()
+
+    created = process_github_webhooks.call()
+
+    assert created == 3
+    assert route.call_count == 1
+    assert not Webhook.objects.filter(processed_at=None).exists()
+    # Tasks of the other webhooks have nothing left to do
+    assert process_github_webhooks.call() == 0
+
+
+@pytest.mark.django_db
+def test_enqueue_github_webhook_waits_for_other_webhooks():
+    dummy = {
+        "BACKEND": "django_tasks.backends.dummy.DummyBackend",
+        "ENQUEUE_ON_COMMIT": False,
+    }
+    with override_settings(TASKS={"default": dummy}):
+        enqueue_github_webhook()
+        [result] = process_github_webhooks.get_backend().results
+
+    assert result.task.run_after > timezone.now()
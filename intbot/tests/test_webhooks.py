@@ -1,10 +1,20 @@
 import hashlib
 import hmac
 import json
+import time
 
 import pytest
-from core.models import Webhook
+from core.endpoints.webhooks import (
+    BATCH_MAX_SIZE,
+    RecentWebhooks,
+    parse_webhook_batch,
+    recent_webhooks,
+)
+from core.models import DiscordMessage, Webhook
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django_tasks.backends.database.models import DBTaskResult
 
 
 @pytest.mark.django_db
@@ -73,6 +83,166 @@ def test_internal_wh_endpoint_works_with_correct_token(client):
     assert response.json()["guid"] == str(wh.uuid)
 
 
+@pytest.mark.django_db
+def test_internal_wh_batch_endpoint_checks_authorization_token(client):
+    response = client.post(
+        "/webhook/internal/batch/",
+        json.dumps([{"event": "test1"}]),
+        content_type="application/json",
+        HTTP_AUTHORIZATION="random-incorrect-token",
+    )
+
+    assert response.status_code == 403
+    assert response.json()["message"] == "Token doesn't match"
+    assert not Webhook.objects.exists()
+
+
+@pytest.mark.django_db
+def test_internal_wh_batch_endpoint_accepts_json_array(client):
+    events = [{"event": f"test{i}"} for i in range(3)]
+
+    response = client.post(
+        "/webhook/internal/batch/",
+        json.dumps(events),
+        content_type="application/json",
+        HTTP_AUTHORIZATION=settings.WEBHOOK_INTERNAL_TOKEN,
+    )
+
+    webhooks = list(Webhook.objects.order_by("id"))
+    assert response.status_code == 200
+    assert response.json()["status"] == "created"
+    assert response.json()["guids"] == [str(wh.uuid) for wh in webhooks]
+    assert [wh.content for wh in webhooks] == events
+    assert {wh.source for wh in webhooks} == {"internal"}
+    # All of them processed by the (immediate) task backend in tests
+    assert all(wh.processed_at for wh in webhooks)
+    assert DiscordMessage.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_internal_wh_batch_endpoint_accepts_ndjson(client):
+    events = [{"event": f"test{i}"} for i in range(3)]
+    body = "\n".join(json.dumps(event) for event in events) + "\n"
+
+    response = client.post(
+        "/webhook/internal/batch/",
+        body,
+        content_type="application/x-ndjson",
+        HTTP_AUTHORIZATION=settings.WEBHOOK_INTERNAL_TOKEN,
+    )
+
+    assert response.status_code == 200
+    assert len(response.json()["guids"]) == 3
+    assert [wh.content for wh in Webhook.objects.order_by("id")] == events
+
+
+@pytest.mark.parametrize(
+    "body,message",
+    [
+        ("not json", "Invalid JSON"),
+        ('{"event": "test1"}', "Expected a list of events"),
+        ("[]", "No events in the batch"),
+        (json.dumps([{}] * (BATCH_MAX_SIZE + 1)), "Too many events"),
+    ],
+    ids=["not-json", "not-a-list", "empty", "too-big"],
+)
+@pytest.mark.django_db
+def test_internal_wh_batch_endpoint_rejects_invalid_batches(client, body, message):
+    response = client.post(
+        "/webhook/internal/batch/",
+        body,
+        content_type="application/json",
+        HTTP_AUTHORIZATION=settings.WEBHOOK_INTERNAL_TOKEN,
+    )
+
+    assert response.status_code == 400
+    assert response.json()["status"] == "bad"
+    assert response.json()["message"].startswith(message)
+    assert not Webhook.objects.exists()
+
+
+def test_parse_webhook_batch_keeps_the_original_error(rf):
+    request = rf.post("/", "not json", content_type="application/json")
+
+    with pytest.raises(ValueError, match="Invalid JSON") as e:
+        parse_webhook_batch(request)
+
+    assert isinstance(e.value.__cause__, json.JSONDecodeError)
+
+
+# Tasks are normally enqueued only after the transaction commits, which never
+# happens inside of a test.
+DATABASE_TASKS = {
+    "default": {
+        "BACKEND": "django_tasks.backends.database.DatabaseBackend",
+        "ENQUEUE_ON_COMMIT": False,
+    }
+}
+
+
+@override_settings(TASKS=DATABASE_TASKS)
+@pytest.mark.django_db
+def test_internal_wh_batch_endpoint_enqueues_tasks_in_batches(client):
+    events = [{"event": f"test{i}"} for i in range(250)]
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post(
+            "/webhook/internal/batch/",
+            json.dumps(events),
+            content_type="application/json",
+            HTTP_AUTHORIZATION=settings.WEBHOOK_INTERNAL_TOKEN,
+        )
+
+    assert response.status_code == 200
+    tasks = list(DBTaskResult.objects.all())
+    assert [len(task.args_kwargs["args"][0]) for task in tasks] == [100, 100, 50]
+    # One INSERT for the webhooks, plus one per task
+    assert len(queries) == 1 + 3
+
+
+@pytest.mark.slow
+@override_settings(TASKS=DATABASE_TASKS)
+@pytest.mark.django_db
+def test_benchmark_internal_wh_batch_endpoint(client):
+    """
+    Ingesting the same events one by one (the old way), and all at once
+    through the batch endpoint, with the database task backend like in prod.
+    """
+    events = [{"event": f"test{i}"} for i in range(500)]
+    headers = {"HTTP_AUTHORIZATION": settings.WEBHOOK_INTERNAL_TOKEN}
+
+    with CaptureQueriesContext(connection) as single_queries:
+        start = time.monotonic()
+        for event in events:
+            client.post(
+                "/webhook/internal/",
+                json.dumps(event),
+                content_type="application/json",
+                **headers,
+            )
+        single = time.monotonic() - start
+
+    with CaptureQueriesContext(connection) as batch_queries:
+        start = time.monotonic()
+        client.post(
+            "/webhook/internal/batch/",
+            json.dumps(events),
+            content_type="application/json",
+            **headers,
+        )
+        batch = time.monotonic() - start
+
+    print(
+        f"\nsingle: {len(events) / single:.0f} events/s, "
+        f"{len(single_queries)} queries"
+        f"\nbatch:  {len(events) / batch:.0f} events/s, "
+        f"{len(batch_queries)} queries"
+    )
+    assert Webhook.objects.count() == 2 * len(events)
+    assert len(batch_queries) < len(single_queries) / 10
+    assert batch < single
+
+
 @pytest.mark.django_db
 def test_github_webhook_endpoint_checks_authorization_token(client):
     webhook_body = {}
@@ -143,6 +313,83 @@ def test_github_webhook_endpoint_works_with_correct_token(client):
     assert wh.source == "github"
 
 
+@pytest.mark.django_db
+def test_github_webhook_endpoint_acknowledges_redeliveries(
+    client, django_assert_num_queries
+):
+    webhook_body = {"event": "test1"}
+    headers = {
+        "X-Hub-Signature-256": sign_github_webhook(webhook_body),
+        "X-Github-Delivery": "72d3162e-cc78-11e3-81ab-4c9367dc0958",
+    }
+
+    first = client.post(
+        "/webhook/github/",
+        json.dumps(webhook_body),
+        content_type="application/json",
+        headers=headers,
+    )
+    with django_assert_num_queries(0):
+        second = client.post(
+            "/webhook/github/",
+            json.dumps(webhook_body),
+            content_type="application/json",
+            headers=headers,
+        )
+
+    wh = Webhook.objects.get()
+    assert wh.dedup_key == "github:72d3162e-cc78-11e3-81ab-4c9367dc0958"
+    assert first.json() == {"status": "created", "guid": str(wh.uuid)}
+    assert second.json() == {"status": "duplicate", "guid": str(wh.uuid)}
+
+
+@pytest.mark.django_db
+def test_github_webhook_endpoint_dedups_via_database_if_not_cached(client):
+    webhook_body = {"event": "test1"}
+    headers = {
+        "X-Hub-Signature-256": sign_github_webhook(webhook_body),
+        "X-Github-Delivery": "72d3162e-cc78-11e3-81ab-4c9367dc0958",
+    }
+
+    first = client.post(
+        "/webhook/github/",
+        json.dumps(webhook_body),
+        content_type="application/json",
+        headers=headers,
+    )
+    # For example, after a restart or from another process
+    recent_webhooks.clear()
+    second = client.post(
+        "/webhook/github/",
+        json.dumps(webhook_body),
+        content_type="application/json",
+        headers=headers,
+    )
+
+    assert Webhook.objects.count() == 1
+    assert second.json()["status"] == "duplicate"
+    assert second.json()["guid"] == first.json()["guid"]
+
+
+@pytest.mark.django_db
+def test_github_webhook_endpoint_treats_different_deliveries_as_different(client):
+    webhook_body = {"event": "test1"}
+
+    for delivery in ["delivery-1", "delivery-2"]:
+        response = client.post(
+            "/webhook/github/",
+            json.dumps(webhook_body),
+            content_type="application/json",
+            headers={
+                "X-Hub-Signature-256": sign_github_webhook(webhook_body),
+                "X-Github-Delivery": delivery,
+            },
+        )
+        assert response.json()["status"] == "created"
+
+    assert Webhook.objects.count() == 2
+
+
 def sign_zammad_webhook(webhook_body):
     hashed = hmac.new(
         settings.ZAMMAD_WEBHOOK_SECRET_TOKEN.encode("utf-8"),
@@ -216,3 +463,37 @@ def test_zammad_webhook_endpoint_works_with_correct_token(client):
 def test_zammad_webhook_endpoint_fails_if_request_not_post(client):
     response = client.get("/webhook/zammad/")
     assert response.status_code == 405
+
+
+@pytest.mark.django_db
+def test_zammad_webhook_endpoint_acknowledges_duplicated_payloads(client):
+    webhook_body = {"event": "test1"}
+    signature = sign_zammad_webhook(webhook_body)
+
+    responses = [
+        client.post(
+            "/webhook/zammad/",
+            json.dumps(webhook_body),
+            content_type="application/json",
+            headers={"X-Hub-Signature": signature},
+        )
+        for _ in range(2)
+    ]
+
+    wh = Webhook.objects.get()
+    assert wh.dedup_key.startswith("zammad:sha256:")
+    assert [r.json()["status"] for r in responses] == ["created", "duplicate"]
+    assert {r.json()["guid"] for r in responses} == {str(wh.uuid)}
+
+
+def test_recent_webhooks_evicts_least_recently_used_keys():
+    recent = RecentWebhooks(maxsize=2)
+
+    recent.add("a", "uuid-a")
+    recent.add("b", "uuid-b")
+    assert recent.get("a") == "uuid-a"
+    recent.add("c", "uuid-c")
+
+    assert recent.get("a") == "uuid-a"
+    assert recent.get("b") is None
+    assert recent.get("c") == "uuid-c"